@@ -0,0 +1,465 @@
+"""
+Load test for the web portal routes and the bot's handlers.
+
+    python benchmarks/bench.py                           # seed db/benchmark.db if needed, run everything
+    python benchmarks/bench.py --users 50000 --reseed    # rebuild the database with other volumes
+    python benchmarks/bench.py --only web --requests 500
+    python benchmarks/bench.py --save before             # store the results as benchmarks/baselines/before.json
+    python benchmarks/bench.py --compare before          # show the change against that baseline
+
+The database is filled with synthetic jobs, users and applications (same
+random seed, same data). Portal routes are requested through Flask's test
+client with a logged-in session. Bot scenarios replay real telegram.Update
+objects through the bot's own handlers; Bot API calls are answered locally by
+StubTelegramRequest, so the numbers measure our code and the database only.
+The bot scenarios add applications and profiles, so use --reseed before runs
+that are meant to be compared exactly.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+
+PROJECT_ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+BASELINE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baselines')
+
+FIRST_NAMES = ['Ayesha', 'Rahim', 'Karim', 'Nusrat', 'Tanvir', 'Farhana', 'Imran', 'Sadia', 'Rafi', 'Mitu',
+               'John', 'Maria', 'Chen', 'Priya', 'Omar', 'Elena']
+LAST_NAMES = ['Hossain', 'Rahman', 'Ahmed', 'Islam', 'Chowdhury', 'Khan', 'Smith', 'Garcia', 'Wang', 'Patel']
+SKILLS = ['Python', 'JavaScript', 'React', 'SQL', 'Excel', 'Figma', 'Django', 'Flask', 'AWS', 'Docker',
+          'Marketing', 'SEO', 'Sales', 'Accounting', 'Java', 'Kotlin', 'Go', 'Testing', 'Linux', 'Networking']
+TITLES = ['Software Developer', 'Data Analyst', 'Marketing Manager', 'UI/UX Designer', 'Backend Engineer',
+          'Frontend Engineer', 'DevOps Engineer', 'Sales Executive', 'Accountant', 'QA Engineer', 'Product Manager']
+LOCATIONS = ['Remote', 'Dhaka', 'Chittagong', 'New York', 'California', 'London', 'Berlin']
+STATUSES = ['pending', 'pending', 'pending', 'accepted', 'rejected', 'interviewed']
+
+# Portal routes: (scenario name, URL)
+WEB_SCENARIOS = [
+    ('web_dashboard', '/dashboard'),
+    ('web_jobs', '/jobs'),
+    ('web_jobs_search', '/jobs?search=python'),
+    ('web_job_shortlist', '/jobs/1/shortlist'),
+    ('web_applications', '/applications'),
+    ('web_applications_pending', '/applications?status=pending'),
+    ('web_applications_search', '/applications?search=rahman'),
+    ('web_users', '/users'),
+    ('web_users_search', '/users?search=python'),
+    ('web_api_stats', '/api/stats'),
+]
+
+BOT_USER = {'id': 123456, 'is_bot': True, 'first_name': 'Jobs Bot', 'username': 'jobs_bench_bot'}
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="RecruitFlow benchmarks")
+    parser.add_argument('--db', default=os.path.join(PROJECT_ROOT, 'db', 'benchmark.db'),
+                        help="database to seed and benchmark against (default: db/benchmark.db)")
+    parser.add_argument('--reseed', action='store_true', help="delete the database and seed it again")
+    parser.add_argument('--jobs', type=int, default=200, help="synthetic jobs to seed")
+    parser.add_argument('--users', type=int, default=10000, help="synthetic users to seed")
+    parser.add_argument('--applications', type=int, default=50000, help="synthetic applications to seed")
+    parser.add_argument('--seed', type=int, default=42, help="random seed for the synthetic data and requests")
+    parser.add_argument('--only', choices=['web', 'bot'], help="run only the portal or only the bot scenarios")
+    parser.add_argument('--requests', type=int, default=200, help="requests per portal scenario")
+    parser.add_argument('--updates', type=int, default=500, help="updates per bot scenario")
+    parser.add_argument('--concurrency', type=int, default=1,
+                        help="portal client threads / bot updates in flight at the same time")
+    parser.add_argument('--save', metavar='NAME', help="save the results as benchmarks/baselines/NAME.json")
+    parser.add_argument('--compare', metavar='NAME', help="compare the results with a saved baseline")
+    return parser.parse_args()
+
+
+# Synthetic data
+
+def reset_database(db_path):
+    """Deletes the benchmark database together with its WAL files."""
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(db_path + suffix):
+            os.remove(db_path + suffix)
+
+
+def seed_database(pool, jobs, users, applications, rng):
+    """Fills an empty database with synthetic jobs, users and applications."""
+    from shared.public_ids import encode_application_id
+
+    now = datetime.now()
+
+    def timestamp(max_days):
+        return (now - timedelta(seconds=rng.randint(0, max_days * 86400))).strftime('%Y-%m-%d %H:%M:%S')
+
+    job_rows = []
+    for _ in range(jobs):
+        title = rng.choice(TITLES)
+        job_rows.append((title, f"{title} position at a growing company", ', '.join(rng.sample(SKILLS, 3)),
+                         rng.choice(LOCATIONS), f"${rng.randint(30, 90)},000", int(rng.random() < 0.8),
+                         timestamp(365)))
+    user_rows = []
+    for user_id in range(1, users + 1):
+        name = f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}"
+        user_rows.append((user_id, f"user{user_id}", name, f"user{user_id}@example.com", f"+8801{user_id:09d}",
+                          f"{rng.randint(0, 15)} years", ', '.join(rng.sample(SKILLS, 4)),
+                          f"Experienced professional, {name}", None, timestamp(365)))
+    pairs = set()
+    applications = min(applications, jobs * users)
+    while len(pairs) < applications:
+        pairs.add((rng.randint(1, users), rng.randint(1, jobs)))
+    application_rows = [(i, encode_application_id(i), user_id, job_id, rng.choice(STATUSES), timestamp(180))
+                        for i, (user_id, job_id) in enumerate(sorted(pairs, key=lambda pair: rng.random()), 1)]
+
+    with pool.connection() as conn:
+        conn.executemany('''
+            INSERT INTO jobs (title, description, requirements, location, salary, is_active, created_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', job_rows)
+        conn.executemany('''
+            INSERT INTO users (user_id, username, full_name, email, phone, experience, skills, resume_text,
+                               resume_file_id, created_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', user_rows)
+        conn.executemany('''
+            INSERT INTO applications (id, public_application_id, user_id, job_id, status, applied_at)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', application_rows)
+    with pool.connection() as conn:
+        conn.execute('ANALYZE')
+
+
+def table_counts(pool):
+    """Row counts of the seeded tables, stored with the results."""
+    with pool.connection() as conn:
+        return {table: conn.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]
+                for table in ('jobs', 'users', 'applications')}
+
+
+# Measurements
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def summarize(latencies, elapsed, errors):
+    """p50/p95/p99 (milliseconds) and throughput of one scenario."""
+    latencies = sorted(latencies)
+    return {
+        'count': len(latencies),
+        'errors': errors,
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 3),
+        'p95_ms': round(percentile(latencies, 0.95) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 3),
+        'max_ms': round(latencies[-1] * 1000, 3) if latencies else 0.0,
+        'throughput': round(len(latencies) / elapsed, 1) if elapsed else 0.0,  # per second
+    }
+
+
+# Portal
+
+def run_web(args):
+    """Requests each portal scenario through Flask's test client and returns the summaries."""
+    sys.path.insert(0, os.path.join(PROJECT_ROOT, 'web'))
+    import app as portal
+
+    portal.app.config['TESTING'] = True
+    results = {}
+    for name, url in WEB_SCENARIOS:
+        latencies, errors = [], Counter()
+        lock = threading.Lock()
+        per_thread = [args.requests // args.concurrency + (i < args.requests % args.concurrency)
+                      for i in range(args.concurrency)]
+
+        def worker(count):
+            client = portal.app.test_client()
+            with client.session_transaction() as session:
+                session['logged_in'] = True
+                session['admin_id'] = 1
+                session['username'] = 'benchmark'
+            client.get(url)  # warm-up
+            for _ in range(count):
+                started = time.perf_counter()
+                response = client.get(url)
+                latency = time.perf_counter() - started
+                with lock:
+                    latencies.append(latency)
+                    if response.status_code != 200:
+                        errors[response.status_code] += 1
+
+        threads = [threading.Thread(target=worker, args=(count,)) for count in per_thread if count]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        results[name] = summarize(latencies, time.perf_counter() - started, sum(errors.values()))
+        print_result(name, results[name])
+    return results
+
+
+# Bot
+
+def make_stub_request_class():
+    """Builds StubTelegramRequest (telegram is only imported when the bot scenarios run)."""
+    from telegram.request import BaseRequest
+
+    class StubTelegramRequest(BaseRequest):
+        """Answers every Bot API call locally and immediately, counting the calls per method."""
+
+        def __init__(self):
+            self.calls = Counter()
+            self._message_id = 0
+
+        async def initialize(self):
+            pass
+
+        async def shutdown(self):
+            pass
+
+        @property
+        def read_timeout(self):
+            return None
+
+        async def do_request(self, url, method, request_data=None, read_timeout=None, write_timeout=None,
+                             connect_timeout=None, pool_timeout=None):
+            api_method = url.rsplit('/', 1)[-1]
+            self.calls[api_method] += 1
+            params = request_data.parameters if request_data else {}
+            if api_method == 'getMe':
+                result = BOT_USER
+            elif api_method in ('sendMessage', 'editMessageText', 'sendDocument'):
+                self._message_id += 1
+                chat_id = int(params.get('chat_id', 0))
+                result = {'message_id': self._message_id, 'date': int(time.time()), 'from': BOT_USER,
+                          'chat': {'id': chat_id, 'type': 'private'}, 'text': params.get('text', '')}
+            else:
+                result = True
+            return 200, json.dumps({'ok': True, 'result': result}).encode()
+
+    return StubTelegramRequest
+
+
+class UpdateFactory:
+    """Builds raw update dicts the way Telegram would send them to the bot."""
+
+    def __init__(self):
+        self.update_id = 0
+
+    def _next_id(self):
+        self.update_id += 1
+        return self.update_id
+
+    def message(self, user_id, text):
+        update = {
+            'update_id': self._next_id(),
+            'message': {
+                'message_id': self.update_id,
+                'date': int(time.time()),
+                'chat': {'id': user_id, 'type': 'private'},
+                'from': {'id': user_id, 'is_bot': False, 'first_name': 'Bench', 'username': f'user{user_id}'},
+                'text': text,
+            },
+        }
+        if text.startswith('/'):
+            update['message']['entities'] = [{'type': 'bot_command', 'offset': 0, 'length': len(text.split()[0])}]
+        return update
+
+    def callback(self, user_id, data):
+        return {
+            'update_id': self._next_id(),
+            'callback_query': {
+                'id': str(self.update_id),
+                'chat_instance': str(user_id),
+                'from': {'id': user_id, 'is_bot': False, 'first_name': 'Bench', 'username': f'user{user_id}'},
+                'data': data,
+                'message': {'message_id': 1, 'date': int(time.time()), 'chat': {'id': user_id, 'type': 'private'},
+                            'from': BOT_USER, 'text': 'menu'},
+            },
+        }
+
+
+def bot_scenarios(args, counts, factory, rng):
+    """(scenario name, list of update sequences); each sequence is replayed in order for one user."""
+    users, jobs = max(1, counts['users']), max(1, counts['jobs'])
+    n = args.updates
+    new_user = users + 1_000_000  # ids no seeded user has, for the profile conversation
+    profile_steps = ["📝 Create/Update Profile", "Bench User", "bench@example.com", "+8801000000000",
+                     "3 years", "Python, SQL", "Resume text"]
+    return [
+        ('bot_start', [[factory.message(rng.randint(1, users), '/start')] for _ in range(n)]),
+        ('bot_view_jobs', [[factory.message(rng.randint(1, users), "💼 View Jobs")] for _ in range(n)]),
+        ('bot_job_details', [[factory.callback(rng.randint(1, users), f'job_{rng.randint(1, jobs)}')]
+                             for _ in range(n)]),
+        ('bot_job_pages', [[factory.callback(rng.randint(1, users), f'jp:{rng.randint(0, jobs // 8)}')]
+                           for _ in range(n)]),
+        ('bot_apply', [[factory.callback(rng.randint(1, users), f'apply_{rng.randint(1, jobs)}')]
+                       for _ in range(n)]),
+        ('bot_my_applications', [[factory.message(rng.randint(1, users), "📋 My Applications")]
+                                 for _ in range(n)]),
+        # One update per step, so count = n updates in n // 7 conversations
+        ('bot_profile_conversation', [[factory.message(new_user + i, text) for text in profile_steps]
+                                      for i in range(max(1, n // len(profile_steps)))]),
+    ]
+
+
+async def replay(application, sequences, concurrency):
+    """Feeds update sequences through the application's update processor; returns latencies and errors."""
+    from telegram import Update
+
+    latencies, errors = [], 0
+    pending = asyncio.Queue()
+    for sequence in sequences:
+        pending.put_nowait(sequence)
+
+    async def count_error(update, context):
+        # process_update() catches handler exceptions and passes them to the error handlers instead of raising
+        nonlocal errors
+        errors += 1
+
+    async def worker():
+        while not pending.empty():
+            sequence = pending.get_nowait()
+            for data in sequence:
+                update = Update.de_json(data, application.bot)
+                started = time.perf_counter()
+                await application.update_processor.process_update(update, application.process_update(update))
+                latencies.append(time.perf_counter() - started)
+
+    application.add_error_handler(count_error)
+    try:
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+    finally:
+        application.remove_error_handler(count_error)
+    return latencies, errors
+
+
+async def run_bot_async(args, counts):
+    """Replays each bot scenario and returns the summaries."""
+    from telegram.ext import Application
+
+    sys.path.insert(0, os.path.join(PROJECT_ROOT, 'tg_bot'))
+    import bot
+    from persistence import SQLitePersistence
+    from update_processor import PerUserUpdateProcessor
+
+    request = make_stub_request_class()()
+    persistence = SQLitePersistence(bot.jobs_bot.pool, bot.jobs_bot.executor)
+    application = (Application.builder().token('123456:BENCHMARK').request(request).get_updates_request(request)
+                   .persistence(persistence).concurrent_updates(PerUserUpdateProcessor(max(1, args.concurrency)))
+                   .build())
+    bot.add_handlers(application)
+
+    results = {}
+    rng = random.Random(args.seed)
+    await application.initialize()
+    try:
+        for name, sequences in bot_scenarios(args, counts, UpdateFactory(), rng):
+            started = time.perf_counter()
+            latencies, errors = await replay(application, sequences, max(1, args.concurrency))
+            results[name] = summarize(latencies, time.perf_counter() - started, errors)
+            print_result(name, results[name])
+    finally:
+        await application.shutdown()
+    print(f"Bot API calls answered by the stub: {dict(request.calls)}")
+    print(f"Write queue: {bot.jobs_bot.writes.stats()}")
+    bot.jobs_bot.close()
+    return results
+
+
+# Reporting
+
+def print_result(name, result):
+    errors = f"  errors {result['errors']}" if result['errors'] else ''
+    print(f"{name:<28} n={result['count']:<6} p50 {result['p50_ms']:>8.2f} ms  p95 {result['p95_ms']:>8.2f} ms  "
+          f"p99 {result['p99_ms']:>8.2f} ms  {result['throughput']:>8.1f}/s{errors}")
+
+
+def baseline_path(name):
+    return os.path.join(BASELINE_DIR, f'{name}.json')
+
+
+def save_baseline(name, report):
+    os.makedirs(BASELINE_DIR, exist_ok=True)
+    with open(baseline_path(name), 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Saved baseline to {baseline_path(name)}")
+
+
+def compare_baseline(name, report):
+    """Prints each scenario's change against a saved baseline (negative latency change = faster)."""
+    with open(baseline_path(name)) as f:
+        baseline = json.load(f)
+    if baseline['counts'] != report['counts']:
+        print(f"Warning: baseline '{name}' was measured on {baseline['counts']}, this run on {report['counts']}.")
+
+    def change(new, old):
+        return f"{(new - old) / old * 100:+7.1f}%" if old else '    n/a'
+
+    print(f"\nChange against baseline '{name}' ({baseline['created_at']}):")
+    for scenario, result in report['results'].items():
+        old = baseline['results'].get(scenario)
+        if old is None:
+            print(f"{scenario:<28} (not in baseline)")
+            continue
+        print(f"{scenario:<28} p50 {change(result['p50_ms'], old['p50_ms'])}  p95 {change(result['p95_ms'], old['p95_ms'])}"
+              f"  p99 {change(result['p99_ms'], old['p99_ms'])}  throughput {change(result['throughput'], old['throughput'])}")
+
+
+def main():
+    args = parse_args()
+    args.concurrency = max(1, args.concurrency)
+    db_path = os.path.abspath(args.db)
+    if args.reseed:
+        reset_database(db_path)
+
+    # Pin the database before the portal/bot modules load env/.env and shared.database
+    os.environ['JOBS_BOT_DB_PATH'] = db_path
+    os.environ['OUTBOX_WORKER'] = 'False'
+    sys.path.insert(0, PROJECT_ROOT)
+    from shared.database import get_pool
+    from shared.migrations import migrate
+
+    pool = get_pool(db_path)
+    with pool.connection() as conn:
+        migrate(conn)
+    counts = table_counts(pool)
+    if not counts['jobs'] and not counts['users']:
+        print(f"Seeding {db_path}: {args.jobs} jobs, {args.users} users, {args.applications} applications...")
+        started = time.perf_counter()
+        seed_database(pool, args.jobs, args.users, args.applications, random.Random(args.seed))
+        counts = table_counts(pool)
+        print(f"Seeded in {time.perf_counter() - started:.1f}s")
+    else:
+        print(f"Using existing {db_path} ({counts}); pass --reseed to rebuild it")
+
+    # The portal and the bot configure logging on import; per-request log lines would dominate the timings
+    logging.disable(logging.WARNING)
+    results = {}
+    if args.only in (None, 'web'):
+        results.update(run_web(args))
+    if args.only in (None, 'bot'):
+        results.update(asyncio.run(run_bot_async(args, counts)))
+
+    report = {
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'counts': counts,
+        'concurrency': args.concurrency,
+        'results': results,
+    }
+    if args.save:
+        save_baseline(args.save, report)
+    if args.compare:
+        compare_baseline(args.compare, report)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1 @@
+"""Code shared by the Telegram bot (tg_bot/) and the Flask web portal (web/)."""
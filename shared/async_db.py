@@ -0,0 +1,79 @@
+"""
+Runs blocking database work off the asyncio event loop.
+
+The bot's handlers are coroutines, but sqlite3 is synchronous: calling it
+directly stalls every other user's update while one query waits on disk.
+DatabaseExecutor hands that work to a bounded thread pool and keeps queue
+depth counters so the worker count can be sized from real traffic.
+"""
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Worker threads for database calls; keep this at or below DB_POOL_SIZE
+DB_WORKERS = int(os.getenv('DB_WORKERS', '4'))
+
+
+class DatabaseExecutor:
+    """Bounded thread pool that turns blocking database calls into awaitables."""
+
+    def __init__(self, max_workers=DB_WORKERS, name='db'):
+        self.max_workers = max(1, max_workers)
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix=f'{name}-worker')
+        self._lock = threading.Lock()
+        self._metrics = {
+            'submitted': 0,
+            'completed': 0,
+            'failed': 0,
+            'queued': 0,  # waiting for a free worker right now
+            'running': 0,  # executing on a worker right now
+            'max_queue_depth': 0,
+            'queue_wait_seconds': 0.0,
+            'run_seconds': 0.0,
+        }
+
+    async def run(self, func, *args, **kwargs):
+        """Runs func(*args, **kwargs) on a worker thread and returns its result."""
+        enqueued = time.monotonic()
+        with self._lock:
+            self._metrics['submitted'] += 1
+            self._metrics['queued'] += 1
+            self._metrics['max_queue_depth'] = max(self._metrics['max_queue_depth'], self._metrics['queued'])
+
+        def call():
+            started = time.monotonic()
+            with self._lock:
+                self._metrics['queued'] -= 1
+                self._metrics['running'] += 1
+                self._metrics['queue_wait_seconds'] += started - enqueued
+            failed = False
+            try:
+                return func(*args, **kwargs)
+            except BaseException:
+                failed = True
+                raise
+            finally:
+                with self._lock:
+                    self._metrics['running'] -= 1
+                    self._metrics['failed' if failed else 'completed'] += 1
+                    self._metrics['run_seconds'] += time.monotonic() - started
+
+        return await asyncio.get_running_loop().run_in_executor(self._executor, call)
+
+    def queue_depth(self):
+        """Number of calls currently waiting for a worker."""
+        with self._lock:
+            return self._metrics['queued']
+
+    def stats(self):
+        """Returns a snapshot of the executor counters."""
+        with self._lock:
+            stats = dict(self._metrics)
+        stats['max_workers'] = self.max_workers
+        return stats
+
+    def shutdown(self, wait=True):
+        """Stops accepting work and optionally waits for queued calls to finish."""
+        self._executor.shutdown(wait=wait)
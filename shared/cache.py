@@ -0,0 +1,107 @@
+"""
+Small in-process caches shared by the bot and the portal.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from shared.database import connect
+
+_MISSING = object()
+
+
+class TTLCache:
+    """
+    Thread-safe key/value cache whose entries expire after `ttl` seconds.
+    With `maxsize` set, the least recently used entry is evicted when full.
+    """
+
+    def __init__(self, ttl, maxsize=None):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._data = OrderedDict()  # key -> (expires_at, value), oldest use first
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        """Returns the cached value for key, or default if it is missing or expired."""
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is not _MISSING:
+                expires_at, value = entry
+                if expires_at > time.monotonic():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+            self.misses += 1
+            return default
+
+    def set(self, key, value):
+        """Stores value under key, evicting the least recently used entry if the cache is full."""
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            if self.maxsize is not None:
+                while len(self._data) > self.maxsize:
+                    self._data.popitem(last=False)
+
+    def get_or_load(self, key, loader):
+        """Returns the cached value for key, calling loader() and caching its result on a miss."""
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            value = loader()
+            self.set(key, value)
+        return value
+
+    def invalidate(self, key):
+        """Drops a single entry."""
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        """Drops every entry."""
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._data)
+
+
+class DataVersionWatcher:
+    """
+    Cross-process change detection for one row of the data_versions table (migration 7).
+
+    Triggers bump the row whenever the watched table is written, by either
+    process. PRAGMA data_version on a dedicated connection only changes after
+    some other connection committed and is answered without reading any
+    database page, so the version row itself is only read after a commit.
+    """
+
+    def __init__(self, db_path, name):
+        self.name = name
+        self._conn = connect(db_path)  # data_version is per connection, so this one is never pooled
+        self._lock = threading.Lock()
+        self._data_version = None
+        self._version = None
+
+    def current(self, blocking=True):
+        """Returns the watched version, or None when blocking is False and another thread is checking it."""
+        if not self._lock.acquire(blocking):
+            return None
+        try:
+            data_version = self._conn.execute('PRAGMA data_version').fetchone()[0]
+            if data_version != self._data_version:
+                row = self._conn.execute('SELECT version FROM data_versions WHERE name = ?', (self.name,)).fetchone()
+                self._version = row[0] if row else 0
+                self._data_version = data_version
+            return self._version
+        finally:
+            self._lock.release()
+
+    def close(self):
+        """Closes the watcher's connection."""
+        with self._lock:
+            self._conn.close()
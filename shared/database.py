@@ -0,0 +1,238 @@
+"""
+Pooled SQLite access shared by the Telegram bot and the web portal.
+
+Both processes open the same db/jobs_bot.db file. Every connection handed out
+here is configured for WAL journaling (readers never block the writer and vice
+versa) and a busy timeout, so the bot and the portal stop failing with
+"database is locked" when they write at the same time.
+"""
+import os
+import random
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from shared.public_ids import encode_application_id
+
+# Project root is one level up from shared/
+PROJECT_ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+# The database lives in the 'db' directory at the project root unless overridden
+DB_PATH = os.getenv('JOBS_BOT_DB_PATH', os.path.join(PROJECT_ROOT, 'db', 'jobs_bot.db'))
+
+# Pool and PRAGMA tuning, all overridable from env/.env
+POOL_SIZE = int(os.getenv('DB_POOL_SIZE', '8'))  # max open connections per process
+POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', '10'))  # seconds to wait for a free connection
+BUSY_TIMEOUT_MS = int(os.getenv('DB_BUSY_TIMEOUT_MS', '5000'))  # how long SQLite itself waits on a lock
+CACHE_SIZE_KB = int(os.getenv('DB_CACHE_SIZE_KB', '16384'))  # page cache per connection
+MMAP_SIZE = int(os.getenv('DB_MMAP_SIZE', str(128 * 1024 * 1024)))  # bytes of the file to memory-map
+LOCK_RETRIES = int(os.getenv('DB_LOCK_RETRIES', '5'))  # retries of a whole unit of work after SQLITE_BUSY
+
+
+class PoolTimeoutError(RuntimeError):
+    """Raised when no pooled connection became free within the pool timeout."""
+
+
+def is_lock_error(error):
+    """Returns True if an OperationalError means the database was locked/busy."""
+    message = str(error).lower()
+    return 'locked' in message or 'busy' in message
+
+
+def connect(db_path=DB_PATH):
+    """Opens a new SQLite connection with the shared PRAGMA configuration."""
+    os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+    # Pooled connections move between threads, but only one thread uses a connection at a time
+    conn = sqlite3.connect(db_path, timeout=BUSY_TIMEOUT_MS / 1000, check_same_thread=False)
+    conn.row_factory = sqlite3.Row  # supports both row['col'] and tuple unpacking
+    conn.execute('PRAGMA journal_mode = WAL')
+    conn.execute(f'PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}')
+    conn.execute('PRAGMA synchronous = NORMAL')  # safe with WAL, fsyncs only at checkpoints
+    conn.execute(f'PRAGMA cache_size = -{CACHE_SIZE_KB}')  # negative value = size in KiB
+    conn.execute(f'PRAGMA mmap_size = {MMAP_SIZE}')
+    conn.execute('PRAGMA temp_store = MEMORY')
+    # Lets an INSERT derive the new application's public ID from its row id in the same statement
+    conn.create_function('public_application_id', 1, encode_application_id, deterministic=True)
+    return conn
+
+
+class PooledConnection:
+    """
+    Thin proxy around a pooled sqlite3 connection.
+    Behaves like the connection itself, except close() hands it back to the pool.
+    """
+
+    def __init__(self, pool, conn):
+        self._pool = pool
+        self._conn = conn
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    @property
+    def raw(self):
+        """The underlying sqlite3.Connection."""
+        return self._conn
+
+    def close(self):
+        """Returns the connection to the pool instead of closing it."""
+        if self._conn is not None:
+            self._pool.release(self)
+            self._conn = None
+
+
+class ConnectionPool:
+    """
+    Bounded pool of configured SQLite connections.
+
+    A thread that already holds a connection gets the same one back on nested
+    checkouts, so helpers can acquire freely without deadlocking the pool.
+    Checkouts are wrapped in `connection_class` (a PooledConnection subclass can
+    be set there to instrument every query, see web/profiling.py).
+    """
+
+    connection_class = PooledConnection
+
+    def __init__(self, db_path=DB_PATH, max_size=POOL_SIZE, timeout=POOL_TIMEOUT):
+        self.db_path = db_path
+        self.max_size = max(1, max_size)
+        self.timeout = timeout
+        self._idle = []
+        self._created = 0
+        self._cond = threading.Condition()
+        self._local = threading.local()
+        self._metrics = {
+            'checkouts': 0,
+            'nested_checkouts': 0,
+            'connections_created': 0,
+            'waits': 0,
+            'wait_seconds': 0.0,
+            'timeouts': 0,
+            'lock_retries': 0,
+        }
+
+    def acquire(self):
+        """Checks out a connection, waiting up to the pool timeout if all are busy."""
+        held = getattr(self._local, 'held', None)
+        if held is not None:
+            self._local.depth += 1
+            with self._cond:
+                self._metrics['nested_checkouts'] += 1
+            return self.connection_class(self, held)
+
+        with self._cond:
+            self._metrics['checkouts'] += 1
+            if not self._idle and self._created >= self.max_size:
+                self._metrics['waits'] += 1
+                started = time.monotonic()
+                available = self._cond.wait_for(lambda: self._idle, timeout=self.timeout)
+                self._metrics['wait_seconds'] += time.monotonic() - started
+                if not available:
+                    self._metrics['timeouts'] += 1
+                    raise PoolTimeoutError(
+                        f"No database connection became free within {self.timeout}s (pool size {self.max_size})")
+            if self._idle:
+                raw = self._idle.pop()
+            else:
+                raw = None
+                self._created += 1
+                self._metrics['connections_created'] += 1
+
+        if raw is None:
+            try:
+                raw = connect(self.db_path)
+            except Exception:
+                with self._cond:
+                    self._created -= 1
+                    self._cond.notify()
+                raise
+
+        self._local.held = raw
+        self._local.depth = 1
+        return self.connection_class(self, raw)
+
+    def release(self, conn):
+        """Returns a connection to the pool once its outermost checkout ends."""
+        raw = conn.raw
+        if getattr(self._local, 'held', None) is raw:
+            self._local.depth -= 1
+            if self._local.depth > 0:
+                return
+            self._local.held = None
+        if raw.in_transaction:
+            raw.rollback()  # never hand out a connection with someone else's open transaction
+        with self._cond:
+            self._idle.append(raw)
+            self._cond.notify()
+
+    def reclaim(self):
+        """Releases any connection the current thread forgot to close (e.g. after an exception)."""
+        held = getattr(self._local, 'held', None)
+        if held is not None:
+            self._local.depth = 1
+            PooledConnection(self, held).close()
+
+    @contextmanager
+    def connection(self):
+        """Context manager yielding a pooled connection; commits on success, rolls back on error."""
+        conn = self.acquire()
+        try:
+            yield conn
+            if self._local.depth == 1 and conn.in_transaction:
+                conn.commit()
+        except BaseException:
+            if self._local.depth == 1 and conn.in_transaction:
+                conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+    def run(self, func, *args, retries=LOCK_RETRIES, **kwargs):
+        """
+        Runs func(conn, *args, **kwargs) in one transaction, retrying the whole unit
+        of work with jittered backoff if SQLite still reports the database as locked.
+        """
+        attempt = 0
+        while True:
+            try:
+                with self.connection() as conn:
+                    return func(conn, *args, **kwargs)
+            except sqlite3.OperationalError as e:
+                if not is_lock_error(e) or attempt >= retries or getattr(self._local, 'held', None):
+                    raise
+                attempt += 1
+                with self._cond:
+                    self._metrics['lock_retries'] += 1
+                time.sleep(min(0.05 * 2 ** attempt, 1.0) * random.uniform(0.5, 1.0))
+
+    def stats(self):
+        """Returns a snapshot of pool usage counters for sizing the pool."""
+        with self._cond:
+            stats = dict(self._metrics)
+            stats['max_size'] = self.max_size
+            stats['open'] = self._created
+            stats['idle'] = len(self._idle)
+            stats['in_use'] = self._created - len(self._idle)
+        return stats
+
+    def close_all(self):
+        """Closes every idle connection (connections in use are closed when released)."""
+        with self._cond:
+            while self._idle:
+                self._idle.pop().close()
+                self._created -= 1
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(db_path=DB_PATH):
+    """Returns the process-wide pool for db_path, creating it on first use."""
+    key = os.path.abspath(db_path)
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = _pools[key] = ConnectionPool(db_path)
+        return pool
@@ -0,0 +1,135 @@
+"""
+Logging setup shared by the bot and the portal.
+
+Log records are put on an in-memory queue by the thread that logs them and
+written out by a QueueListener thread, so a slow disk or terminal never stalls
+the bot's event loop or a portal request. Messages are formatted on the
+listener thread too: log with %-style arguments (logger.info("User %s", uid))
+and the string is only built if the record is actually written.
+
+Configured from env/.env:
+    LOG_LEVEL          root level (default INFO)
+    LOG_LEVELS         per-logger levels, e.g. "httpx=WARNING,shared.write_queue=DEBUG"
+    LOG_FORMAT         'text' (default) or 'json' (one JSON object per line)
+    LOG_FILE           also write to this file
+    LOG_SAMPLE_RATE    fraction of high-volume events to keep (default 1 = all); only
+                       records logged with extra={'sampled': True} below WARNING are dropped
+"""
+import atexit
+import json
+import logging
+import os
+import queue
+import random
+import sys
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+# Attributes every LogRecord has; anything else was passed with extra= and goes into the JSON output
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime', 'sampled'}
+
+_listener = None
+
+
+class JSONFormatter(logging.Formatter):
+    """One JSON object per record: time, level, logger, process, message and any extra= fields."""
+
+    def __init__(self, process_name):
+        super().__init__()
+        self.process_name = process_name
+
+    def format(self, record):
+        entry = {
+            'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'process': self.process_name,
+            'message': record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES:
+                entry[key] = value
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class SamplingFilter(logging.Filter):
+    """Keeps only `rate` of the records marked sampled=True below WARNING."""
+
+    def __init__(self, rate):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING or not getattr(record, 'sampled', False):
+            return True
+        return random.random() < self.rate
+
+
+class DeferredQueueHandler(QueueHandler):
+    """
+    Enqueues records as they are. The stock QueueHandler formats the message
+    first (so records can be pickled to another process); this queue stays in
+    the process, so formatting is left to the listener thread.
+    """
+
+    def prepare(self, record):
+        return record
+
+
+def parse_levels(spec):
+    """'a=INFO,b.c=DEBUG' -> {'a': 'INFO', 'b.c': 'DEBUG'}."""
+    levels = {}
+    for item in (spec or '').split(','):
+        name, _, level = item.partition('=')
+        if name.strip() and level.strip():
+            levels[name.strip()] = level.strip().upper()
+    return levels
+
+
+def setup_logging(process_name):
+    """Routes all logging through a queue to stderr (and LOG_FILE); safe to call more than once."""
+    global _listener
+    if _listener is not None:
+        return
+
+    formatter = (JSONFormatter(process_name) if os.getenv('LOG_FORMAT', 'text').lower() == 'json'
+                 else logging.Formatter(TEXT_FORMAT))
+    handlers = [logging.StreamHandler(sys.stderr)]
+    log_file = os.getenv('LOG_FILE')
+    if log_file:
+        os.makedirs(os.path.dirname(os.path.abspath(log_file)), exist_ok=True)
+        handlers.append(logging.FileHandler(log_file, encoding='utf-8'))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = DeferredQueueHandler(log_queue)
+    sample_rate = float(os.getenv('LOG_SAMPLE_RATE', '1'))
+    if sample_rate < 1:
+        queue_handler.addFilter(SamplingFilter(sample_rate))
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(os.getenv('LOG_LEVEL', 'INFO').upper())
+    # httpx logs every Bot API request at INFO; keep it quiet unless asked for
+    logging.getLogger('httpx').setLevel(logging.WARNING)
+    for name, level in parse_levels(os.getenv('LOG_LEVELS')).items():
+        logging.getLogger(name).setLevel(level)
+
+    _listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    atexit.register(stop_logging)
+
+
+def stop_logging():
+    """Writes out the records still queued and stops the listener thread."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
@@ -0,0 +1,181 @@
+"""
+Candidate-job matching: ranks users by how well their skills and experience
+cover a job's requirements.
+
+Profiles are tokenized into terms (words, plus whole multi-word skills such as
+"machine learning") and kept as sparse vectors in an in-memory inverted index,
+term -> {user_id: weight}. Weighting is TF-IDF in the lnc.ltc scheme: profile
+vectors use log term frequency and cosine normalisation only, and the inverse
+document frequency is applied to the job side when a shortlist is asked for.
+A profile's vector therefore never depends on the rest of the corpus, so a
+changed profile is re-indexed on its own and the index never needs a rebuild.
+
+Ranking only touches the postings of the query's terms. MatchIndex (the
+portal's candidate shortlists) follows profile writes from either process
+through the 'users' data version and users.match_seq (migration 9); the bot
+keeps a TermIndex of the active jobs' requirements to rank its job feed.
+"""
+import heapq
+import logging
+import math
+import os
+import re
+import threading
+from collections import namedtuple
+from operator import itemgetter
+
+from shared.cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+MATCH_SHORTLIST_SIZE = int(os.getenv('MATCH_SHORTLIST_SIZE', '25'))  # candidates shown per job
+
+# Letters/digits, keeping the symbols that matter in skill names: c++, c#, node.js, asp.net
+_WORD_RE = re.compile(r'[a-z0-9][a-z0-9+#]*(?:\.[a-z0-9]+)*')
+# Skills and requirements are usually lists; each item may be a multi-word skill
+_ITEM_SEPARATORS = re.compile(r'[,;/|\n•]+')
+STOPWORDS = frozenset('''
+    a an and or the of in on to for with at by as is are be we you our your i my
+    experience experienced years year yrs knowledge skills skill strong good plus etc
+'''.split())
+
+Match = namedtuple('Match', 'id score terms')
+
+
+def term_counts(*texts):
+    """Term frequencies of the given texts: every word, plus each list item of two or three words as one term."""
+    counts = {}
+    for text in texts:
+        if not text:
+            continue
+        for item in _ITEM_SEPARATORS.split(text.lower()):
+            words = [word for word in _WORD_RE.findall(item) if word not in STOPWORDS]
+            if 1 < len(words) <= 3:
+                words.append(' '.join(words))
+            for word in words:
+                counts[word] = counts.get(word, 0) + 1
+    return counts
+
+
+def document_vector(counts):
+    """Unit-length log-frequency vector (the "lnc" side) of a profile's term counts."""
+    weights = {term: 1 + math.log(count) for term, count in counts.items()}
+    norm = math.sqrt(sum(weight * weight for weight in weights.values()))
+    return {term: weight / norm for term, weight in weights.items()} if norm else {}
+
+
+class TermIndex:
+    """
+    Sparse unit vectors in an inverted index, term -> {id: weight}. Not locked:
+    callers serialise writes, or build an index once and only read it.
+    """
+
+    def __init__(self):
+        self.postings = {}  # term -> {id: weight}
+        self.documents = {}  # id -> the terms the document is indexed under
+
+    def __len__(self):
+        return len(self.documents)
+
+    def index(self, doc_id, vector):
+        """Replaces a document's postings with those of `vector` (an empty vector removes it)."""
+        for term in self.documents.pop(doc_id, ()):
+            postings = self.postings[term]
+            del postings[doc_id]
+            if not postings:
+                del self.postings[term]
+        for term, weight in vector.items():
+            self.postings.setdefault(term, {})[doc_id] = weight
+        if vector:
+            self.documents[doc_id] = tuple(vector)
+
+    def query_vector(self, counts):
+        """Unit-length TF-IDF vector (the "ltc" side) of a query's term counts; terms no document has are dropped."""
+        total = len(self.documents)
+        weights = {}
+        for term, count in counts.items():
+            postings = self.postings.get(term)
+            if postings and len(postings) < total:
+                weights[term] = (1 + math.log(count)) * math.log(total / len(postings))
+        norm = math.sqrt(sum(weight * weight for weight in weights.values()))
+        return {term: weight / norm for term, weight in weights.items()} if norm else {}
+
+    def rank(self, counts, limit):
+        """The `limit` documents most similar to the term counts as Matches, best first."""
+        query = self.query_vector(counts)
+        # Seed the scores from the longest postings list; every other term only adds to them
+        terms = sorted(query, key=lambda term: len(self.postings[term]), reverse=True)
+        scores = {}
+        for term in terms:
+            weight = query[term]
+            if not scores:
+                scores = {doc_id: weight * w for doc_id, w in self.postings[term].items()}
+                continue
+            for doc_id, w in self.postings[term].items():
+                scores[doc_id] = scores.get(doc_id, 0.0) + weight * w
+        best = heapq.nlargest(limit, scores.items(), key=itemgetter(1))
+        by_weight = sorted(query, key=query.get, reverse=True)
+        return [Match(doc_id, score, [term for term in by_weight if term in self.documents[doc_id]])
+                for doc_id, score in best]
+
+
+class MatchIndex:
+    """Inverted index of user profiles, kept in step with the users table."""
+
+    def __init__(self, pool, watcher):
+        self.pool = pool
+        self.watcher = watcher  # DataVersionWatcher for 'users'
+        self.version = None  # 'users' data version the index reflects
+        self._index = TermIndex()
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        # Shortlists at the current version; the version is part of the key, so a profile write retires them
+        self._results = TTLCache(ttl=3600, maxsize=256)
+        self.refreshes = 0
+
+    def refresh(self):
+        """Indexes the profiles created or changed since the last refresh (all of them the first time)."""
+        version = self.watcher.current()
+        if version == self.version:
+            return
+        with self._refresh_lock:
+            if version == self.version:
+                return
+            since = -1 if self.version is None else self.version
+            version, rows = self.pool.run(self._load_changes, since)
+            with self._lock:
+                for user_id, skills, experience in rows:
+                    self._index.index(user_id, document_vector(term_counts(skills, experience)))
+            self.version = version
+            self.refreshes += 1
+            if since < 0:
+                logger.info("Built the matching index: %s profiles, %s terms", len(self._index),
+                            len(self._index.postings))
+
+    def _load_changes(self, conn, since):
+        """Reads the version and the profiles changed after `since` in one read transaction, so they always match."""
+        conn.execute('BEGIN')
+        row = conn.execute("SELECT version FROM data_versions WHERE name = 'users'").fetchone()
+        rows = conn.execute('SELECT user_id, skills, experience FROM users WHERE match_seq > ?', (since,)).fetchall()
+        conn.commit()
+        return row[0] if row else 0, rows
+
+    def shortlist(self, *texts, limit=MATCH_SHORTLIST_SIZE):
+        """The `limit` profiles most similar to the texts (a job's requirements) as Matches, best first."""
+        self.refresh()
+        return self._results.get_or_load((self.version, texts, limit), lambda: self._rank(texts, limit))
+
+    def _rank(self, texts, limit):
+        """Scores every profile sharing a term with the texts; only their postings are read."""
+        with self._lock:
+            return self._index.rank(term_counts(*texts), limit)
+
+    def stats(self):
+        """Index size and the data version it reflects."""
+        return {
+            'profiles': len(self._index),
+            'terms': len(self._index.postings),
+            'version': self.version,
+            'refreshes': self.refreshes,
+            'cached_shortlists': len(self._results),
+        }
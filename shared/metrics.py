@@ -0,0 +1,95 @@
+"""
+Latency histograms and the Prometheus text format, shared by the portal and the bot.
+
+Histograms use fixed buckets, so recording a value is a bisect and two
+additions; percentiles are estimated as the upper bound of the bucket they
+fall in.
+"""
+import bisect
+
+# Upper bounds (seconds) of the default buckets, from sub-millisecond SQL up to slow network calls
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0,
+                   float('inf'))
+
+
+class LatencyHistogram:
+    """Per-bucket counts of call durations, with percentile estimates."""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.errors = 0
+
+    def observe(self, seconds, error=False):
+        """Records one call that took `seconds`."""
+        self.counts[bisect.bisect_left(self.buckets, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+        if error:
+            self.errors += 1
+
+    def percentile(self, fraction):
+        """Upper bound of the bucket holding the given fraction of calls (None before any call)."""
+        if not self.count:
+            return None
+        target = fraction * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= target:
+                return bound
+        return self.buckets[-1]
+
+    def snapshot(self):
+        """JSON-serialisable summary of the histogram."""
+        return {
+            'count': self.count,
+            'errors': self.errors,
+            'avg_seconds': round(self.total / self.count, 4) if self.count else None,
+            'max_seconds': round(self.max, 4),
+            'p50': self.percentile(0.50),
+            'p95': self.percentile(0.95),
+            'p99': self.percentile(0.99),
+            'buckets': {('+Inf' if bound == float('inf') else str(bound)): count
+                        for bound, count in zip(self.buckets, self.counts)},
+        }
+
+
+def format_labels(labels):
+    """{'a': 'x'} -> '{a="x"}', escaped as the text format requires."""
+    if not labels:
+        return ''
+    pairs = []
+    for key, value in labels.items():
+        value = str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+        pairs.append(f'{key}="{value}"')
+    return '{' + ','.join(pairs) + '}'
+
+
+def metric_header(name, kind, help_text):
+    """The # HELP and # TYPE lines that precede a metric family."""
+    return [f'# HELP {name} {help_text}', f'# TYPE {name} {kind}']
+
+
+def metric_line(name, value, labels=None):
+    """One sample line."""
+    return f'{name}{format_labels(labels)} {value}'
+
+
+def histogram_lines(name, histogram, labels=None):
+    """Sample lines (_bucket, _sum, _count) of one LatencyHistogram."""
+    labels = labels or {}
+    lines = []
+    cumulative = 0
+    for bound, count in zip(histogram.buckets, histogram.counts):
+        cumulative += count
+        le = '+Inf' if bound == float('inf') else repr(bound)
+        lines.append(metric_line(f'{name}_bucket', cumulative, dict(labels, le=le)))
+    lines.append(metric_line(f'{name}_sum', round(histogram.total, 6), labels))
+    lines.append(metric_line(f'{name}_count', histogram.count, labels))
+    return lines
@@ -0,0 +1,445 @@
+"""
+Versioned schema migrations for db/jobs_bot.db.
+
+Each migration runs once, inside its own write transaction, and is recorded in
+the schema_migrations table. Both the bot and the portal call migrate() at
+startup; the BEGIN IMMEDIATE lock plus a re-check of the version means the two
+processes can start at the same time without applying a migration twice.
+
+To change the schema, append a new (version, description, steps) entry to
+MIGRATIONS. Never edit a migration that has already shipped.
+"""
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def _column_names(conn, table):
+    """Returns the column names of a table."""
+    return {row[1] for row in conn.execute(f'PRAGMA table_info({table})')}
+
+
+def _add_legacy_columns(conn):
+    """Adds columns introduced after the first release to databases created before them."""
+    if 'resume_file_id' not in _column_names(conn, 'users'):
+        conn.execute('ALTER TABLE users ADD COLUMN resume_file_id TEXT')
+    if 'public_application_id' not in _column_names(conn, 'applications'):
+        # ALTER TABLE cannot add a UNIQUE column, so enforce uniqueness with an index instead
+        conn.execute('ALTER TABLE applications ADD COLUMN public_application_id TEXT')
+        conn.execute('CREATE UNIQUE INDEX idx_applications_public_id ON applications (public_application_id)')
+
+
+def _remove_duplicate_applications(conn):
+    """Keeps the most advanced, then latest, application per (user_id, job_id) so the unique index can be built."""
+    duplicates = [row[0] for row in conn.execute('''
+        SELECT id FROM (
+            SELECT id, ROW_NUMBER() OVER (
+                PARTITION BY user_id, job_id
+                -- A recruiter's decision outranks an interview, which outranks a pending application
+                ORDER BY CASE status WHEN 'accepted' THEN 2 WHEN 'rejected' THEN 2 WHEN 'interviewed' THEN 1 ELSE 0 END DESC,
+                         id DESC
+            ) AS position
+            FROM applications
+        )
+        WHERE position > 1
+    ''')]
+    if duplicates:
+        conn.executemany('DELETE FROM applications WHERE id = ?', [(app_id,) for app_id in duplicates])
+        logger.warning("Removed %s duplicate application(s) before adding UNIQUE(user_id, job_id): ids %s",
+                       len(duplicates), duplicates)
+
+
+def _backfill_stats(conn):
+    """Seeds the summary tables from the current data; the triggers keep them current afterwards."""
+    conn.execute('''
+        INSERT INTO stats_counters (name, value)
+        SELECT 'total_jobs', COUNT(*) FROM jobs
+        UNION ALL SELECT 'active_jobs', COUNT(*) FROM jobs WHERE is_active = 1
+        UNION ALL SELECT 'total_users', COUNT(*) FROM users
+        UNION ALL SELECT 'total_applications', COUNT(*) FROM applications
+        UNION ALL SELECT 'pending_applications', COUNT(*) FROM applications WHERE status = 'pending'
+    ''')
+    conn.execute('''
+        INSERT INTO job_stats (job_id, application_count)
+        SELECT j.id, COUNT(a.id) FROM jobs j LEFT JOIN applications a ON a.job_id = j.id GROUP BY j.id
+    ''')
+
+
+MIGRATIONS = [
+    (1, 'initial schema', [
+        '''
+        CREATE TABLE IF NOT EXISTS users (
+            user_id INTEGER PRIMARY KEY,
+            username TEXT,
+            full_name TEXT,
+            email TEXT,
+            phone TEXT,
+            experience TEXT,
+            skills TEXT,
+            resume_text TEXT,
+            resume_file_id TEXT, -- Telegram file_id of an uploaded resume
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            title TEXT NOT NULL,
+            description TEXT,
+            requirements TEXT,
+            location TEXT,
+            salary TEXT,
+            is_active BOOLEAN DEFAULT 1,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS applications (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            public_application_id TEXT UNIQUE, -- user-friendly ID shown in the bot
+            user_id INTEGER,
+            job_id INTEGER,
+            status TEXT DEFAULT 'pending', -- 'pending', 'accepted', 'rejected', 'interviewed'
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users (user_id),
+            FOREIGN KEY (job_id) REFERENCES jobs (id)
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS admins (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username TEXT UNIQUE NOT NULL,
+            password_hash TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+    ]),
+    (2, 'add columns missing from pre-release databases', [
+        _add_legacy_columns,
+    ]),
+    (3, 'application/job/user indexes and UNIQUE(user_id, job_id)', [
+        _remove_duplicate_applications,
+        # One application per user and job; also serves the "already applied?" lookup
+        'CREATE UNIQUE INDEX IF NOT EXISTS idx_applications_user_job ON applications (user_id, job_id)',
+        # Bot "My Applications" and portal user page: filter by user, newest first
+        'CREATE INDEX IF NOT EXISTS idx_applications_user_applied ON applications (user_id, applied_at)',
+        # Portal applications list filtered by job, per-job counts, delete_job's check
+        'CREATE INDEX IF NOT EXISTS idx_applications_job_applied ON applications (job_id, applied_at)',
+        # Portal applications list filtered by status, pending counts
+        'CREATE INDEX IF NOT EXISTS idx_applications_status_applied ON applications (status, applied_at)',
+        # Dashboard recent applications and the unfiltered applications list
+        'CREATE INDEX IF NOT EXISTS idx_applications_applied ON applications (applied_at)',
+        # Bot active job list and portal jobs list
+        'CREATE INDEX IF NOT EXISTS idx_jobs_active_created ON jobs (is_active, created_at)',
+        # Portal users list, newest first
+        'CREATE INDEX IF NOT EXISTS idx_users_created ON users (created_at)',
+    ]),
+    (4, 'trigger-maintained dashboard counters', [
+        'CREATE TABLE stats_counters (name TEXT PRIMARY KEY, value INTEGER NOT NULL DEFAULT 0)',
+        'CREATE TABLE job_stats (job_id INTEGER PRIMARY KEY, application_count INTEGER NOT NULL DEFAULT 0)',
+        'CREATE INDEX idx_job_stats_count ON job_stats (application_count)',
+        _backfill_stats,
+        '''
+        CREATE TRIGGER trg_stats_jobs_insert AFTER INSERT ON jobs BEGIN
+            UPDATE stats_counters SET value = value + CASE name
+                WHEN 'total_jobs' THEN 1 ELSE (NEW.is_active = 1) END
+            WHERE name IN ('total_jobs', 'active_jobs');
+            INSERT OR IGNORE INTO job_stats (job_id, application_count) VALUES (NEW.id, 0);
+        END
+        ''',
+        '''
+        CREATE TRIGGER trg_stats_jobs_delete AFTER DELETE ON jobs BEGIN
+            UPDATE stats_counters SET value = value - CASE name
+                WHEN 'total_jobs' THEN 1 ELSE (OLD.is_active = 1) END
+            WHERE name IN ('total_jobs', 'active_jobs');
+            DELETE FROM job_stats WHERE job_id = OLD.id;
+        END
+        ''',
+        '''
+        CREATE TRIGGER trg_stats_jobs_active AFTER UPDATE OF is_active ON jobs BEGIN
+            UPDATE stats_counters SET value = value + (NEW.is_active = 1) - (OLD.is_active = 1)
+            WHERE name = 'active_jobs';
+        END
+        ''',
+        '''
+        CREATE TRIGGER trg_stats_users_insert AFTER INSERT ON users BEGIN
+            UPDATE stats_counters SET value = value + 1 WHERE name = 'total_users';
+        END
+        ''',
+        '''
+        CREATE TRIGGER trg_stats_users_delete AFTER DELETE ON users BEGIN
+            UPDATE stats_counters SET value = value - 1 WHERE name = 'total_users';
+        END
+        ''',
+        '''
+        CREATE TRIGGER trg_stats_applications_insert AFTER INSERT ON applications BEGIN
+            UPDATE stats_counters SET value = value + CASE name
+                WHEN 'total_applications' THEN 1 ELSE (NEW.status = 'pending') END
+            WHERE name IN ('total_applications', 'pending_applications');
+            INSERT INTO job_stats (job_id, application_count) VALUES (NEW.job_id, 1)
+                ON CONFLICT (job_id) DO UPDATE SET application_count = application_count + 1;
+        END
+        ''',
+        '''
+        CREATE TRIGGER trg_stats_applications_delete AFTER DELETE ON applications BEGIN
+            UPDATE stats_counters SET value = value - CASE name
+                WHEN 'total_applications' THEN 1 ELSE (OLD.status = 'pending') END
+            WHERE name IN ('total_applications', 'pending_applications');
+            UPDATE job_stats SET application_count = application_count - 1 WHERE job_id = OLD.job_id;
+        END
+        ''',
+        '''
+        CREATE TRIGGER trg_stats_applications_status AFTER UPDATE OF status ON applications
+        WHEN (OLD.status = 'pending') <> (NEW.status = 'pending') BEGIN
+            UPDATE stats_counters SET value = value + (NEW.status = 'pending') - (OLD.status = 'pending')
+            WHERE name = 'pending_applications';
+        END
+        ''',
+        '''
+        CREATE TRIGGER trg_stats_applications_job AFTER UPDATE OF job_id ON applications
+        WHEN OLD.job_id IS NOT NEW.job_id BEGIN
+            UPDATE job_stats SET application_count = application_count - 1 WHERE job_id = OLD.job_id;
+            INSERT INTO job_stats (job_id, application_count) VALUES (NEW.job_id, 1)
+                ON CONFLICT (job_id) DO UPDATE SET application_count = application_count + 1;
+        END
+        ''',
+    ]),
+    (5, 'FTS5 search indexes over jobs and users', [
+        # External-content tables: the text lives in jobs/users, FTS5 only stores the index.
+        # prefix='2 3' adds prefix indexes so "pyt*"-style searches don't scan the whole term list.
+        '''
+        CREATE VIRTUAL TABLE jobs_fts USING fts5(
+            title, description, requirements, location,
+            content='jobs', content_rowid='id', tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+        )
+        ''',
+        '''
+        CREATE VIRTUAL TABLE users_fts USING fts5(
+            full_name, email, username, skills, resume_text,
+            content='users', content_rowid='user_id', tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+        )
+        ''',
+        "INSERT INTO jobs_fts (jobs_fts) VALUES ('rebuild')",
+        "INSERT INTO users_fts (users_fts) VALUES ('rebuild')",
+        '''
+        CREATE TRIGGER trg_fts_jobs_insert AFTER INSERT ON jobs BEGIN
+            INSERT INTO jobs_fts (rowid, title, description, requirements, location)
+            VALUES (NEW.id, NEW.title, NEW.description, NEW.requirements, NEW.location);
+        END
+        ''',
+        '''
+        CREATE TRIGGER trg_fts_jobs_delete AFTER DELETE ON jobs BEGIN
+            INSERT INTO jobs_fts (jobs_fts, rowid, title, description, requirements, location)
+            VALUES ('delete', OLD.id, OLD.title, OLD.description, OLD.requirements, OLD.location);
+        END
+        ''',
+        '''
+        CREATE TRIGGER trg_fts_jobs_update AFTER UPDATE OF title, description, requirements, location ON jobs BEGIN
+            INSERT INTO jobs_fts (jobs_fts, rowid, title, description, requirements, location)
+            VALUES ('delete', OLD.id, OLD.title, OLD.description, OLD.requirements, OLD.location);
+            INSERT INTO jobs_fts (rowid, title, description, requirements, location)
+            VALUES (NEW.id, NEW.title, NEW.description, NEW.requirements, NEW.location);
+        END
+        ''',
+        '''
+        CREATE TRIGGER trg_fts_users_insert AFTER INSERT ON users BEGIN
+            INSERT INTO users_fts (rowid, full_name, email, username, skills, resume_text)
+            VALUES (NEW.user_id, NEW.full_name, NEW.email, NEW.username, NEW.skills, NEW.resume_text);
+        END
+        ''',
+        '''
+        CREATE TRIGGER trg_fts_users_delete AFTER DELETE ON users BEGIN
+            INSERT INTO users_fts (users_fts, rowid, full_name, email, username, skills, resume_text)
+            VALUES ('delete', OLD.user_id, OLD.full_name, OLD.email, OLD.username, OLD.skills, OLD.resume_text);
+        END
+        ''',
+        '''
+        CREATE TRIGGER trg_fts_users_update AFTER UPDATE OF full_name, email, username, skills, resume_text ON users
+        BEGIN
+            INSERT INTO users_fts (users_fts, rowid, full_name, email, username, skills, resume_text)
+            VALUES ('delete', OLD.user_id, OLD.full_name, OLD.email, OLD.username, OLD.skills, OLD.resume_text);
+            INSERT INTO users_fts (rowid, full_name, email, username, skills, resume_text)
+            VALUES (NEW.user_id, NEW.full_name, NEW.email, NEW.username, NEW.skills, NEW.resume_text);
+        END
+        ''',
+    ]),
+    (6, 'broadcasts and Telegram message outbox', [
+        '''
+        CREATE TABLE broadcasts (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            message_text TEXT NOT NULL,
+            audience TEXT, -- human-readable description of the recipient filter
+            total INTEGER NOT NULL DEFAULT 0,
+            sent INTEGER NOT NULL DEFAULT 0,
+            failed INTEGER NOT NULL DEFAULT 0,
+            created_by TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            started_at REAL, -- unix time of the first delivery attempt
+            finished_at REAL -- unix time the last message was sent or given up on
+        )
+        ''',
+        '''
+        CREATE TABLE outbox (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            broadcast_id INTEGER, -- NULL for one-off notifications
+            chat_id INTEGER NOT NULL,
+            message_text TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'queued', -- 'queued', 'sending', 'sent', 'failed'
+            attempts INTEGER NOT NULL DEFAULT 0,
+            next_attempt_at REAL NOT NULL DEFAULT 0, -- unix time the message is due (retry backoff)
+            claimed_at REAL, -- unix time a worker took the message for delivery
+            last_error TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            sent_at TIMESTAMP,
+            FOREIGN KEY (broadcast_id) REFERENCES broadcasts (id)
+        )
+        ''',
+        # The worker's "what is due next" query
+        'CREATE INDEX idx_outbox_due ON outbox (status, next_attempt_at)',
+        'CREATE INDEX idx_outbox_broadcast ON outbox (broadcast_id, status)',
+    ]),
+    (7, 'cross-process data version counters', [
+        # One counter per cached data set, bumped by triggers on every write from either process
+        '''
+        CREATE TABLE data_versions (
+            name TEXT PRIMARY KEY,
+            version INTEGER NOT NULL DEFAULT 0
+        ) WITHOUT ROWID
+        ''',
+        "INSERT INTO data_versions (name) VALUES ('jobs')",
+        '''
+        CREATE TRIGGER trg_version_jobs_insert AFTER INSERT ON jobs BEGIN
+            UPDATE data_versions SET version = version + 1 WHERE name = 'jobs';
+        END
+        ''',
+        '''
+        CREATE TRIGGER trg_version_jobs_update AFTER UPDATE ON jobs BEGIN
+            UPDATE data_versions SET version = version + 1 WHERE name = 'jobs';
+        END
+        ''',
+        '''
+        CREATE TRIGGER trg_version_jobs_delete AFTER DELETE ON jobs BEGIN
+            UPDATE data_versions SET version = version + 1 WHERE name = 'jobs';
+        END
+        ''',
+    ]),
+    (8, 'bot conversation persistence', [
+        # context.user_data of each Telegram user, as JSON
+        '''
+        CREATE TABLE bot_user_data (
+            user_id INTEGER PRIMARY KEY,
+            data TEXT NOT NULL,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+        # ConversationHandler states; key is the JSON conversation key, user_id its user (for sharding)
+        '''
+        CREATE TABLE bot_conversations (
+            name TEXT NOT NULL,
+            key TEXT NOT NULL,
+            user_id INTEGER,
+            state TEXT NOT NULL,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (name, key)
+        ) WITHOUT ROWID
+        ''',
+    ]),
+    (9, 'profile change feed for the matching index', [
+        # match_seq is the 'users' data version of a user's last skills/experience change, so the
+        # matching index (shared/matching.py) can read just the profiles changed since it last looked
+        'ALTER TABLE users ADD COLUMN match_seq INTEGER NOT NULL DEFAULT 0',
+        'CREATE INDEX idx_users_match_seq ON users (match_seq)',
+        "INSERT INTO data_versions (name) VALUES ('users')",
+        '''
+        CREATE TRIGGER trg_version_users_insert AFTER INSERT ON users BEGIN
+            UPDATE data_versions SET version = version + 1 WHERE name = 'users';
+            UPDATE users SET match_seq = (SELECT version FROM data_versions WHERE name = 'users')
+            WHERE user_id = NEW.user_id;
+        END
+        ''',
+        # match_seq is not in the column list, so the inner UPDATE does not fire this trigger again
+        '''
+        CREATE TRIGGER trg_version_users_update AFTER UPDATE OF skills, experience ON users BEGIN
+            UPDATE data_versions SET version = version + 1 WHERE name = 'users';
+            UPDATE users SET match_seq = (SELECT version FROM data_versions WHERE name = 'users')
+            WHERE user_id = NEW.user_id;
+        END
+        ''',
+    ]),
+    (10, 'per-user application versions', [
+        # The 'applications' version changes on every application write; application_versions holds the
+        # version of each user's last change, so the bot can tell whose cached history is stale
+        "INSERT INTO data_versions (name) VALUES ('applications')",
+        '''
+        CREATE TABLE application_versions (
+            user_id INTEGER PRIMARY KEY,
+            version INTEGER NOT NULL DEFAULT 0
+        )
+        ''',
+        '''
+        CREATE TRIGGER trg_version_applications_insert AFTER INSERT ON applications BEGIN
+            UPDATE data_versions SET version = version + 1 WHERE name = 'applications';
+            INSERT INTO application_versions (user_id, version)
+            SELECT NEW.user_id, version FROM data_versions WHERE name = 'applications'
+            ON CONFLICT (user_id) DO UPDATE SET version = excluded.version;
+        END
+        ''',
+        '''
+        CREATE TRIGGER trg_version_applications_update AFTER UPDATE OF status, job_id ON applications BEGIN
+            UPDATE data_versions SET version = version + 1 WHERE name = 'applications';
+            INSERT INTO application_versions (user_id, version)
+            SELECT NEW.user_id, version FROM data_versions WHERE name = 'applications'
+            ON CONFLICT (user_id) DO UPDATE SET version = excluded.version;
+        END
+        ''',
+        '''
+        CREATE TRIGGER trg_version_applications_delete AFTER DELETE ON applications BEGIN
+            UPDATE data_versions SET version = version + 1 WHERE name = 'applications';
+            INSERT INTO application_versions (user_id, version)
+            SELECT OLD.user_id, version FROM data_versions WHERE name = 'applications'
+            ON CONFLICT (user_id) DO UPDATE SET version = excluded.version;
+        END
+        ''',
+    ]),
+]
+
+
+def applied_versions(conn):
+    """Returns the set of migration versions already applied to the database."""
+    return {row[0] for row in conn.execute('SELECT version FROM schema_migrations')}
+
+
+def migrate(conn):
+    """Applies every pending migration in order. Safe to call from both processes at startup."""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INTEGER PRIMARY KEY,
+            description TEXT NOT NULL,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    conn.commit()
+
+    done = applied_versions(conn)
+    for version, description, steps in MIGRATIONS:
+        if version in done:
+            continue
+        # Take the write lock up front, then re-check: another process may have just applied it
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            if conn.execute('SELECT 1 FROM schema_migrations WHERE version = ?', (version,)).fetchone():
+                conn.rollback()
+                continue
+            for step in steps:
+                if callable(step):
+                    step(conn)
+                else:
+                    conn.execute(step)
+            conn.execute('INSERT INTO schema_migrations (version, description) VALUES (?, ?)',
+                         (version, description))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        logger.info("Applied database migration %s: %s", version, description)
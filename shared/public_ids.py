@@ -0,0 +1,35 @@
+"""
+Compact public application IDs, derived from the application's row id.
+
+The row id goes through a fixed 40-bit Feistel permutation (so consecutive
+applications don't get consecutive-looking IDs) and is written as 8 Crockford
+base32 characters, e.g. "7KQ2-M9XD". A permutation maps distinct ids to
+distinct codes, so two applications can never share a public ID. The hyphen
+keeps new IDs apart from the 8-hex-digit IDs of older applications.
+"""
+import hashlib
+
+ALPHABET = '0123456789ABCDEFGHJKMNPQRSTVWXYZ'  # Crockford base32: no I, L, O or U
+_HALF_BITS = 20
+_HALF_MASK = (1 << _HALF_BITS) - 1
+_ROUNDS = 4
+_KEY = b'recruitflow-application-id'
+
+
+def _round(value, round_index):
+    """Keyed round function of the Feistel network."""
+    digest = hashlib.blake2b(value.to_bytes(3, 'big'), digest_size=4, key=_KEY, salt=bytes([round_index]) * 16)
+    return int.from_bytes(digest.digest(), 'big') & _HALF_MASK
+
+
+def encode_application_id(row_id):
+    """Public ID for an application row id (1 .. 2**40 - 1)."""
+    if not 0 < row_id < 1 << (2 * _HALF_BITS):
+        raise ValueError(f"Application id {row_id} is out of range for a public ID")
+    left, right = row_id >> _HALF_BITS, row_id & _HALF_MASK
+    for r in range(_ROUNDS):
+        left, right = right, left ^ _round(right, r)
+    value = (left << _HALF_BITS) | right
+    chars = ''.join(ALPHABET[(value >> shift) & 31] for shift in range(35, -1, -5))
+    return f'{chars[:4]}-{chars[4:]}'
+
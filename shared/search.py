@@ -0,0 +1,30 @@
+"""
+Full-text search over the FTS5 indexes created by migration 5 (shared/migrations.py).
+
+jobs_fts indexes jobs (title, description, requirements, location) and
+users_fts indexes users (full_name, email, username, skills, resume_text).
+Triggers keep both in sync with their tables.
+"""
+import re
+
+# bm25() column weights, in index column order; lower bm25 is a better match, so callers sort on its negation
+JOB_RANK = 'bm25(jobs_fts, 10.0, 2.0, 4.0, 3.0)'
+USER_RANK = 'bm25(users_fts, 10.0, 6.0, 6.0, 3.0, 1.0)'
+
+_TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def match_expression(text, columns=None):
+    """
+    Turns free text from a search box into an FTS5 MATCH expression: every word
+    must match, and the last one may be a prefix of a longer word, so results
+    narrow as the admin types ("senior pyth" finds "Senior Python Developer").
+    Restricts the match to `columns` when given. Returns None if the text has no words.
+    """
+    tokens = _TOKEN_RE.findall(text.lower())
+    if not tokens:
+        return None
+    expression = ' AND '.join([f'"{token}"' for token in tokens[:-1]] + [f'"{tokens[-1]}"*'])
+    if columns:
+        expression = '{%s} : (%s)' % (' '.join(columns), expression)
+    return expression
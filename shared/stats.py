@@ -0,0 +1,33 @@
+"""
+Dashboard statistics read from trigger-maintained counters.
+
+Migration 4 (shared/migrations.py) keeps two summary tables up to date from
+triggers on jobs, users and applications, whichever process does the write:
+
+* stats_counters: one row per dashboard counter (total_jobs, active_jobs, ...)
+* job_stats:      application count per job, indexed for the "popular jobs" list
+
+Reading them is O(1) in the number of applications, unlike COUNT(*) scans.
+"""
+
+# Counters shown on the dashboard and returned by /api/stats
+COUNTER_NAMES = ('total_jobs', 'active_jobs', 'total_users', 'total_applications', 'pending_applications')
+
+
+def load_stats(conn):
+    """Reads every dashboard counter with a single query."""
+    stats = dict.fromkeys(COUNTER_NAMES, 0)
+    stats.update({row['name']: row['value'] for row in conn.execute('SELECT name, value FROM stats_counters')})
+    return stats
+
+
+def load_popular_jobs(conn, limit=5):
+    """Returns the active jobs with the most applications, walking the job_stats count index."""
+    return conn.execute('''
+        SELECT j.id, j.title, j.location, s.application_count
+        FROM job_stats s
+        JOIN jobs j ON j.id = s.job_id
+        WHERE j.is_active = 1
+        ORDER BY s.application_count DESC
+        LIMIT ?
+    ''', (limit,)).fetchall()
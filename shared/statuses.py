@@ -0,0 +1,26 @@
+"""
+Application statuses and how they are shown to applicants.
+
+Used by the bot's "My Applications" pages and by the portal's status
+change notifications, so both describe a status the same way.
+"""
+
+APPLICATION_STATUSES = ('pending', 'accepted', 'rejected', 'interviewed')
+
+# status -> (emoji, label)
+STATUS_DISPLAY = {
+    'pending': ("⏳", "Pending"),
+    'accepted': ("✅", "Accepted"),
+    'rejected': ("❌", "Rejected"),
+    'interviewed': ("🤝", "Interviewed"),
+}
+
+
+def status_display(status):
+    """(emoji, label) of an application status; unknown statuses get a question mark."""
+    return STATUS_DISPLAY.get(status) or ("❓", (status or 'unknown').title())
+
+
+def status_label(status):
+    """The status as one string, e.g. "✅ Accepted"."""
+    return ' '.join(status_display(status))
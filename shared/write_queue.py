@@ -0,0 +1,156 @@
+"""
+Group commit for small, frequent writes.
+
+Every profile save or application used to be its own transaction, i.e. one
+WAL commit and one turn at SQLite's write lock each. WriteBehindQueue hands
+those writes to a single writer thread that collects whatever arrives within
+a few milliseconds and commits it as one transaction. Each write still gets
+its own result (or exception) through the future returned by submit().
+"""
+import asyncio
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+
+from shared.database import is_lock_error
+
+logger = logging.getLogger(__name__)
+
+# How long the writer waits for more writes after the first one, and the most it commits at once
+WRITE_BATCH_DELAY_MS = float(os.getenv('WRITE_BATCH_DELAY_MS', '5'))
+WRITE_BATCH_MAX = int(os.getenv('WRITE_BATCH_MAX', '100'))
+
+_STOP = object()
+
+
+class WriteBehindQueue:
+    """
+    Runs submitted func(conn, *args) writes on one writer thread, several per transaction.
+
+    Each write runs inside its own SAVEPOINT, so a write that fails (e.g. a
+    constraint violation) is rolled back and reported on its own future without
+    affecting the rest of the batch. Results are only handed out once the
+    batch has committed.
+    """
+
+    def __init__(self, pool, max_delay=WRITE_BATCH_DELAY_MS / 1000, max_batch=WRITE_BATCH_MAX, name='db-writer'):
+        self.pool = pool
+        self.max_delay = max_delay
+        self.max_batch = max(1, max_batch)
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._closed = False
+        self._metrics = {
+            'submitted': 0,
+            'completed': 0,
+            'failed': 0,
+            'batches': 0,
+            'max_batch': 0,
+            'queue_wait_seconds': 0.0,
+            'commit_seconds': 0.0,
+            'max_commit_seconds': 0.0,
+        }
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def submit(self, func, *args):
+        """Queues func(conn, *args) and returns a concurrent.futures.Future for its result."""
+        future = Future()
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("The write queue has been closed")
+            self._metrics['submitted'] += 1
+        self._queue.put((future, func, args, time.monotonic()))
+        return future
+
+    async def run(self, func, *args):
+        """Awaitable submit(): waits for the batch containing the write to commit."""
+        return await asyncio.wrap_future(self.submit(func, *args))
+
+    def _run(self):
+        """Writer thread: collects a batch, commits it, repeats until closed."""
+        stopping = False
+        while not stopping:
+            item = self._queue.get()
+            if item is _STOP:
+                break
+            batch = [item]
+            deadline = time.monotonic() + self.max_delay
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                try:
+                    item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stopping = True  # commit what we have, then exit
+                    break
+                batch.append(item)
+            self._commit(batch)
+
+    def _commit(self, batch):
+        """Writes one batch in a single transaction and resolves its futures."""
+        started = time.monotonic()
+        try:
+            outcomes = self.pool.run(self._write_batch, batch)
+        except Exception as e:
+            logger.exception("Failed to commit a batch of %s write(s).", len(batch))
+            outcomes = [(False, e)] * len(batch)
+        elapsed = time.monotonic() - started
+
+        with self._lock:
+            self._metrics['batches'] += 1
+            self._metrics['max_batch'] = max(self._metrics['max_batch'], len(batch))
+            self._metrics['commit_seconds'] += elapsed
+            self._metrics['max_commit_seconds'] = max(self._metrics['max_commit_seconds'], elapsed)
+            for (_, _, _, enqueued), (ok, _) in zip(batch, outcomes):
+                self._metrics['queue_wait_seconds'] += started - enqueued
+                self._metrics['completed' if ok else 'failed'] += 1
+
+        for (future, _, _, _), (ok, value) in zip(batch, outcomes):
+            if ok:
+                future.set_result(value)
+            else:
+                future.set_exception(value)
+
+    def _write_batch(self, conn, batch):
+        """Runs every write of the batch on one connection; returns (ok, result or exception) per write."""
+        # Take the write lock up front instead of upgrading a read transaction halfway through
+        conn.execute('BEGIN IMMEDIATE')
+        outcomes = []
+        for _, func, args, _ in batch:
+            conn.execute('SAVEPOINT write_item')
+            try:
+                result = func(conn, *args)
+            except Exception as e:
+                conn.execute('ROLLBACK TO write_item')
+                conn.execute('RELEASE write_item')
+                if isinstance(e, sqlite3.OperationalError) and is_lock_error(e):
+                    raise  # let pool.run() retry the whole batch
+                outcomes.append((False, e))
+            else:
+                conn.execute('RELEASE write_item')
+                outcomes.append((True, result))
+        return outcomes
+
+    def stats(self):
+        """Returns a snapshot of the batching counters."""
+        with self._lock:
+            stats = dict(self._metrics)
+        stats['pending'] = self._queue.qsize()
+        stats['avg_batch'] = round(stats['completed'] / stats['batches'], 2) if stats['batches'] else 0
+        stats['avg_commit_ms'] = round(1000 * stats['commit_seconds'] / stats['batches'], 3) if stats['batches'] else 0
+        return stats
+
+    def close(self):
+        """Commits everything already queued and stops the writer thread."""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+        self._queue.put(_STOP)
+        self._thread.join()
@@ -0,0 +1,155 @@
+"""
+Paged "My Applications" messages for the bot, rendered once per change.
+
+Each application is rendered to its Markdown entry once, and the entries are
+split into pages of at most APPLICATIONS_PAGE_SIZE entries that always fit in
+one Telegram message (Prev/Next buttons, callback data "ap:<page>"). The
+rendered pages are cached per user and reused until one of that user's
+applications is added or changes status (application_versions, migration
+10) or a job is edited (the titles shown come from the jobs table).
+
+Both checks are cheap: PRAGMA data_version tells whether anything was
+committed at all (see DataVersionWatcher), and only then is the user's own
+version row read; the history itself is only queried again if it changed.
+"""
+import functools
+import os
+import threading
+
+from telegram import InlineKeyboardMarkup
+from telegram.constants import MessageLimit
+from telegram.helpers import escape_markdown
+
+from shared.cache import TTLCache
+from shared.statuses import status_display
+from jobs_cache import page_navigation_row
+
+APPLICATIONS_PAGE_SIZE = int(os.getenv('APPLICATIONS_PAGE_SIZE', '5'))  # applications per "My Applications" page
+APPLICATIONS_CALLBACK_PREFIX = 'ap:'
+
+HEADER = "📋 **Your Job Applications:**"
+FIELD_LIMIT = 200  # characters of a job title or location shown; keeps every entry far below one message
+
+
+def clip(text, limit=FIELD_LIMIT):
+    """Shortens free text before it is escaped, so truncation never cuts into Markdown."""
+    text = text or ''
+    return text if len(text) <= limit else text[:limit - 1] + '…'
+
+
+def render_application(title, location, status, applied_at, public_app_id):
+    """One application's Markdown entry."""
+    emoji, label = status_display(status)
+    return (f"{emoji} **{escape_markdown(clip(title))}** - {escape_markdown(clip(location))}\n"
+            f"   Status: {label}\n"
+            f"   Applied: {(applied_at or '')[:10]}\n"  # YYYY-MM-DD
+            f"   Application ID: `{public_app_id}`\n\n")
+
+
+def paginate_entries(entries, page_size=APPLICATIONS_PAGE_SIZE):
+    """Splits rendered entries (each far shorter than a message) into page bodies of at most page_size entries."""
+    # Room for the header, the page counter and the newlines around them
+    budget = MessageLimit.MAX_TEXT_LENGTH - len(HEADER) - 32
+    pages, current, length = [], [], 0
+    for entry in entries:
+        if current and (len(current) >= page_size or length + len(entry) > budget):
+            pages.append(''.join(current))
+            current, length = [], 0
+        current.append(entry)
+        length += len(entry)
+    if current:
+        pages.append(''.join(current))
+    return pages
+
+
+@functools.lru_cache(maxsize=256)
+def applications_page_markup(page, page_count):
+    """Prev/Next keyboard of a "My Applications" page (None for a single page); shared by every user."""
+    rows = page_navigation_row(page, page_count, APPLICATIONS_CALLBACK_PREFIX)
+    return InlineKeyboardMarkup(rows) if rows else None
+
+
+class ApplicationHistory:
+    """A user's rendered applications at the versions they were read at."""
+
+    def __init__(self, user_version, jobs_version, seen, pages, total):
+        self.user_version = user_version  # the user's row in application_versions
+        self.jobs_version = jobs_version
+        self.seen = seen  # (applications version, jobs version) this history is known to be current for
+        self.pages = pages
+        self.total = total
+
+    def page(self, page):
+        """(text, keyboard) of one page; out-of-range pages show the nearest one."""
+        page = min(max(page, 0), len(self.pages) - 1)
+        text = HEADER
+        if len(self.pages) > 1:
+            text += f" (page {page + 1}/{len(self.pages)}, {self.total} in total)"
+        return f"{text}\n\n{self.pages[page]}", applications_page_markup(page, len(self.pages))
+
+
+class ApplicationsCache:
+    """Per-user rendered application histories, re-read only after the user's applications changed."""
+
+    def __init__(self, pool, watcher, jobs_watcher, ttl, maxsize):
+        self.pool = pool
+        self.watcher = watcher  # DataVersionWatcher for 'applications'
+        self.jobs_watcher = jobs_watcher
+        self._histories = TTLCache(ttl=ttl, maxsize=maxsize)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.checks = 0  # version row reads that found the history still current
+        self.renders = 0
+
+    def peek(self, user_id):
+        """The user's history if it is known to be current, without blocking or touching the database."""
+        history = self._histories.get(user_id)
+        if history is None:
+            return None
+        versions = (self.watcher.current(blocking=False), self.jobs_watcher.current(blocking=False))
+        if None in versions or versions != history.seen:
+            return None
+        self.hits += 1
+        return history
+
+    def get(self, user_id):
+        """The user's current history, re-rendered only if their applications or the jobs changed."""
+        history = self._histories.get(user_id)
+        if history is not None and (self.watcher.current(), self.jobs_watcher.current()) == history.seen:
+            self.hits += 1
+            return history
+        history = self.pool.run(self._load, user_id, history)
+        self._histories.set(user_id, history)
+        return history
+
+    def _load(self, conn, user_id, history):
+        """Reads the versions, then the applications only if the user's changed, in one read transaction."""
+        conn.execute('BEGIN')
+        try:
+            versions = dict(conn.execute(
+                "SELECT name, version FROM data_versions WHERE name IN ('applications', 'jobs')").fetchall())
+            row = conn.execute('SELECT version FROM application_versions WHERE user_id = ?', (user_id,)).fetchone()
+            user_version = row[0] if row else 0
+            seen = (versions.get('applications', 0), versions.get('jobs', 0))
+            if history is not None and (history.user_version, history.jobs_version) == (user_version, seen[1]):
+                history.seen = seen  # other users' applications changed, not this user's
+                with self._lock:
+                    self.checks += 1
+                return history
+            rows = conn.execute('''
+                SELECT j.title, j.location, a.status, a.applied_at, a.public_application_id
+                FROM applications a
+                JOIN jobs j ON a.job_id = j.id
+                WHERE a.user_id = ?
+                ORDER BY a.applied_at DESC, a.id DESC
+            ''', (user_id,)).fetchall()
+        finally:
+            conn.commit()
+        with self._lock:
+            self.renders += 1
+        pages = paginate_entries([render_application(*row) for row in rows])
+        return ApplicationHistory(user_version, seen[1], seen, pages, len(rows))
+
+    def stats(self):
+        """Hit/check/render counters and the number of cached histories."""
+        return {'hits': self.hits, 'checks': self.checks, 'renders': self.renders, 'cached': len(self._histories)}
@@ -1,14 +1,15 @@
+import argparse
 import logging
-import sqlite3
+import sys
 from datetime import datetime
-from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, ReplyKeyboardMarkup, KeyboardButton
+from telegram import Update, ReplyKeyboardMarkup, KeyboardButton
+from telegram.error import BadRequest
 from telegram.ext import Application, CommandHandler, MessageHandler, CallbackQueryHandler, ConversationHandler, \
-    ContextTypes, filters
+    ContextTypes, TypeHandler, ApplicationHandlerStop, filters
 import json
 import os
 from dotenv import load_dotenv  # Import find_dotenv
 import re # For email validation
-import uuid # For generating unique application IDs
 
 # Construct the path to the .env file relative to the current script (bot.py)
 # bot.py is in tg_bot/, .env is in env/ at project root
@@ -17,112 +18,144 @@ dotenv_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'en
 # Load environment variables from the specified .env file
 load_dotenv(dotenv_path, override=True, verbose=True) # Added override=True and verbose=True for debugging
 
+# Make the shared package at the project root importable when run as a script
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from shared.database import DB_PATH, get_pool  # noqa: E402 (needs the .env loaded first)
+from shared.async_db import DatabaseExecutor  # noqa: E402
+from shared.write_queue import WriteBehindQueue  # noqa: E402
+from shared.migrations import migrate  # noqa: E402
+from shared.cache import TTLCache, DataVersionWatcher  # noqa: E402
+from shared.logging_setup import setup_logging  # noqa: E402
+from shared.matching import term_counts  # noqa: E402
+from jobs_cache import JobsCache, parse_page_callback  # noqa: E402
+from applications_cache import ApplicationsCache, APPLICATIONS_CALLBACK_PREFIX  # noqa: E402
+from update_processor import PerUserUpdateProcessor  # noqa: E402
+from persistence import SQLitePersistence  # noqa: E402
+from metrics import METRICS_ENABLED, BOT_METRICS_PORT, TimedHTTPXRequest, metrics, start_metrics_server, \
+    timed_db, timed_handler  # noqa: E402
+from sharding import BOT_SHARD_COUNT, shard_of, shard_port  # noqa: E402
+from webhook_config import WEBHOOK_URL, WEBHOOK_LISTEN, WEBHOOK_PORT, WEBHOOK_PATH, \
+    WEBHOOK_SECRET_TOKEN  # noqa: E402
+
 TELEGRAM_ADMIN_GROUP_ID = os.getenv('TELEGRAM_ADMIN_GROUP_ID') # For forwarding resumes to tg group
 
 # Enable logging
-logging.basicConfig(
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', level=logging.INFO
-)
+setup_logging('bot')
 logger = logging.getLogger(__name__)
 
 # Bot token - Get from environment variables
 BOT_TOKEN = os.getenv('BOT_TOKEN')
 
+# How updates reach the bot: 'polling' (default) or 'webhook' (listener settings are in webhook_config.py)
+BOT_MODE = os.getenv('BOT_MODE', 'polling').lower()
+# Updates handled at the same time (one user's updates still run in order, see update_processor.py)
+CONCURRENT_UPDATES = int(os.getenv('BOT_CONCURRENT_UPDATES', '64'))
+# Bot API base URL override, e.g. a local stub server for testing
+TELEGRAM_API_URL = os.getenv('TELEGRAM_API_URL')
+
+# Only the update types the registered handlers use (messages and inline button presses)
+ALLOWED_UPDATES = [Update.MESSAGE, Update.CALLBACK_QUERY]
+
+# Profile rows are cached per Telegram user id; only this process writes a user's profile
+PROFILE_CACHE_SIZE = int(os.getenv('PROFILE_CACHE_SIZE', '10000'))  # max cached profiles
+PROFILE_CACHE_TTL = float(os.getenv('PROFILE_CACHE_TTL', '600'))  # seconds
+JOB_FEED_RECOMMENDATIONS = int(os.getenv('JOB_FEED_RECOMMENDATIONS', '5'))  # jobs starred at the top of a user's list
+
 # Conversation states for profile creation
 PROFILE_NAME, PROFILE_EMAIL, PROFILE_PHONE, PROFILE_EXPERIENCE, PROFILE_SKILLS, PROFILE_RESUME = range(6)
 
 
 class JobsBot:
-    def __init__(self):
-        # Determine the path to the database file, now located in the 'db' directory
-        # It's two levels up from tg_bot/bot.py, then into the 'db' folder
-        self.db_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'db', 'jobs_bot.db')
+    def __init__(self, db_path=DB_PATH):
+        # The database file lives in the 'db' directory at the project root (see shared/database.py)
+        self.db_path = db_path
+        # Pooled WAL-mode connections shared by every method instead of a fresh connect per call
+        self.pool = get_pool(self.db_path)
+        # Worker threads that run the blocking methods below for the async handlers
+        self.executor = DatabaseExecutor()
         self.init_database()
+        # Profile saves and applications are group-committed by one writer thread
+        self.writes = WriteBehindQueue(self.pool)
+        # Active jobs and their keyboards, rebuilt only when the portal (or anyone) writes the jobs table
+        self.jobs_cache = JobsCache(self.pool, DataVersionWatcher(self.db_path, 'jobs'))
+        # Recently used profiles, and the ids of every user who has one (so "has a profile?" never needs the DB)
+        self.profile_cache = TTLCache(ttl=PROFILE_CACHE_TTL, maxsize=PROFILE_CACHE_SIZE)
+        with self.pool.connection() as conn:
+            self.profile_ids = {row[0] for row in conn.execute("SELECT user_id FROM users")}
+        # Rendered "My Applications" pages, kept until one of the user's applications (or a job) changes
+        self.applications_cache = ApplicationsCache(self.pool, DataVersionWatcher(self.db_path, 'applications'),
+                                                    self.jobs_cache.watcher, PROFILE_CACHE_TTL, PROFILE_CACHE_SIZE)
+        # user_id -> (skill term counts, jobs version, ids of the jobs recommended for them at that version)
+        self.feed_cache = TTLCache(ttl=PROFILE_CACHE_TTL, maxsize=PROFILE_CACHE_SIZE)
+        # Users whose Apply Now tap is being processed, so a flood of taps costs one write
+        self.applying = set()
 
     def init_database(self):
-        """Initialize SQLite database and create tables if they don't exist."""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        """Bring the database schema up to date and insert sample jobs into an empty jobs table."""
+        with self.pool.connection() as conn:
+            # Tables and indexes are created by the versioned migrations in shared/migrations.py
+            migrate(conn)
+
+            cursor = conn.cursor()
+
+            # Insert sample jobs if the jobs table is empty
+            cursor.execute("SELECT COUNT(*) FROM jobs")
+            if cursor.fetchone()[0] == 0:
+                sample_jobs = [
+                    ("Software Developer", "Full-stack developer position", "Python, JavaScript, React", "Remote",
+                     "$60,000-80,000"),
+                    ("Data Analyst", "Analyze business data and create reports", "SQL, Excel, Python", "New York",
+                     "$50,000-70,000"),
+                    ("Marketing Manager", "Lead marketing campaigns", "Digital Marketing, SEO, Social Media", "California",
+                     "$55,000-75,000"),
+                    ("UI/UX Designer", "Design user interfaces and experiences", "Figma, Adobe XD, Prototyping", "Remote",
+                     "$45,000-65,000")
+                ]
+                cursor.executemany(
+                    "INSERT INTO jobs (title, description, requirements, location, salary) VALUES (?, ?, ?, ?, ?)",
+                    sample_jobs
+                )
+                logger.info("Inserted sample jobs into the database.")
 
-        # Create users table for profiles
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS users (
-                user_id INTEGER PRIMARY KEY,
-                username TEXT,
-                full_name TEXT,
-                email TEXT,
-                phone TEXT,
-                experience TEXT,
-                skills TEXT,
-                resume_text TEXT,
-                resume_file_id TEXT, -- New column for Telegram file_id
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-
-        # Create jobs table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS jobs (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                title TEXT NOT NULL,
-                description TEXT,
-                requirements TEXT,
-                location TEXT,
-                salary TEXT,
-                is_active BOOLEAN DEFAULT 1,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-
-        # Create applications table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS applications (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                public_application_id TEXT UNIQUE, -- New column for user-friendly ID
-                user_id INTEGER,
-                job_id INTEGER,
-                status TEXT DEFAULT 'pending', -- e.g., 'pending', 'accepted', 'rejected', 'interviewed'
-                applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (user_id) REFERENCES users (user_id),
-                FOREIGN KEY (job_id) REFERENCES jobs (id)
-            )
-        ''')
-
-        # Insert sample jobs if the jobs table is empty
-        cursor.execute("SELECT COUNT(*) FROM jobs")
-        if cursor.fetchone()[0] == 0:
-            sample_jobs = [
-                ("Software Developer", "Full-stack developer position", "Python, JavaScript, React", "Remote",
-                 "$60,000-80,000"),
-                ("Data Analyst", "Analyze business data and create reports", "SQL, Excel, Python", "New York",
-                 "$50,000-70,000"),
-                ("Marketing Manager", "Lead marketing campaigns", "Digital Marketing, SEO, Social Media", "California",
-                 "$55,000-75,000"),
-                ("UI/UX Designer", "Design user interfaces and experiences", "Figma, Adobe XD, Prototyping", "Remote",
-                 "$45,000-65,000")
-            ]
-            cursor.executemany(
-                "INSERT INTO jobs (title, description, requirements, location, salary) VALUES (?, ?, ?, ?, ?)",
-                sample_jobs
-            )
-            logger.info("Inserted sample jobs into the database.")
-
-        conn.commit()
-        conn.close()
+    def has_profile(self, user_id):
+        """True if the user has created a profile (answered from memory)."""
+        return user_id in self.profile_ids
 
+    @timed_db
     def get_user_profile(self, user_id):
-        """Retrieve a user's profile from the database by user_id."""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        cursor.execute("SELECT * FROM users WHERE user_id = ?", (user_id,))
-        profile = cursor.fetchone()
-        conn.close()
+        """Retrieve a user's profile by user_id, from the profile cache when possible."""
+        if user_id not in self.profile_ids:
+            return None
+        profile = self.profile_cache.get(user_id)
+        if profile is None:
+            with self.pool.connection() as conn:
+                profile = conn.execute("SELECT * FROM users WHERE user_id = ?", (user_id,)).fetchone()
+            if profile is not None:
+                self.profile_cache.set(user_id, profile)
         return profile
 
+    @timed_db
+    def get_profile_terms(self, user_id):
+        """Term counts of a user's skills and experience, read without the rest of the profile (None if none)."""
+        with self.pool.connection() as conn:
+            row = conn.execute("SELECT skills, experience FROM users WHERE user_id = ?", (user_id,)).fetchone()
+        return term_counts(row['skills'], row['experience']) if row is not None else None
+
     def save_user_profile(self, user_id, username, profile_data):
         """Save or update a user's profile in the database."""
-        conn = sqlite3.connect(self.db_path)
+        self.profile_cache.invalidate(user_id)
+        profile = self.writes.submit(self._save_user_profile, user_id, username, profile_data).result()
+        self._profile_saved(user_id, profile)
+
+    def _profile_saved(self, user_id, profile):
+        """Caches the row as written, so the next lookup doesn't go back to the database."""
+        self.profile_cache.set(user_id, profile)
+        self.profile_ids.add(user_id)
+        self.feed_cache.invalidate(user_id)  # new skills, new recommendations
+
+    @timed_db
+    def _save_user_profile(self, conn, user_id, username, profile_data):
+        """Upserts the profile row on an already checked-out connection."""
         cursor = conn.cursor()
 
         cursor.execute("SELECT user_id FROM users WHERE user_id = ?", (user_id,))
@@ -140,7 +173,7 @@ class JobsBot:
             ''', (username, profile_data['name'], profile_data['email'],
                   profile_data['phone'], profile_data['experience'],
                   profile_data['skills'], profile_data['resume'], resume_file_id, user_id))
-            logger.info(f"Updated profile for user_id: {user_id}")
+            logger.info("Updated profile for user_id: %s", user_id)
         else:
             # Insert new profile
             cursor.execute('''
@@ -149,46 +182,138 @@ class JobsBot:
             ''', (user_id, username, profile_data['name'], profile_data['email'],
                   profile_data['phone'], profile_data['experience'],
                   profile_data['skills'], profile_data['resume'], resume_file_id))
-            logger.info(f"Created new profile for user_id: {user_id}")
+            logger.info("Created new profile for user_id: %s", user_id)
 
-        conn.commit()
-        conn.close()
+        return cursor.execute("SELECT * FROM users WHERE user_id = ?", (user_id,)).fetchone()
 
-    def get_active_jobs(self):
-        """Retrieve all active job postings from the database."""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        cursor.execute("SELECT * FROM jobs WHERE is_active = 1 ORDER BY created_at DESC")
-        jobs = cursor.fetchall()
-        conn.close()
-        return jobs
+    @timed_db
+    def get_jobs_snapshot(self):
+        """The cached active jobs with their prebuilt inline keyboards."""
+        return self.jobs_cache.get()
+
+    @timed_db
+    def get_job(self, job_id):
+        """Retrieve a single job posting by its id (inactive jobs are read from the database)."""
+        job = self.jobs_cache.get().by_id.get(job_id)
+        if job is not None:
+            return job
+        with self.pool.connection() as conn:
+            return conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+
+    @timed_db
+    def get_application_history(self, user_id):
+        """The user's applications rendered as "My Applications" pages (see applications_cache.py)."""
+        return self.applications_cache.get(user_id)
 
     def apply_for_job(self, user_id, job_id):
         """Submit a job application for a user."""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-
-        # Check if the user has already applied for this job
-        cursor.execute("SELECT id FROM applications WHERE user_id = ? AND job_id = ?", (user_id, job_id))
-        if cursor.fetchone():
-            conn.close()
-            logger.warning(f"User {user_id} already applied for job {job_id}.")
+        return self.writes.submit(self._apply_for_job, user_id, job_id).result()
+
+    @timed_db
+    def _apply_for_job(self, conn, user_id, job_id):
+        """Inserts the application on an already checked-out connection, in a single statement."""
+        # The public ID is computed from the row id this insert will get (see shared/public_ids.py), so it
+        # can't collide; UNIQUE(user_id, job_id) turns the duplicate check into the insert itself.
+        row = conn.execute('''
+            INSERT INTO applications (public_application_id, user_id, job_id)
+            VALUES (public_application_id(1 + MAX(
+                        COALESCE((SELECT seq FROM sqlite_sequence WHERE name = 'applications'), 0),
+                        COALESCE((SELECT MAX(id) FROM applications), 0))),
+                    ?, ?)
+            ON CONFLICT (user_id, job_id) DO NOTHING
+            RETURNING public_application_id
+        ''', (user_id, job_id)).fetchone()
+        if row is None:
+            logger.warning("User %s already applied for job %s.", user_id, job_id)
             return False, "You have already applied for this position!", None
-
-        # Generate a unique public application ID
-        public_app_id = str(uuid.uuid4()).split('-')[0].upper() # Use first part of UUID for brevity
-
-        # Insert new application
-        cursor.execute("INSERT INTO applications (public_application_id, user_id, job_id) VALUES (?, ?, ?)",
-                       (public_app_id, user_id, job_id))
-        conn.commit()
-        conn.close()
-        logger.info(f"User {user_id} successfully applied for job {job_id}.")
-        return True, "Application submitted successfully!", public_app_id
+        logger.info("User %s successfully applied for job %s.", user_id, job_id)
+        return True, "Application submitted successfully!", row[0]
+
+    # Awaitable variants for the async handlers: the blocking sqlite3 work runs on
+    # the executor's worker threads so the event loop keeps serving other users.
+
+    async def get_user_profile_async(self, user_id):
+        """Awaitable get_user_profile(); users without a profile and cached profiles never leave the event loop."""
+        if user_id not in self.profile_ids:
+            return None
+        profile = self.profile_cache.get(user_id)
+        if profile is not None:
+            return profile
+        return await self.executor.run(self.get_user_profile, user_id)
+
+    async def save_user_profile_async(self, user_id, username, profile_data):
+        """Awaitable save_user_profile(); waits on the write queue instead of holding an executor thread."""
+        self.profile_cache.invalidate(user_id)
+        profile = await self.writes.run(self._save_user_profile, user_id, username, profile_data)
+        self._profile_saved(user_id, profile)
+
+    async def get_jobs_snapshot_async(self):
+        """Awaitable get_jobs_snapshot(); a current snapshot is returned without leaving the event loop."""
+        snapshot = self.jobs_cache.peek()
+        if snapshot is None:
+            snapshot = await self.executor.run(self.get_jobs_snapshot)
+        return snapshot
+
+    async def get_job_feed_async(self, user_id):
+        """
+        The jobs snapshot and the ids of the jobs recommended for the user, best match first.
+        Recommendations are ranked once per user and jobs version from the user's cached skill terms.
+        """
+        snapshot = await self.get_jobs_snapshot_async()
+        if not snapshot.jobs or user_id not in self.profile_ids:
+            return snapshot, []
+        cached = self.feed_cache.get(user_id)
+        if cached is not None and cached[1] == snapshot.version:
+            return snapshot, cached[2]
+        if cached is not None:
+            counts = cached[0]  # only the jobs changed
+        else:
+            profile = self.profile_cache.get(user_id)
+            if profile is not None:
+                counts = term_counts(profile['skills'], profile['experience'])
+            else:
+                counts = await self.executor.run(self.get_profile_terms, user_id)
+        recommended = snapshot.recommend(counts, JOB_FEED_RECOMMENDATIONS) if counts else []
+        self.feed_cache.set(user_id, (counts, snapshot.version, recommended))
+        return snapshot, recommended
+
+    async def get_job_async(self, job_id):
+        """Awaitable get_job()."""
+        snapshot = self.jobs_cache.peek()
+        if snapshot is not None and job_id in snapshot.by_id:
+            return snapshot.by_id[job_id]
+        return await self.executor.run(self.get_job, job_id)
+
+    async def get_application_history_async(self, user_id):
+        """Awaitable get_application_history(); an unchanged history is returned without leaving the event loop."""
+        history = self.applications_cache.peek(user_id)
+        if history is None:
+            history = await self.executor.run(self.get_application_history, user_id)
+        return history
+
+    async def apply_for_job_async(self, user_id, job_id):
+        """Awaitable apply_for_job(). Repeated taps while a user's application is being written are ignored."""
+        if user_id in self.applying:
+            return False, "Your application is already being submitted, please wait a moment.", None
+        self.applying.add(user_id)
+        try:
+            return await self.writes.run(self._apply_for_job, user_id, job_id)
+        finally:
+            self.applying.discard(user_id)
+
+    def close(self):
+        """Waits for queued database work to finish and closes idle connections."""
+        self.executor.shutdown(wait=True)
+        self.writes.close()
+        logger.info("Write queue stats at shutdown: %s", self.writes.stats())
+        self.jobs_cache.watcher.close()
+        self.applications_cache.watcher.close()
+        self.pool.close_all()
 
 # Initialize the JobsBot instance globally
 jobs_bot = JobsBot()
 
+@timed_handler
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handles the /start command, showing the main menu."""
     keyboard = [
@@ -211,9 +336,10 @@ I can help you find and apply for jobs. Here's what you can do:
 Start by creating your profile to apply for jobs with one click!
     """
     await update.message.reply_text(welcome_text, reply_markup=reply_markup, parse_mode='Markdown')
-    logger.info(f"User {update.effective_user.id} started the bot.")
+    logger.info("User %s started the bot.", update.effective_user.id, extra={'sampled': True})
 
 
+@timed_handler
 async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handles clicks on the main menu reply keyboard buttons."""
     text = update.message.text
@@ -228,13 +354,14 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await help_command(update, context)
     else:
         await update.message.reply_text("I didn't understand that. Please use the menu buttons.")
-    logger.info(f"User {update.effective_user.id} clicked button: {text}")
+    logger.info("User %s clicked button: %s", update.effective_user.id, text, extra={'sampled': True})
 
 
+@timed_handler
 async def create_profile(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Starts the conversation for creating or updating a user profile."""
     user_id = update.effective_user.id
-    profile = jobs_bot.get_user_profile(user_id)
+    profile = await jobs_bot.get_user_profile_async(user_id)
 
     if profile:
         # Show existing data including resume_file_id if present
@@ -263,10 +390,11 @@ async def create_profile(update: Update, context: ContextTypes.DEFAULT_TYPE):
         )
     context.user_data['profile'] = {}  # Initialize user_data for the profile
     context.user_data['profile']['resume_file_id'] = None  # Initialize resume_file_id
-    logger.info(f"User {user_id} started profile creation/update.")
+    logger.info("User %s started profile creation/update.", user_id)
     return PROFILE_NAME
 
 
+@timed_handler
 async def profile_name(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Collects the user's full name for their profile."""
     context.user_data['profile']['name'] = update.message.text
@@ -274,6 +402,7 @@ async def profile_name(update: Update, context: ContextTypes.DEFAULT_TYPE):
     return PROFILE_EMAIL
 
 
+@timed_handler
 async def profile_email(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Collects the user's email address for their profile."""
     email = update.message.text
@@ -286,6 +415,7 @@ async def profile_email(update: Update, context: ContextTypes.DEFAULT_TYPE):
     return PROFILE_PHONE
 
 
+@timed_handler
 async def profile_phone(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Collects the user's phone number for their profile."""
     context.user_data['profile']['phone'] = update.message.text
@@ -293,6 +423,7 @@ async def profile_phone(update: Update, context: ContextTypes.DEFAULT_TYPE):
     return PROFILE_EXPERIENCE
 
 
+@timed_handler
 async def profile_experience(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Collects the user's work experience for their profile."""
     context.user_data['profile']['experience'] = update.message.text
@@ -300,6 +431,7 @@ async def profile_experience(update: Update, context: ContextTypes.DEFAULT_TYPE)
     return PROFILE_SKILLS
 
 
+@timed_handler
 async def profile_skills(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Collects the user's skills for their profile."""
     context.user_data['profile']['skills'] = update.message.text
@@ -308,6 +440,7 @@ async def profile_skills(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 
 # Line 253 (start of profile_resume function)
+@timed_handler
 async def profile_resume(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """
     Handles the user's resume input. Accepts either text or a document.
@@ -333,10 +466,10 @@ async def profile_resume(update: Update, context: ContextTypes.DEFAULT_TYPE):
                             f"File ID: `{file_id}`"  # Display file_id for admin reference
                 )
                 await update.message.reply_text("📄 Resume file received and forwarded to admin. Thank you!")
-                logger.info(
-                    f"User {update.effective_user.id} uploaded resume file {file_name} (ID: {file_id}). Forwarded to admin group.")
+                logger.info("User %s uploaded resume file %s (ID: %s). Forwarded to admin group.",
+                            update.effective_user.id, file_name, file_id)
             except Exception as e:
-                logger.error(f"Failed to forward resume file {file_id} to admin group: {e}")
+                logger.error("Failed to forward resume file %s to admin group: %s", file_id, e)
                 await update.message.reply_text(
                     "⚠️ There was an error forwarding your resume file to the admin. Please try again or contact support.")
                 # Don't end conversation, allow retry or text input
@@ -357,7 +490,7 @@ async def profile_resume(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
     username = update.effective_user.username or "N/A"
 
-    jobs_bot.save_user_profile(user_id, username, context.user_data['profile'])
+    await jobs_bot.save_user_profile_async(user_id, username, context.user_data['profile'])
 
     # Re-display the main keyboard after successful profile save
     keyboard = [
@@ -372,72 +505,104 @@ async def profile_resume(update: Update, context: ContextTypes.DEFAULT_TYPE):
         "You can now apply for jobs with one click. Use '💼 View Jobs' to browse available positions.",
         reply_markup=reply_markup  # Explicitly send back the main keyboard
     )
-    logger.info(f"User {user_id} completed profile creation/update.")
+    logger.info("User %s completed profile creation/update.", user_id)
     return ConversationHandler.END
 
+NO_JOBS_TEXT = "😔 No jobs available at the moment. Please check back later!"
+JOB_LIST_TEXT = "💼 Available Job Positions:\n\nClick on any job to view details and apply:"
+JOB_FEED_TEXT = ("💼 Available Job Positions:\n\n⭐ The best matches for your skills are listed first.\n"
+                 "Click on any job to view details and apply:")
+
+
+def job_list_message(snapshot, recommended, page=0):
+    """Text and keyboard of a page of the job list for a user with the given recommendations."""
+    page = snapshot.clamp_page(page)
+    if recommended:
+        return JOB_FEED_TEXT if page == 0 else JOB_LIST_TEXT, snapshot.feed_markup(recommended, page)
+    # Without recommendations every page is one keyboard shared by all users until the jobs change
+    return JOB_LIST_TEXT, snapshot.page_markup(page)
+
+
 async def view_jobs(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Displays a list of available job positions using inline keyboard buttons."""
-    jobs = jobs_bot.get_active_jobs()
+    # The first page of the list (callback data job_<id>, Prev/Next jp:<page>) comes prebuilt from the jobs
+    # cache; the jobs matching the user's skills are starred at the top
+    snapshot, recommended = await jobs_bot.get_job_feed_async(update.effective_user.id)
 
-    if not jobs:
-        await update.message.reply_text("😔 No jobs available at the moment. Please check back later!")
+    if not snapshot.jobs:
+        await update.message.reply_text(NO_JOBS_TEXT)
         return
 
-    keyboard = []
-    for job in jobs:
-        job_id, title, description, requirements, location, salary, is_active, created_at = job
-        keyboard.append([InlineKeyboardButton(
-            f"💼 {title} - {location}",
-            callback_data=f"job_{job_id}"  # Callback data includes job ID
-        )])
+    text, reply_markup = job_list_message(snapshot, recommended)
+    await update.message.reply_text(text, reply_markup=reply_markup)
+    logger.info("User %s viewed available jobs.", update.effective_user.id, extra={'sampled': True})
 
-    reply_markup = InlineKeyboardMarkup(keyboard)
-    await update.message.reply_text(
-        "💼 Available Job Positions:\n\nClick on any job to view details and apply:",
-        reply_markup=reply_markup
-    )
-    logger.info(f"User {update.effective_user.id} viewed available jobs.")
+
+async def show_job_list(query, page=0):
+    """Shows a page of the job list in place of the current message (Prev/Next and Back to Jobs buttons)."""
+    snapshot, recommended = await jobs_bot.get_job_feed_async(query.from_user.id)
+    if not snapshot.jobs:
+        await query.edit_message_text(NO_JOBS_TEXT)
+        return
+    text, reply_markup = job_list_message(snapshot, recommended, page)
+    if getattr(query.message, 'text', None) == text:
+        # Turning between pages with the same header: only the keyboard changes
+        try:
+            await query.edit_message_reply_markup(reply_markup)
+        except BadRequest as e:
+            if 'not modified' not in str(e).lower():  # a repeated tap on the same button
+                raise
+        return
+    await query.edit_message_text(text, reply_markup=reply_markup)
 
 
+@timed_handler
 async def job_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handles callbacks from inline keyboard buttons (job selection and application)."""
     query = update.callback_query
     await query.answer()  # Acknowledge the callback query
 
     callback_data = query.data
+    page = parse_page_callback(callback_data)
+    applications_page = parse_page_callback(callback_data, APPLICATIONS_CALLBACK_PREFIX)
 
     if callback_data.startswith("job_"):
         job_id = int(callback_data.split("_")[1])
         await show_job_details(query, job_id)
-        logger.info(f"User {query.from_user.id} viewed details for job {job_id}.")
+        logger.info("User %s viewed details for job %s.", query.from_user.id, job_id, extra={'sampled': True})
     elif callback_data.startswith("apply_"):
         job_id = int(callback_data.split("_")[1])
         await apply_job(query, job_id)
-        logger.info(f"User {query.from_user.id} attempted to apply for job {job_id}.")
+        logger.info("User %s attempted to apply for job %s.", query.from_user.id, job_id)
+    elif page is not None:
+        # Prev/Next in the job list, or Back to Jobs from a job's details (to the page listing it)
+        await show_job_list(query, page)
+        logger.info("User %s opened job list page %s.", query.from_user.id, page, extra={'sampled': True})
+    elif applications_page is not None:
+        # Prev/Next in "My Applications"
+        await show_applications_page(query, applications_page)
+        logger.info("User %s opened applications page %s.", query.from_user.id, applications_page,
+                    extra={'sampled': True})
     elif callback_data == "back_jobs":
-        # Re-show the list of jobs
-        await view_jobs(query, context)  # Pass query as update to reuse view_jobs logic
-        logger.info(f"User {query.from_user.id} navigated back to job list.")
+        # Back to Jobs on details messages sent before the list was paged
+        await show_job_list(query)
+        logger.info("User %s navigated back to job list.", query.from_user.id, extra={'sampled': True})
     elif callback_data == "create_profile":
         # Redirect to profile creation, using the message context
         # For simplicity, we'll send a new message prompting them to use the main menu button
         await query.edit_message_text(
             "Please use the '📝 Create/Update Profile' button from the main menu to create your profile."
         )
-        logger.info(f"User {query.from_user.id} was prompted to create profile via main menu.")
+        logger.info("User %s was prompted to create profile via main menu.", query.from_user.id)
 
 
 async def show_job_details(query, job_id):
     """Displays detailed information about a selected job."""
-    conn = sqlite3.connect(jobs_bot.db_path)
-    cursor = conn.cursor()
-    cursor.execute("SELECT * FROM jobs WHERE id = ?", (job_id,))
-    job = cursor.fetchone()
-    conn.close()
+    job = await jobs_bot.get_job_async(job_id)
 
     if not job:
         await query.edit_message_text("❌ Job not found!")
-        logger.warning(f"Job {job_id} not found for details view.")
+        logger.warning("Job %s not found for details view.", job_id)
         return
 
     job_id, title, description, requirements, location, salary, is_active, created_at = job
@@ -455,19 +620,11 @@ async def show_job_details(query, job_id):
 {requirements if requirements else 'No specific requirements listed.'}
     """
 
-    # Check if user has a profile to determine if 'Apply Now' button should be shown
+    # Check if user has a profile to determine if 'Apply Now' button should be shown (in memory, no profile I/O)
+    # Back to Jobs returns to the page the job is on in the user's own list
     user_id = query.from_user.id
-    profile = jobs_bot.get_user_profile(user_id)
-
-    keyboard = []
-    if profile:
-        keyboard.append([InlineKeyboardButton("✅ Apply Now", callback_data=f"apply_{job_id}")])
-    else:
-        keyboard.append([InlineKeyboardButton("📝 Create Profile First", callback_data="create_profile")])
-
-    keyboard.append([InlineKeyboardButton("🔙 Back to Jobs", callback_data="back_jobs")])
-
-    reply_markup = InlineKeyboardMarkup(keyboard)
+    snapshot, recommended = await jobs_bot.get_job_feed_async(user_id)
+    reply_markup = snapshot.details_markup(job_id, jobs_bot.has_profile(user_id), recommended)
 
     await query.edit_message_text(job_text, reply_markup=reply_markup, parse_mode='Markdown')
 
@@ -477,62 +634,57 @@ async def apply_job(query, job_id):
     user_id = query.from_user.id
 
     # Ensure user has a profile before allowing application
-    profile = jobs_bot.get_user_profile(user_id)
-    if not profile:
+    if not jobs_bot.has_profile(user_id):
         await query.edit_message_text(
             "❌ Please create your profile first before applying!\n\n"
             "Use '📝 Create/Update Profile' from the main menu."
         )
-        logger.warning(f"User {user_id} tried to apply for job {job_id} without a profile.")
+        logger.warning("User %s tried to apply for job %s without a profile.", user_id, job_id)
         return
 
     # Attempt to apply for the job
-    success, message, public_app_id = jobs_bot.apply_for_job(user_id, job_id)
+    success, message, public_app_id = await jobs_bot.apply_for_job_async(user_id, job_id)
 
     if success:
         await query.edit_message_text(
             f"🎉 {message}\n\nYour application has been submitted and will be reviewed by our team.")
     else:
         await query.edit_message_text(f"⚠️ {message}")
-    logger.info(f"Application attempt for job {job_id} by user {user_id}: Success={success}, Message='{message}'")
+    logger.info("Application attempt for job %s by user %s: Success=%s, Message='%s'", job_id, user_id, success, message)
 
 
 async def my_applications(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Displays a list of the user's submitted job applications."""
+    """Displays the first page of the user's submitted job applications, newest first."""
     user_id = update.effective_user.id
 
-    conn = sqlite3.connect(jobs_bot.db_path)
-    cursor = conn.cursor()
-    cursor.execute('''
-        SELECT j.title, j.location, a.status, a.applied_at, a.public_application_id
-        FROM applications a
-        JOIN jobs j ON a.job_id = j.id
-        WHERE a.user_id = ?
-        ORDER BY a.applied_at DESC
-    ''', (user_id,))
-    applications = cursor.fetchall()
-    conn.close()
-
-    if not applications:
+    history = await jobs_bot.get_application_history_async(user_id)
+
+    if not history.total:
         await update.message.reply_text(
             "📋 You haven't applied for any jobs yet.\n\nUse '💼 View Jobs' to browse and apply!")
-        logger.info(f"User {user_id} has no applications.")
+        logger.info("User %s has no applications.", user_id, extra={'sampled': True})
         return
 
-    text = "📋 **Your Job Applications:**\n\n"
-    for app in applications:
-        title, location, status, applied_at, public_app_id = app
-        # Determine emoji based on application status
-        status_emoji = "⏳" if status == "pending" else "✅" if status == "accepted" else "❌" if status == "rejected" else "🤝" if status == "interviewed" else "❓"
-        text += f"{status_emoji} **{title}** - {location}\n"
-        text += f"   Status: {status.title()}\n"
-        text += f"   Applied: {applied_at[:10]}\n"  # Format date to INSEE-MM-DD
-        text += f"   Application ID: `{public_app_id}`\n\n"  # Display public_app_id
+    text, reply_markup = history.page(0)
+    await update.message.reply_text(text, reply_markup=reply_markup, parse_mode='Markdown')
+    logger.info("User %s viewed their applications.", user_id, extra={'sampled': True})
 
-    await update.message.reply_text(text, parse_mode='Markdown')
-    logger.info(f"User {user_id} viewed their applications.")
+
+async def show_applications_page(query, page):
+    """Replaces a "My Applications" page with another one (the Prev/Next buttons)."""
+    history = await jobs_bot.get_application_history_async(query.from_user.id)
+    if not history.total:
+        await query.edit_message_text("📋 You haven't applied for any jobs yet.")
+        return
+    text, reply_markup = history.page(page)
+    try:
+        await query.edit_message_text(text, reply_markup=reply_markup, parse_mode='Markdown')
+    except BadRequest as e:
+        if 'not modified' not in str(e).lower():  # a repeated tap on the same button
+            raise
 
 
+@timed_handler
 async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Provides help information about the bot's features."""
     help_text = """
@@ -557,9 +709,10 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 Contact @cstcontactbot if you have any issues or questions.
     """
     await update.message.reply_text(help_text, parse_mode='Markdown')
-    logger.info(f"User {update.effective_user.id} requested help.")
+    logger.info("User %s requested help.", update.effective_user.id, extra={'sampled': True})
 
 
+@timed_handler
 async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Cancels the current conversation (e.g., profile creation)."""
     await update.message.reply_text(
@@ -570,25 +723,28 @@ async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE):
             [KeyboardButton("ℹ️ Help")]
         ], resize_keyboard=True)
     )
-    logger.info(f"User {update.effective_user.id} cancelled a conversation.")
+    logger.info("User %s cancelled a conversation.", update.effective_user.id)
     return ConversationHandler.END
 
 
-def main():
-    """Starts the Telegram bot application."""
-    # Ensure BOT_TOKEN is loaded
-    if not BOT_TOKEN:
-        logger.error("BOT_TOKEN environment variable not set. Please set it in your .env file.")
-        print("Error: BOT_TOKEN environment variable not set. Please set it in your .env file.")
-        return
+def reject_other_shards(shard_index):
+    """Returns a handler that stops updates of users owned by another shard (should the router misroute one)."""
+    async def reject(update: Update, context: ContextTypes.DEFAULT_TYPE):
+        user = update.effective_user
+        if user is not None and shard_of(user.id) != shard_index:
+            logger.warning("Dropped update %s of user %s: owned by shard %s.", update.update_id, user.id, shard_of(user.id))
+            raise ApplicationHandlerStop
+    return reject
 
-    if not TELEGRAM_ADMIN_GROUP_ID:
-        logger.warning("TELEGRAM_ADMIN_GROUP_ID environment variable not set. Resume forwarding will not work.")
-        print("Warning: TELEGRAM_ADMIN_GROUP_ID not set. Resume forwarding will be disabled.")
 
-    # Create the Application and pass your bot's token.
-    application = Application.builder().token(BOT_TOKEN).build()
+async def shutdown_database(application: Application):
+    """Drains the database worker pool when the bot stops."""
+    logger.info("Database executor stats at shutdown: %s", jobs_bot.executor.stats())
+    jobs_bot.close()
 
+
+def add_handlers(application, shard_index=None):
+    """Registers the bot's handlers; with a shard_index, updates of other shards' users are dropped first."""
     # Define the ConversationHandler for profile creation
     profile_conv_handler = ConversationHandler(
         entry_points=[MessageHandler(filters.Regex("^📝 Create/Update Profile$"), create_profile)],
@@ -602,9 +758,13 @@ def main():
             # Accepts only document
         },
         fallbacks=[CommandHandler('cancel', cancel)],  # Allow users to cancel the conversation
+        name='profile',
+        persistent=True,  # a half-finished profile survives a restart (see persistence.py)
     )
 
     # Register handlers
+    if shard_index is not None:
+        application.add_handler(TypeHandler(Update, reject_other_shards(shard_index)), group=-1)
     application.add_handler(CommandHandler("start", start))
     application.add_handler(CommandHandler("help", help_command))
     application.add_handler(profile_conv_handler)  # Add the conversation handler
@@ -612,9 +772,92 @@ def main():
                                            button_handler))  # Handles all text messages that are not commands
     application.add_handler(CallbackQueryHandler(job_callback))  # Handles inline keyboard button presses
 
+
+def register_metrics(application, persistence):
+    """Queue depths and cache/batching counters, read each time the metrics endpoint is scraped."""
+    metrics.gauge('bot_updates_in_flight', 'Updates being handled right now.',
+                  lambda: application.update_processor.current_concurrent_updates)
+    metrics.gauge('bot_db_executor_queued', 'Database calls waiting for an executor thread.',
+                  jobs_bot.executor.queue_depth)
+    metrics.gauge('bot_db_executor_running', 'Database calls running on executor threads.',
+                  lambda: jobs_bot.executor.stats()['running'])
+    metrics.gauge('bot_write_queue_pending', 'Writes waiting for the next group commit.',
+                  lambda: jobs_bot.writes.stats()['pending'])
+    metrics.gauge('bot_write_queue_batches_total', 'Group commits of the write queue.',
+                  lambda: jobs_bot.writes.stats()['batches'], kind='counter')
+    metrics.gauge('bot_write_queue_writes_total', 'Writes committed by the write queue.',
+                  lambda: jobs_bot.writes.stats()['completed'], kind='counter')
+    metrics.gauge('bot_persistence_pending', 'Conversation/user_data changes not yet written.',
+                  lambda: persistence.stats()['pending'])
+    metrics.gauge('bot_db_pool_in_use', 'Pooled database connections checked out.',
+                  lambda: jobs_bot.pool.stats()['in_use'])
+    metrics.gauge('bot_profile_cache_hits_total', 'Profile lookups answered from memory.',
+                  lambda: jobs_bot.profile_cache.hits, kind='counter')
+    metrics.gauge('bot_profile_cache_misses_total', 'Profile lookups that went to the database.',
+                  lambda: jobs_bot.profile_cache.misses, kind='counter')
+    metrics.gauge('bot_application_history_renders_total', '"My Applications" histories read and rendered.',
+                  lambda: jobs_bot.applications_cache.stats()['renders'], kind='counter')
+
+
+def main():
+    """Starts the Telegram bot application."""
+    parser = argparse.ArgumentParser(description="Jobs Bot")
+    parser.add_argument('--shard', type=int, default=0,
+                        help="index of this worker when BOT_SHARD_COUNT > 1 (see sharding.py)")
+    shard_index = parser.parse_args().shard
+
+    # Ensure BOT_TOKEN is loaded
+    if not BOT_TOKEN:
+        logger.error("BOT_TOKEN environment variable not set. Please set it in your .env file.")
+        print("Error: BOT_TOKEN environment variable not set. Please set it in your .env file.")
+        return
+
+    if not TELEGRAM_ADMIN_GROUP_ID:
+        logger.warning("TELEGRAM_ADMIN_GROUP_ID environment variable not set. Resume forwarding will not work.")
+        print("Warning: TELEGRAM_ADMIN_GROUP_ID not set. Resume forwarding will be disabled.")
+
+    if BOT_MODE == 'webhook' and not WEBHOOK_URL:
+        logger.error("BOT_MODE is 'webhook' but WEBHOOK_URL is not set. Please set it in your .env file.")
+        print("Error: BOT_MODE is 'webhook' but WEBHOOK_URL is not set. Please set it in your .env file.")
+        return
+
+    sharded = BOT_SHARD_COUNT > 1
+    if sharded and (BOT_MODE != 'webhook' or not 0 <= shard_index < BOT_SHARD_COUNT):
+        logger.error("Sharding needs BOT_MODE='webhook' and --shard between 0 and BOT_SHARD_COUNT - 1.")
+        print("Error: sharding needs BOT_MODE='webhook' and --shard between 0 and BOT_SHARD_COUNT - 1.")
+        return
+
+    # Conversation states and user_data survive restarts; each shard loads only its own users
+    persistence = SQLitePersistence(jobs_bot.pool, jobs_bot.executor, shard_index, BOT_SHARD_COUNT)
+
+    # Create the Application and pass your bot's token.
+    builder = Application.builder().token(BOT_TOKEN).persistence(persistence).post_shutdown(shutdown_database)
+    builder = builder.concurrent_updates(PerUserUpdateProcessor(CONCURRENT_UPDATES))
+    if TELEGRAM_API_URL:
+        builder = builder.base_url(f"{TELEGRAM_API_URL.rstrip('/')}/bot").base_file_url(
+            f"{TELEGRAM_API_URL.rstrip('/')}/file/bot")
+    if METRICS_ENABLED:
+        builder = builder.request(TimedHTTPXRequest())  # same transport as PTB's default, timed per API method
+    application = builder.build()
+
+    add_handlers(application, shard_index if sharded else None)
+
+    if METRICS_ENABLED:
+        register_metrics(application, persistence)
+        # Each shard is a separate process with its own numbers, so each gets its own port
+        start_metrics_server(BOT_METRICS_PORT + (shard_index if sharded else 0))
+
     # Start the Bot
-    print("🤖 Jobs Bot is starting...")
-    application.run_polling(allowed_updates=Update.ALL_TYPES)  # Poll for updates from Telegram
+    if BOT_MODE == 'webhook':
+        # Sharded workers listen behind the router (sharding.py), each on its own port
+        port = shard_port(shard_index) if sharded else WEBHOOK_PORT
+        print(f"🤖 Jobs Bot is starting (webhook on {WEBHOOK_LISTEN}:{port}/{WEBHOOK_PATH})...")
+        application.run_webhook(listen=WEBHOOK_LISTEN, port=port, url_path=WEBHOOK_PATH,
+                                webhook_url=WEBHOOK_URL, secret_token=WEBHOOK_SECRET_TOKEN,
+                                allowed_updates=ALLOWED_UPDATES)  # Receive updates pushed by Telegram
+    else:
+        print("🤖 Jobs Bot is starting...")
+        application.run_polling(allowed_updates=ALLOWED_UPDATES)  # Poll for updates from Telegram
 
 
 if __name__ == '__main__':
@@ -0,0 +1,201 @@
+"""
+In-memory cache of the active jobs for the bot.
+
+The job list only changes when an admin edits it in the portal, yet every
+"View Jobs" press and job button used to query it again. JobsCache keeps the
+active jobs, a per-id map and the prebuilt inline keyboards in a snapshot
+tagged with the 'jobs' data version (see DataVersionWatcher); a write in
+either process bumps the version and the next read rebuilds the snapshot.
+
+The list is shown JOB_LIST_PAGE_SIZE jobs at a time with Prev/Next buttons
+(callback data "jp:<page>"). A page's keyboard is built the first time
+anyone asks for it and then shared by every user until the jobs change, so
+turning a page is a dictionary lookup and an edit of the keyboard alone.
+Users with recommendations see them starred first and every other job once
+after them, paged the same way (see feed_markup).
+
+Each snapshot also indexes the jobs' titles and requirements by term (see
+shared/matching.py) to rank a user's personal job feed. Term vectors of jobs
+whose text didn't change are carried over from the previous snapshot.
+"""
+import itertools
+import os
+import threading
+
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+
+from shared.matching import TermIndex, document_vector, term_counts
+
+JOB_LIST_PAGE_SIZE = int(os.getenv('JOB_LIST_PAGE_SIZE', '8'))  # job buttons per page of the bot's job list
+PAGE_CALLBACK_PREFIX = 'jp:'
+NOOP_CALLBACK = 'noop'  # the page counter between Prev and Next
+
+
+def job_list_button(job):
+    """The inline button that opens a job's details from a job list."""
+    return InlineKeyboardButton(f"💼 {job['title']} - {job['location']}", callback_data=f"job_{job['id']}")
+
+
+def recommended_job_button(job):
+    """The inline button of a job recommended for the user; it opens the same details as job_list_button."""
+    return InlineKeyboardButton(f"⭐ {job['title']} - {job['location']}", callback_data=f"job_{job['id']}")
+
+
+def page_callback(page, prefix=PAGE_CALLBACK_PREFIX):
+    """Callback data that shows a page of the job list (or of another paged list, by prefix)."""
+    return f'{prefix}{page}'
+
+
+def parse_page_callback(data, prefix=PAGE_CALLBACK_PREFIX):
+    """The page number in a "jp:<page>" (or "<prefix><page>") callback, or None if the data isn't one."""
+    if not data.startswith(prefix):
+        return None
+    try:
+        return int(data[len(prefix):])
+    except ValueError:
+        return None
+
+
+def page_navigation_row(page, page_count, prefix=PAGE_CALLBACK_PREFIX):
+    """Prev / "page of pages" / Next buttons, or no row at all for a single page."""
+    if page_count <= 1:
+        return []
+    row = []
+    if page > 0:
+        row.append(InlineKeyboardButton("◀️ Prev", callback_data=page_callback(page - 1, prefix)))
+    row.append(InlineKeyboardButton(f"{page + 1}/{page_count}", callback_data=NOOP_CALLBACK))
+    if page < page_count - 1:
+        row.append(InlineKeyboardButton("Next ▶️", callback_data=page_callback(page + 1, prefix)))
+    return [row]
+
+
+def job_details_markup(job_id, has_profile, page=0):
+    """Keyboard under a job's details: Apply Now (or Create Profile First) and Back to Jobs (the job's page)."""
+    if has_profile:
+        first = InlineKeyboardButton("✅ Apply Now", callback_data=f"apply_{job_id}")
+    else:
+        first = InlineKeyboardButton("📝 Create Profile First", callback_data="create_profile")
+    return InlineKeyboardMarkup([[first], [InlineKeyboardButton("🔙 Back to Jobs", callback_data=page_callback(page))]])
+
+
+class JobsSnapshot:
+    """The active jobs at one data version, with their keyboards built once."""
+
+    def __init__(self, version, jobs, previous=None):
+        self.version = version
+        self.jobs = jobs
+        self.by_id = {job['id']: job for job in jobs}
+        # Requirement terms -> job ids; job id -> ((title, requirements), vector) for the next snapshot to reuse
+        self.index = TermIndex()
+        self.vectors = {}
+        for job in jobs:
+            text = (job['title'], job['requirements'])
+            reused = previous.vectors.get(job['id']) if previous is not None else None
+            vector = reused[1] if reused is not None and reused[0] == text else document_vector(term_counts(*text))
+            self.vectors[job['id']] = (text, vector)
+            self.index.index(job['id'], vector)
+        self.list_buttons = {job['id']: job_list_button(job) for job in jobs}
+        self.page_size = max(1, JOB_LIST_PAGE_SIZE)
+        self.page_count = max(1, -(-len(jobs) // self.page_size))
+        self.position = {job['id']: i for i, job in enumerate(jobs)}
+        self.page_of = {job_id: i // self.page_size for job_id, i in self.position.items()}
+        self._pages = {}  # page -> keyboard, built on first use and shared by every user
+        # (job_id, has_profile) -> details keyboard
+        self.details_markups = {(job['id'], has_profile): job_details_markup(job['id'], has_profile,
+                                                                             self.page_of[job['id']])
+                                for job in jobs for has_profile in (True, False)}
+
+    def clamp_page(self, page):
+        """The nearest existing page (the list may have shrunk since the keyboard was sent)."""
+        return min(max(page, 0), self.page_count - 1)
+
+    def page_jobs(self, page):
+        """The jobs on one page, newest first."""
+        start = page * self.page_size
+        return self.jobs[start:start + self.page_size]
+
+    def page_markup(self, page):
+        """Keyboard of one page of the job list, shared by every user at this version."""
+        page = self.clamp_page(page)
+        markup = self._pages.get(page)
+        if markup is None:
+            rows = [[self.list_buttons[job['id']]] for job in self.page_jobs(page)]
+            markup = self._pages[page] = InlineKeyboardMarkup(rows + page_navigation_row(page, self.page_count))
+        return markup
+
+    def details_markup(self, job_id, has_profile, recommended=()):
+        """Details keyboard for an active job, prebuilt unless the job is on another page of the user's own list."""
+        if recommended and job_id in self.by_id:
+            page = self.feed_page_of(recommended, job_id)
+            if page != self.page_of[job_id]:
+                return job_details_markup(job_id, has_profile, page)
+        markup = self.details_markups.get((job_id, has_profile))
+        return markup if markup is not None else job_details_markup(job_id, has_profile)
+
+    def recommend(self, counts, limit):
+        """Ids of the (at most `limit`) jobs whose requirements best match a profile's term counts, best first."""
+        return [match.id for match in self.index.rank(counts, limit)]
+
+    def feed_markup(self, recommended, page=0):
+        """
+        One page of the list of a user with recommendations: the recommended jobs (starred) first,
+        then every other job in the usual order, so each job is listed once and pages keep their size.
+        """
+        page = self.clamp_page(page)
+        start, stop = page * self.page_size, (page + 1) * self.page_size
+        rows = [[recommended_job_button(self.by_id[job_id])] for job_id in recommended[start:stop]]
+        if len(rows) < self.page_size:
+            chosen = set(recommended)
+            rest = (job for job in self.jobs if job['id'] not in chosen)
+            skip = max(0, start - len(recommended))
+            rows += [[self.list_buttons[job['id']]]
+                     for job in itertools.islice(rest, skip, skip + self.page_size - len(rows))]
+        return InlineKeyboardMarkup(rows + page_navigation_row(page, self.page_count))
+
+    def feed_page_of(self, recommended, job_id):
+        """The page an active job is on in the list of a user with these recommendations."""
+        if job_id in recommended:
+            return recommended.index(job_id) // self.page_size
+        position = self.position[job_id]
+        ahead = sum(1 for other in recommended if self.position[other] < position)  # moved up to the starred block
+        return (len(recommended) + position - ahead) // self.page_size
+
+
+class JobsCache:
+    """Versioned snapshot of the active jobs, rebuilt only after the jobs table changed."""
+
+    def __init__(self, pool, watcher):
+        self.pool = pool
+        self.watcher = watcher
+        self._snapshot = None
+        self._reload_lock = threading.Lock()
+
+    def peek(self):
+        """Returns the snapshot if it is known to be current, without blocking or touching the database."""
+        snapshot = self._snapshot
+        if snapshot is None:
+            return None
+        version = self.watcher.current(blocking=False)
+        if version is None or version != snapshot.version:
+            return None
+        return snapshot
+
+    def get(self):
+        """Returns the current snapshot, reloading it from the database if the jobs changed."""
+        version = self.watcher.current()
+        snapshot = self._snapshot
+        if snapshot is not None and snapshot.version == version:
+            return snapshot
+        with self._reload_lock:
+            snapshot = self._snapshot
+            if snapshot is None or snapshot.version != version:
+                snapshot = self._snapshot = self.pool.run(self._load, snapshot)
+            return snapshot
+
+    def _load(self, conn, previous):
+        """Reads the version and the active jobs in one read transaction, so they always match."""
+        conn.execute('BEGIN')
+        row = conn.execute("SELECT version FROM data_versions WHERE name = 'jobs'").fetchone()
+        jobs = conn.execute("SELECT * FROM jobs WHERE is_active = 1 ORDER BY created_at DESC").fetchall()
+        conn.commit()
+        return JobsSnapshot(row[0] if row else 0, jobs, previous)
@@ -0,0 +1,187 @@
+"""
+Prometheus-style metrics for the bot process.
+
+Set BOT_METRICS_PORT to expose http://BOT_METRICS_LISTEN:BOT_METRICS_PORT/metrics
+(a sharded worker listens on BOT_METRICS_PORT + its shard index). It reports:
+
+- update handling latency, in total and per handler (@timed_handler),
+- Bot API call latency and errors per API method (TimedHTTPXRequest),
+- time spent in the database per JobsBot method (@timed_db),
+- queue depths and cache counters, read when the endpoint is scraped.
+
+With BOT_METRICS_PORT unset the decorators return the functions unchanged and
+the default request class is used, so disabled metrics cost nothing.
+"""
+import contextvars
+import functools
+import logging
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from telegram.request import HTTPXRequest
+
+from shared.metrics import LatencyHistogram, metric_header, metric_line, histogram_lines
+
+logger = logging.getLogger(__name__)
+
+BOT_METRICS_PORT = int(os.getenv('BOT_METRICS_PORT') or 0)  # 0 = metrics disabled
+BOT_METRICS_LISTEN = os.getenv('BOT_METRICS_LISTEN', '127.0.0.1')
+METRICS_ENABLED = BOT_METRICS_PORT > 0
+
+
+class BotMetrics:
+    """Thread-safe registry of the bot's histograms, plus gauges computed at scrape time."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms = {}  # (metric name, label value) -> LatencyHistogram
+        self._gauges = []  # (name, help, kind, function returning a number)
+
+    def observe(self, name, label, seconds, error=False):
+        """Records one duration in the histogram of metric `name` for `label`."""
+        with self._lock:
+            histogram = self._histograms.get((name, label))
+            if histogram is None:
+                histogram = self._histograms[(name, label)] = LatencyHistogram()
+            histogram.observe(seconds, error)
+
+    def gauge(self, name, help_text, func, kind='gauge'):
+        """Registers a value read from func() on every scrape (kind 'counter' for ever-increasing ones)."""
+        self._gauges.append((name, help_text, kind, func))
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format."""
+        with self._lock:
+            families = {}
+            for (name, label), histogram in sorted(self._histograms.items()):
+                families.setdefault(name, []).append((label, histogram))
+            lines = []
+            for name, (label_name, help_text) in HISTOGRAMS.items():
+                entries = families.get(name, [])
+                lines += metric_header(name, 'histogram', help_text)
+                for label, histogram in entries:
+                    labels = {label_name: label} if label_name else None
+                    lines += histogram_lines(name, histogram, labels)
+                lines += metric_header(f'{name}_errors_total', 'counter', f'Failures counted in {name}.')
+                for label, histogram in entries:
+                    labels = {label_name: label} if label_name else None
+                    lines.append(metric_line(f'{name}_errors_total', histogram.errors, labels))
+        for name, help_text, kind, func in self._gauges:
+            try:
+                value = func()
+            except Exception as e:
+                logger.warning("Could not read metric %s: %s", name, e)
+                continue
+            lines += metric_header(name, kind, help_text)
+            lines.append(metric_line(name, value))
+        return '\n'.join(lines) + '\n'
+
+
+# Histogram metric -> (label name, help text)
+HISTOGRAMS = {
+    'bot_update_duration_seconds': (None, 'Time from an update being picked up to its handlers finishing.'),
+    'bot_handler_duration_seconds': ('handler', 'Handler latency by handler function.'),
+    'bot_telegram_api_duration_seconds': ('method', 'Bot API call latency by API method.'),
+    'bot_db_duration_seconds': ('method', 'Time spent in the database by JobsBot method.'),
+}
+
+metrics = BotMetrics()
+
+
+# Set while a timed handler runs, so a handler called from another one (e.g. /help from the menu) isn't counted twice
+_in_handler = contextvars.ContextVar('in_timed_handler', default=False)
+
+
+def timed_handler(func):
+    """Decorator for registered async handlers: records their latency under the function's name."""
+    if not METRICS_ENABLED:
+        return func
+    name = func.__name__
+
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        if _in_handler.get():
+            return await func(*args, **kwargs)
+        token = _in_handler.set(True)
+        started = time.perf_counter()
+        error = False
+        try:
+            return await func(*args, **kwargs)
+        except BaseException:
+            error = True
+            raise
+        finally:
+            metrics.observe('bot_handler_duration_seconds', name, time.perf_counter() - started, error)
+            _in_handler.reset(token)
+    return wrapper
+
+
+def timed_db(func):
+    """Decorator for blocking JobsBot methods: records the time they spend under the method's name."""
+    if not METRICS_ENABLED:
+        return func
+    name = func.__name__.lstrip('_')
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        error = False
+        try:
+            return func(*args, **kwargs)
+        except BaseException:
+            error = True
+            raise
+        finally:
+            metrics.observe('bot_db_duration_seconds', name, time.perf_counter() - started, error)
+    return wrapper
+
+
+def observe_update(seconds, error=False):
+    """Records the total handling time of one update (called by the update processor)."""
+    if METRICS_ENABLED:
+        metrics.observe('bot_update_duration_seconds', '', seconds, error)
+
+
+class TimedHTTPXRequest(HTTPXRequest):
+    """PTB's default HTTP transport, timing every Bot API call by method."""
+
+    async def do_request(self, url, method, request_data=None, read_timeout=None, write_timeout=None,
+                         connect_timeout=None, pool_timeout=None):
+        api_method = url.rsplit('/', 1)[-1]
+        started = time.perf_counter()
+        try:
+            status, payload = await super().do_request(url, method, request_data, read_timeout=read_timeout,
+                                                       write_timeout=write_timeout, connect_timeout=connect_timeout,
+                                                       pool_timeout=pool_timeout)
+        except BaseException:
+            metrics.observe('bot_telegram_api_duration_seconds', api_method, time.perf_counter() - started, True)
+            raise
+        metrics.observe('bot_telegram_api_duration_seconds', api_method, time.perf_counter() - started, status >= 400)
+        return status, payload
+
+
+def start_metrics_server(port=BOT_METRICS_PORT, listen=BOT_METRICS_LISTEN):
+    """Serves GET /metrics from a daemon thread; returns the server."""
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split('?')[0] not in ('/metrics', '/'):
+                self.send_error(404)
+                return
+            body = metrics.render().encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass  # scrapes every few seconds would flood the bot's log
+
+    server = ThreadingHTTPServer((listen, port), MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='metrics-server', daemon=True).start()
+    logger.info("Serving bot metrics on http://%s:%s/metrics", listen, port)
+    return server
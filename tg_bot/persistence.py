@@ -0,0 +1,180 @@
+"""
+SQLite-backed persistence for the bot's conversations and user_data.
+
+Half-finished profiles (context.user_data['profile'] plus the profile
+ConversationHandler's state) survive restarts and can be owned by one of
+several bot worker processes (see sharding.py). PTB hands changed data to the
+persistence every `update_interval` seconds; the changes are only buffered
+here and committed together in one transaction after a short debounce delay,
+instead of one write per message.
+"""
+import asyncio
+import json
+import logging
+import os
+
+from telegram.ext import BasePersistence, PersistenceInput
+
+logger = logging.getLogger(__name__)
+
+PERSISTENCE_INTERVAL = float(os.getenv('BOT_PERSISTENCE_INTERVAL', '5'))  # seconds between PTB's persistence sweeps
+FLUSH_DELAY = 0.5  # seconds to wait for more changes before committing a batch
+FLUSH_MAX_BATCH = 500  # pending changes that trigger an immediate commit
+
+
+class SQLitePersistence(BasePersistence):
+    """
+    Stores user_data and conversation states in the bot_user_data and
+    bot_conversations tables (migration 8). chat_data, bot_data and callback
+    data are not used by the bot and are not stored.
+
+    With shard_count > 1 only the users of this worker's shard
+    (user_id % shard_count == shard_index) are loaded.
+    """
+
+    def __init__(self, pool, executor, shard_index=0, shard_count=1, update_interval=PERSISTENCE_INTERVAL):
+        super().__init__(store_data=PersistenceInput(bot_data=False, chat_data=False, callback_data=False),
+                         update_interval=update_interval)
+        self.pool = pool
+        self.executor = executor
+        self.shard_index = shard_index
+        self.shard_count = max(1, shard_count)
+        self._pending_user_data = {}  # user_id -> JSON text, or None to delete
+        self._pending_conversations = {}  # (name, key JSON) -> (user_id, state JSON or None to delete)
+        self._flush_task = None
+        self._flush_lock = asyncio.Lock()
+        self._metrics = {'flushes': 0, 'rows_written': 0, 'max_batch': 0}
+
+    # Loading (once, when the application starts)
+
+    async def get_user_data(self):
+        rows = await self.executor.run(self.pool.run, self._load_user_data)
+        return {user_id: json.loads(data) for user_id, data in rows}
+
+    def _load_user_data(self, conn):
+        """Reads the user_data rows of this shard."""
+        return conn.execute('SELECT user_id, data FROM bot_user_data WHERE user_id % ? = ?',
+                            (self.shard_count, self.shard_index)).fetchall()
+
+    async def get_conversations(self, name):
+        rows = await self.executor.run(self.pool.run, self._load_conversations, name)
+        return {tuple(json.loads(key)): json.loads(state) for key, state in rows}
+
+    def _load_conversations(self, conn, name):
+        """Reads the conversation states of this shard for one ConversationHandler."""
+        return conn.execute('''
+            SELECT key, state FROM bot_conversations
+            WHERE name = ? AND (user_id IS NULL OR user_id % ? = ?)
+        ''', (name, self.shard_count, self.shard_index)).fetchall()
+
+    async def get_chat_data(self):
+        return {}
+
+    async def get_bot_data(self):
+        return {}
+
+    async def get_callback_data(self):
+        return None
+
+    # Buffered updates
+
+    async def update_user_data(self, user_id, data):
+        self._pending_user_data[user_id] = json.dumps(data)
+        self._schedule_flush()
+
+    async def drop_user_data(self, user_id):
+        self._pending_user_data[user_id] = None
+        self._schedule_flush()
+
+    async def update_conversation(self, name, key, new_state):
+        # Keys are (chat_id, user_id) for the per-chat, per-user profile conversation
+        user_id = key[-1] if key and isinstance(key[-1], int) else None
+        state = json.dumps(new_state) if new_state is not None else None
+        self._pending_conversations[(name, json.dumps(list(key)))] = (user_id, state)
+        self._schedule_flush()
+
+    async def update_chat_data(self, chat_id, data):
+        pass
+
+    async def drop_chat_data(self, chat_id):
+        pass
+
+    async def update_bot_data(self, data):
+        pass
+
+    async def update_callback_data(self, data):
+        pass
+
+    # Each user is owned by one worker process, so there is nothing newer elsewhere to refresh from
+
+    async def refresh_user_data(self, user_id, user_data):
+        pass
+
+    async def refresh_chat_data(self, chat_id, chat_data):
+        pass
+
+    async def refresh_bot_data(self, bot_data):
+        pass
+
+    # Flushing
+
+    def _schedule_flush(self):
+        """Commits the pending changes soon (debounced), or right away once the batch is large."""
+        pending = len(self._pending_user_data) + len(self._pending_conversations)
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._delayed_flush(0 if pending >= FLUSH_MAX_BATCH else FLUSH_DELAY))
+
+    async def _delayed_flush(self, delay):
+        await asyncio.sleep(delay)
+        try:
+            await self._flush_pending()
+        except Exception:
+            logger.exception("Failed to write bot persistence data; will retry with the next batch.")
+
+    async def _flush_pending(self):
+        """Writes everything buffered so far in one transaction."""
+        async with self._flush_lock:
+            user_data, self._pending_user_data = self._pending_user_data, {}
+            conversations, self._pending_conversations = self._pending_conversations, {}
+            if not user_data and not conversations:
+                return
+            try:
+                await self.executor.run(self.pool.run, self._write, user_data, conversations)
+            except Exception:
+                # Put the batch back (without overwriting anything newer) so the next flush retries it
+                self._pending_user_data = {**user_data, **self._pending_user_data}
+                self._pending_conversations = {**conversations, **self._pending_conversations}
+                raise
+            batch = len(user_data) + len(conversations)
+            self._metrics['flushes'] += 1
+            self._metrics['rows_written'] += batch
+            self._metrics['max_batch'] = max(self._metrics['max_batch'], batch)
+
+    def _write(self, conn, user_data, conversations):
+        """Upserts/deletes one batch of user_data and conversation states."""
+        conn.executemany('''
+            INSERT INTO bot_user_data (user_id, data) VALUES (?, ?)
+            ON CONFLICT (user_id) DO UPDATE SET data = excluded.data, updated_at = CURRENT_TIMESTAMP
+        ''', [(user_id, data) for user_id, data in user_data.items() if data is not None])
+        conn.executemany('DELETE FROM bot_user_data WHERE user_id = ?',
+                         [(user_id,) for user_id, data in user_data.items() if data is None])
+        conn.executemany('''
+            INSERT INTO bot_conversations (name, key, user_id, state) VALUES (?, ?, ?, ?)
+            ON CONFLICT (name, key) DO UPDATE SET state = excluded.state, updated_at = CURRENT_TIMESTAMP
+        ''', [(name, key, user_id, state) for (name, key), (user_id, state) in conversations.items()
+              if state is not None])
+        conn.executemany('DELETE FROM bot_conversations WHERE name = ? AND key = ?',
+                         [(name, key) for (name, key), (_, state) in conversations.items() if state is None])
+
+    async def flush(self):
+        """Writes anything still buffered; called by PTB when the bot shuts down."""
+        if self._flush_task is not None and not self._flush_task.done():
+            self._flush_task.cancel()
+        await self._flush_pending()
+        logger.info("Persistence stats at shutdown: %s", self.stats())
+
+    def stats(self):
+        """Batch counters, to check that writes are being coalesced."""
+        stats = dict(self._metrics)
+        stats['pending'] = len(self._pending_user_data) + len(self._pending_conversations)
+        return stats
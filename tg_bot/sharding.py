@@ -0,0 +1,102 @@
+"""
+Splitting the bot's update load across several worker processes.
+
+Telegram delivers all updates to a single webhook URL, so with
+BOT_SHARD_COUNT > 1 this module runs as a small router in front of the
+workers:
+
+    python sharding.py            # the router, on WEBHOOK_LISTEN:WEBHOOK_PORT/WEBHOOK_PATH
+    python bot.py --shard 0       # worker 0, on WEBHOOK_PORT + 1
+    python bot.py --shard 1       # worker 1, on WEBHOOK_PORT + 2 ...
+
+Every update goes to the worker that owns its user (user_id % BOT_SHARD_COUNT),
+so a user's conversation state, user_data and cached profile always live in
+one process. Workers persist conversations in SQLite (see persistence.py), so
+a restarted worker picks up where it left off.
+"""
+import json
+import logging
+import os
+import sys
+
+from dotenv import load_dotenv
+
+if __name__ == '__main__':
+    # Same .env as bot.py when started as the router script
+    load_dotenv(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'env', '.env'), override=True)
+
+from webhook_config import WEBHOOK_LISTEN, WEBHOOK_PORT, WEBHOOK_PATH, WEBHOOK_SECRET_TOKEN  # noqa: E402
+
+logger = logging.getLogger(__name__)
+
+BOT_SHARD_COUNT = max(1, int(os.getenv('BOT_SHARD_COUNT', '1')))  # number of bot worker processes
+
+# Update fields that carry the sender ("from") in the update types the bot subscribes to
+_SENDER_FIELDS = ('message', 'edited_message', 'callback_query')
+
+
+def shard_of(user_id, shard_count=BOT_SHARD_COUNT):
+    """The shard that owns a Telegram user."""
+    return user_id % shard_count
+
+
+def shard_port(shard_index):
+    """Port of a worker's local webhook listener (the router itself uses WEBHOOK_PORT)."""
+    return WEBHOOK_PORT + 1 + shard_index
+
+
+def update_user_id(update):
+    """The sender's user id of a raw update (a JSON dict), or None."""
+    for field in _SENDER_FIELDS:
+        sender = (update.get(field) or {}).get('from')
+        if sender:
+            return sender.get('id')
+    return None
+
+
+def run_router():
+    """Receives Telegram's webhook requests and forwards each update to the worker that owns its user."""
+    # tornado comes with python-telegram-bot[webhooks]; only the router and webhook mode need it
+    import tornado.ioloop
+    import tornado.web
+    from tornado.httpclient import AsyncHTTPClient, HTTPClientError
+
+    client = AsyncHTTPClient(max_clients=100)
+    headers = {'Content-Type': 'application/json'}
+    if WEBHOOK_SECRET_TOKEN:
+        headers['X-Telegram-Bot-Api-Secret-Token'] = WEBHOOK_SECRET_TOKEN
+
+    class UpdateRouter(tornado.web.RequestHandler):
+        async def post(self):
+            if WEBHOOK_SECRET_TOKEN and \
+                    self.request.headers.get('X-Telegram-Bot-Api-Secret-Token') != WEBHOOK_SECRET_TOKEN:
+                raise tornado.web.HTTPError(403)
+            try:
+                update = json.loads(self.request.body)
+            except ValueError:
+                raise tornado.web.HTTPError(400)
+            user_id = update_user_id(update)
+            shard = shard_of(user_id) if user_id is not None else 0
+            url = f"http://127.0.0.1:{shard_port(shard)}/{WEBHOOK_PATH}"
+            try:
+                await client.fetch(url, method='POST', body=self.request.body, headers=headers, request_timeout=30)
+            except (HTTPClientError, OSError) as e:
+                # A non-2xx answer makes Telegram redeliver the update later
+                logger.error("Could not forward update %s to shard %s: %s", update.get('update_id'), shard, e)
+                raise tornado.web.HTTPError(502)
+
+    app = tornado.web.Application([(rf'/{WEBHOOK_PATH}/?', UpdateRouter)])
+    app.listen(WEBHOOK_PORT, address=WEBHOOK_LISTEN)
+    print(f"🔀 Routing updates from {WEBHOOK_LISTEN}:{WEBHOOK_PORT}/{WEBHOOK_PATH} to {BOT_SHARD_COUNT} bot shard(s) "
+          f"on ports {shard_port(0)}-{shard_port(BOT_SHARD_COUNT - 1)}...")
+    tornado.ioloop.IOLoop.current().start()
+
+
+if __name__ == '__main__':
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+    from shared.logging_setup import setup_logging
+    setup_logging('router')
+    if BOT_SHARD_COUNT < 2:
+        print("BOT_SHARD_COUNT is 1; run bot.py directly, no router is needed.")
+        sys.exit(1)
+    run_router()
@@ -0,0 +1,47 @@
+"""
+Concurrent update processing for the bot that keeps each user's updates in order.
+
+With concurrent updates enabled, PTB would run two quick messages from the
+same user at the same time, and the profile conversation could then see its
+steps out of order. PerUserUpdateProcessor runs updates from different users
+concurrently (up to max_concurrent_updates) and serializes the updates of any
+single user.
+"""
+import asyncio
+import time
+
+from telegram.ext import BaseUpdateProcessor
+
+from metrics import observe_update
+
+
+class PerUserUpdateProcessor(BaseUpdateProcessor):
+    """Processes updates concurrently across users and one at a time, in arrival order, per user."""
+
+    def __init__(self, max_concurrent_updates):
+        super().__init__(max_concurrent_updates)
+        self._user_locks = {}  # user id -> [asyncio.Lock, number of that user's updates waiting or running]
+
+    async def do_process_update(self, update, coroutine):
+        started = time.perf_counter()
+        user = getattr(update, 'effective_user', None)
+        if user is None:
+            await coroutine
+            observe_update(time.perf_counter() - started)
+            return
+        entry = self._user_locks.setdefault(user.id, [asyncio.Lock(), 0])
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                await coroutine
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self._user_locks[user.id]  # don't keep a lock for every user ever seen
+            observe_update(time.perf_counter() - started)  # includes waiting for the user's earlier updates
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
@@ -0,0 +1,14 @@
+"""
+Webhook mode settings (BOT_MODE='webhook').
+
+Telegram POSTs updates to WEBHOOK_URL, which a reverse proxy forwards to the
+local listener on WEBHOOK_LISTEN:WEBHOOK_PORT/WEBHOOK_PATH. Read from the
+environment, so load the .env before importing this module.
+"""
+import os
+
+WEBHOOK_URL = os.getenv('WEBHOOK_URL')  # full public HTTPS URL, e.g. https://bot.example.com/telegram
+WEBHOOK_LISTEN = os.getenv('WEBHOOK_LISTEN', '127.0.0.1')
+WEBHOOK_PORT = int(os.getenv('WEBHOOK_PORT', '8443'))
+WEBHOOK_PATH = os.getenv('WEBHOOK_PATH', 'telegram')
+WEBHOOK_SECRET_TOKEN = os.getenv('WEBHOOK_SECRET_TOKEN')  # Telegram echoes it in a header; other requests are rejected
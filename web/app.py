@@ -1,12 +1,17 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, session, jsonify, send_file
-import sqlite3
+from flask import Flask, render_template, request, redirect, url_for, flash, session, jsonify, send_file, \
+    Response, stream_with_context, abort, g
+import sys
 from datetime import datetime
 import hashlib
+import hmac
 import os
 from functools import wraps
 from dotenv import load_dotenv # find_dotenv is no longer strictly needed if we construct the path
-import requests  # For sending Telegram messages and downloading files
-import io  # For handling file downloads
+import requests  # For the exceptions raised by Telegram API calls
+import threading
+import time
+import mimetypes  # For guessing a downloaded resume's content type
+from urllib.parse import quote
 
 # Construct the path to the .env file relative to the current script (app.py)
 # app.py is in web/, .env is in env/ at project root
@@ -16,8 +21,32 @@ dotenv_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'en
 # raise_error_if_not_found=True is used here to ensure the file exists
 load_dotenv(dotenv_path, override=True, verbose=True) # Added override=True and verbose=True for debugging
 
+# Make the shared package at the project root importable when run as a script
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from shared.database import get_pool  # noqa: E402 (needs the .env loaded first)
+from shared.logging_setup import setup_logging  # noqa: E402
+from shared.migrations import migrate  # noqa: E402
+from shared.cache import TTLCache, DataVersionWatcher  # noqa: E402
+from shared.matching import MatchIndex, MATCH_SHORTLIST_SIZE  # noqa: E402
+from shared.stats import load_stats, load_popular_jobs  # noqa: E402
+from shared.search import match_expression, JOB_RANK, USER_RANK  # noqa: E402
+from shared.statuses import APPLICATION_STATUSES  # noqa: E402
+from pagination import paginate, page_size_arg  # noqa: E402
+from resume_cache import ResumeCache, CHUNK_SIZE  # noqa: E402
+from telegram_client import TelegramClient  # noqa: E402
+from broadcast import OutboxWorker, enqueue_broadcast, broadcast_progress  # noqa: E402
+from profiling import profiler, ProfiledConnection  # noqa: E402
+from export import EXPORT_FORMATS, APPLICATION_EXPORT_QUERY, USER_EXPORT_QUERY, export_stream  # noqa: E402
+from bulk_status import bulk_update_status  # noqa: E402
+
+# Log records are written by a background thread, not the request thread (see shared/logging_setup.py)
+setup_logging('portal')
+
 BOT_TOKEN = os.getenv('BOT_TOKEN')  # Get bot token for sending messages/downloading files
 
+# Every call to the Telegram API goes through this pooled, timed client (see telegram_client.py)
+telegram = TelegramClient(BOT_TOKEN)
+
 app = Flask(__name__)
 # Set a strong secret key for production. This is crucial for session security.
 app.secret_key = os.getenv('FLASK_SECRET_KEY', 'FALLBACK_SECRET_KEY')
@@ -34,26 +63,53 @@ def verify_password(password, hashed):
     """Verifies a plain-text password against a stored hash."""
     return hash_password(password) == hashed
 
+# Pooled WAL-mode connections to db/jobs_bot.db, shared with the bot's access layer
+db_pool = get_pool()
+
 def get_db_connection():
-    """Establishes and returns a database connection to jobs_bot.db."""
-    # Determine the path to the database file, now located in the 'db' directory
-    # It's two levels up from web/app.py, then into the 'db' folder
-    db_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'db', 'jobs_bot.db')
-    conn = sqlite3.connect(db_path)
-    conn.row_factory = sqlite3.Row
-    return conn
+    """Checks out a pooled connection to jobs_bot.db; conn.close() returns it to the pool."""
+    return db_pool.acquire()
+
+# Dashboard counters are trigger-maintained in the database; this cache absorbs page reloads and /api/stats polling
+STATS_CACHE_TTL = float(os.getenv('STATS_CACHE_TTL', '5'))  # seconds
+stats_cache = TTLCache(ttl=STATS_CACHE_TTL)
+
+def get_stats():
+    """Returns the dashboard counters, served from the stats cache when fresh."""
+    return stats_cache.get_or_load('stats', lambda: db_pool.run(load_stats))
+
+def get_popular_jobs():
+    """Returns the five active jobs with the most applications, served from the stats cache when fresh."""
+    return stats_cache.get_or_load('popular_jobs', lambda: db_pool.run(load_popular_jobs))
+
+# Totals for filtered list pages are only shown as "about N", so a short-lived cached COUNT(*) is enough
+COUNT_CACHE_TTL = float(os.getenv('COUNT_CACHE_TTL', '60'))  # seconds
+count_cache = TTLCache(ttl=COUNT_CACHE_TTL, maxsize=256)
+
+def approximate_count(count_query, params, counter=None):
+    """Returns a list page's total: a live dashboard counter when one matches the filters, else a cached COUNT(*)."""
+    if counter:
+        return get_stats()[counter]
+    return count_cache.get_or_load((count_query, tuple(params)),
+                                   lambda: db_pool.run(lambda conn: conn.execute(count_query, params).fetchone()[0]))
+
+def page_args():
+    """Reads the keyset pagination arguments (cursor, dir, per_page) from the query string."""
+    return {
+        'cursor': request.args.get('cursor'),
+        'direction': 'prev' if request.args.get('dir') == 'prev' else 'next',
+        'page_size': page_size_arg(request.args.get('per_page')),
+    }
+
+def wants_json():
+    """True when a list page was requested as JSON (?format=json)."""
+    return request.args.get('format') == 'json'
 
 def init_admin_db():
-    """Initializes admin-specific database tables and inserts a default admin if none exists."""
+    """Brings the database schema up to date and inserts a default admin if none exists."""
     conn = get_db_connection()
-    conn.execute('''
-        CREATE TABLE IF NOT EXISTS admins (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            username TEXT UNIQUE NOT NULL,
-            password_hash TEXT NOT NULL,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
+    # Tables and indexes (including admins) are created by the versioned migrations in shared/migrations.py
+    migrate(conn)
     cursor = conn.cursor()
     cursor.execute("SELECT COUNT(*) FROM admins")
     if cursor.fetchone()[0] == 0:
@@ -68,6 +124,46 @@ def init_admin_db():
 
 init_admin_db()
 
+# Candidate/job matching index over every profile; built in the background so startup isn't held up by it
+match_index = MatchIndex(db_pool, DataVersionWatcher(db_pool.db_path, 'users'))
+threading.Thread(target=match_index.refresh, name='match-index', daemon=True).start()
+
+@app.teardown_request
+def release_db_connection(exception=None):
+    """Returns a connection a handler left checked out (e.g. after an exception) to the pool."""
+    db_pool.reclaim()
+
+# Opt-in request/SQL profiling (see profiling.py); off by default because every query is wrapped while it's on
+PORTAL_PROFILING = os.getenv('PORTAL_PROFILING', 'False').lower() in ('true', '1', 't')  # default PORTAL_PROFILING = False
+PROFILING_METRICS_TOKEN = os.getenv('PROFILING_METRICS_TOKEN')  # lets a Prometheus scraper read /debug/metrics without logging in
+
+if PORTAL_PROFILING:
+    db_pool.connection_class = ProfiledConnection
+    profiler.pool = db_pool
+
+    @app.before_request
+    def start_request_profile():
+        """Starts recording this request's SQL statements."""
+        g.request_started = time.perf_counter()
+        profiler.start_request()
+
+    @app.after_request
+    def finish_request_profile(response):
+        """Adds the request to the route/statement totals and reports its timings in a Server-Timing header."""
+        if 'request_started' not in g:
+            return response
+        elapsed = time.perf_counter() - g.pop('request_started')
+        rule = request.url_rule.rule if request.url_rule else '(unmatched)'
+        db_seconds, queries = profiler.finish_request(request.method, rule, elapsed, response.status_code)
+        response.headers['Server-Timing'] = (f'app;dur={elapsed * 1000:.2f}, '
+                                             f'db;dur={db_seconds * 1000:.2f};desc="{queries} queries"')
+        return response
+
+    @app.teardown_request
+    def discard_request_profile(exception=None):
+        """Forgets the records of a request that failed before after_request ran."""
+        profiler.discard_request()
+
 def login_required(f):
     """Decorator to protect routes, redirecting unauthenticated users to the login page."""
     @wraps(f)
@@ -118,13 +214,7 @@ def logout():
 def dashboard():
     """Displays the admin dashboard with key statistics and recent activities."""
     conn = get_db_connection()
-    stats = {
-        'total_jobs': conn.execute('SELECT COUNT(*) FROM jobs').fetchone()[0],
-        'active_jobs': conn.execute('SELECT COUNT(*) FROM jobs WHERE is_active = 1').fetchone()[0],
-        'total_users': conn.execute('SELECT COUNT(*) FROM users').fetchone()[0],
-        'total_applications': conn.execute('SELECT COUNT(*) FROM applications').fetchone()[0],
-        'pending_applications': conn.execute('SELECT COUNT(*) FROM applications WHERE status = "pending"').fetchone()[0]
-    }
+    stats = get_stats()
     recent_applications = conn.execute('''
         SELECT a.id, u.full_name, u.email, j.title, a.status, a.applied_at
         FROM applications a
@@ -133,16 +223,8 @@ def dashboard():
         ORDER BY a.applied_at DESC
         LIMIT 10
     ''').fetchall()
-    popular_jobs = conn.execute('''
-        SELECT j.title, j.location, COUNT(a.id) as application_count
-        FROM jobs j
-        LEFT JOIN applications a ON j.id = a.job_id
-        WHERE j.is_active = 1
-        GROUP BY j.id, j.title, j.location
-        ORDER BY application_count DESC
-        LIMIT 5
-    ''').fetchall()
     conn.close()
+    popular_jobs = get_popular_jobs()
     return render_template('dashboard.html',
                            stats=stats,
                            recent_applications=recent_applications,
@@ -153,35 +235,47 @@ def dashboard():
 @app.route('/jobs')
 @login_required
 def jobs():
-    """Displays a list of all job postings with their application counts and filtering options."""
-    conn = get_db_connection()
-
+    """Displays one page of job postings with their application counts and filtering options."""
     # Filtering parameters
     status_filter = request.args.get('status', 'all')
     search_query = request.args.get('search', '').strip()
 
-    query = '''
-        SELECT j.*, COUNT(a.id) as application_count
-        FROM jobs j
-        LEFT JOIN applications a ON j.id = a.job_id
-        WHERE 1=1
-    '''
+    where = ' WHERE 1=1'
     params = []
 
     if status_filter != 'all':
-        query += ' AND j.is_active = ?'
+        where += ' AND j.is_active = ?'
         params.append(1 if status_filter == 'active' else 0)
 
-    if search_query:
-        query += ' AND (j.title LIKE ? OR j.description LIKE ? OR j.location LIKE ?)'
-        params.extend([f'%{search_query}%', f'%{search_query}%', f'%{search_query}%'])
+    # Search goes through the jobs_fts index (title, description, requirements, location), best match first
+    match = match_expression(search_query)
+    if match:
+        source = 'FROM jobs_fts JOIN jobs j ON j.id = jobs_fts.rowid'
+        where += ' AND jobs_fts MATCH ?'
+        params.append(match)
+        score, sort_key = f'-{JOB_RANK}', 'search_score'
+    else:
+        source = 'FROM jobs j'
+        score, sort_key = 'NULL', 'created_at'
 
-    query += ' GROUP BY j.id ORDER BY j.created_at DESC'
+    # Application counts come from the trigger-maintained job_stats table instead of a GROUP BY
+    query = f'''
+        SELECT j.*, COALESCE(s.application_count, 0) as application_count, {score} as search_score
+        {source}
+        LEFT JOIN job_stats s ON s.job_id = j.id
+    ''' + where
 
-    jobs_list = conn.execute(query, params).fetchall()
+    conn = get_db_connection()
+    page = paginate(conn, query, params, score if match else 'j.created_at', 'j.id', sort_key, 'id', **page_args())
     conn.close()
 
-    return render_template('jobs.html', jobs=jobs_list, status_filter=status_filter, search_query=search_query)
+    counter = None if match else {'all': 'total_jobs', 'active': 'active_jobs'}.get(status_filter)
+    total = approximate_count(f'SELECT COUNT(*) {source}' + where, params, counter)
+
+    if wants_json():
+        return jsonify(page.to_dict(approx_total=total))
+    return render_template('jobs.html', jobs=page.items, page=page, approx_total=total,
+                           status_filter=status_filter, search_query=search_query)
 
 @app.route('/jobs/add', methods=['GET', 'POST'])
 @login_required
@@ -203,6 +297,7 @@ def add_job():
         ''', (title, description, requirements, location, salary))
         conn.commit()
         conn.close()
+        stats_cache.clear()  # show the admin's own change immediately
         flash('Job posted successfully!', 'success')
         return redirect(url_for('jobs'))
     return render_template('add_job.html')
@@ -235,6 +330,7 @@ def edit_job(job_id):
         ''', (title, description, requirements, location, salary, is_active, job_id))
         conn.commit()
         conn.close()
+        stats_cache.clear()  # show the admin's own change immediately
         flash('Job updated successfully!', 'success')
         return redirect(url_for('jobs'))
     conn.close()
@@ -254,55 +350,129 @@ def delete_job(job_id):
         flash('Job deleted successfully!', 'success')
     conn.commit()
     conn.close()
+    stats_cache.clear()
     return redirect(url_for('jobs'))
 
-
-# Line 209 (start of applications function)
-@app.route('/applications')
+@app.route('/jobs/<int:job_id>/shortlist')
 @login_required
-def applications():
-    """Displays a list of all job applications with filtering options."""
-    status_filter = request.args.get('status', 'all')
-    job_filter = request.args.get('job', 'all')
-    search_query = request.args.get('search', '').strip()  # New search query
-
+def job_shortlist(job_id):
+    """Ranks every candidate against a job's title and requirements, best match first."""
+    limit = max(1, min(request.args.get('limit', MATCH_SHORTLIST_SIZE, type=int), 200))
     conn = get_db_connection()
+    job = conn.execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone()
+    if not job:
+        conn.close()
+        flash('Job not found!', 'error')
+        return redirect(url_for('jobs'))
 
-    query = '''
-        SELECT a.*, u.full_name, u.email, u.phone, u.username, j.title as job_title, j.location
-        FROM applications a
-        JOIN users u ON a.user_id = u.user_id
-        JOIN jobs j ON a.job_id = j.id
-        WHERE 1=1
-    '''
+    started = time.perf_counter()
+    matches = match_index.shortlist(job['title'], job['requirements'], limit=limit)
+    match_ms = (time.perf_counter() - started) * 1000
+
+    # Profile details and any application to this job, for the shortlisted users only
+    candidates = []
+    if matches:
+        placeholders = ', '.join('?' * len(matches))
+        rows = conn.execute(f'''
+            SELECT u.user_id, u.full_name, u.username, u.experience, u.skills,
+                   a.id as application_id, a.status
+            FROM users u
+            LEFT JOIN applications a ON a.user_id = u.user_id AND a.job_id = ?
+            WHERE u.user_id IN ({placeholders})
+        ''', [job_id] + [match.id for match in matches]).fetchall()
+        by_id = {row['user_id']: row for row in rows}
+        candidates = [dict(by_id[match.id], score=round(match.score, 4), matched_terms=match.terms)
+                      for match in matches if match.id in by_id]
+    conn.close()
+
+    if wants_json():
+        return jsonify({'job_id': job_id, 'candidates': candidates, 'match_ms': round(match_ms, 2)})
+    return render_template('job_shortlist.html', job=job, candidates=candidates, match_ms=match_ms,
+                           index_stats=match_index.stats())
+
+
+def application_filters(status_filter, job_filter, search_query):
+    """Builds the WHERE clause (over applications a) for the applications page filters; returns (where, params, searched)."""
+    where = ' WHERE 1=1'
     params = []
 
     if status_filter != 'all':
-        query += ' AND a.status = ?'
+        where += ' AND a.status = ?'
         params.append(status_filter)
 
     if job_filter != 'all':
-        query += ' AND a.job_id = ?'
+        where += ' AND a.job_id = ?'
         params.append(int(job_filter))
 
-    # New: Search by applicant name, email, or Telegram username
+    # Search by the application ID the applicant sees in the bot, or by applicant name, email,
+    # or Telegram username (through the users_fts index)
     if search_query:
-        query += ' AND (u.full_name LIKE ? OR u.email LIKE ? OR u.username LIKE ?)'
-        params.extend([f'%{search_query}%', f'%{search_query}%', f'%{search_query}%'])
+        where += ' AND (a.public_application_id = ?'
+        params.append(search_query.upper())
+        match = match_expression(search_query, columns=['full_name', 'email', 'username'])
+        if match:
+            where += ' OR a.user_id IN (SELECT rowid FROM users_fts WHERE users_fts MATCH ?)'
+            params.append(match)
+        where += ')'
 
-    query += ' ORDER BY a.applied_at DESC'
+    return where, params, bool(search_query)
 
-    applications_list = conn.execute(query, params).fetchall()
+# Line 209 (start of applications function)
+@app.route('/applications')
+@login_required
+def applications():
+    """Displays one page of job applications with filtering options."""
+    status_filter = request.args.get('status', 'all')
+    job_filter = request.args.get('job', 'all')
+    search_query = request.args.get('search', '').strip()  # New search query
+    where, params, searched = application_filters(status_filter, job_filter, search_query)
 
+    query = '''
+        SELECT a.*, u.full_name, u.email, u.phone, u.username, j.title as job_title, j.location
+        FROM applications a
+        JOIN users u ON a.user_id = u.user_id
+        JOIN jobs j ON a.job_id = j.id
+    ''' + where
+
+    conn = get_db_connection()
+    page = paginate(conn, query, params, 'a.applied_at', 'a.id', 'applied_at', 'id', **page_args())
     jobs_list = conn.execute('SELECT id, title FROM jobs ORDER BY title').fetchall()
     conn.close()
 
+    counter = None
+    if job_filter == 'all' and not searched:
+        counter = {'all': 'total_applications', 'pending': 'pending_applications'}.get(status_filter)
+    total = approximate_count('SELECT COUNT(*) FROM applications a' + where, params, counter)
+
+    if wants_json():
+        return jsonify(page.to_dict(approx_total=total))
     return render_template('applications.html',
-                           applications=applications_list,
+                           applications=page.items,
+                           page=page,
+                           approx_total=total,
                            jobs=jobs_list,
                            status_filter=status_filter,
                            job_filter=job_filter,
-                           search_query=search_query)  # Pass search_query to template
+                           search_query=search_query,  # Pass search_query to template
+                           statuses=APPLICATION_STATUSES)
+
+def export_response(name, query, params):
+    """Streams an export as a download, in the format given by ?format= (csv or jsonl)."""
+    export_format = request.args.get('format', 'csv')
+    if export_format not in EXPORT_FORMATS:
+        export_format = 'csv'
+    filename = f"{name}-{datetime.now().strftime('%Y%m%d-%H%M')}.{export_format}"
+    return Response(stream_with_context(export_stream(db_pool, query, params, export_format)),
+                    mimetype=EXPORT_FORMATS[export_format], headers=attachment_headers(filename))
+
+@app.route('/applications/export')
+@login_required
+def export_applications():
+    """Downloads every application matching the applications page filters, newest first."""
+    where, params, _ = application_filters(request.args.get('status', 'all'), request.args.get('job', 'all'),
+                                           request.args.get('search', '').strip())
+    query = APPLICATION_EXPORT_QUERY + where + ' ORDER BY a.applied_at DESC, a.id DESC'
+    return export_response('applications', query, params)
 
 @app.route('/applications/view/<int:app_id>')
 @login_required
@@ -328,44 +498,114 @@ def view_application(app_id):
 def update_application_status(app_id):
     """Updates the status of a specific job application."""
     new_status = request.form['status']
-    if new_status not in ['pending', 'accepted', 'rejected', 'interviewed']:
+    if new_status not in APPLICATION_STATUSES:
         flash('Invalid status!', 'error')
         return redirect(url_for('view_application', app_id=app_id))
     conn = get_db_connection()
     conn.execute('UPDATE applications SET status = ? WHERE id = ?', (new_status, app_id))
     conn.commit()
     conn.close()
+    stats_cache.clear()
     flash(f'Application status updated to {new_status.title()}!', 'success')
     return redirect(url_for('view_application', app_id=app_id))
 
+@app.route('/applications/bulk_status', methods=['POST'])
+@login_required
+def bulk_update_application_status():
+    """Changes the status of the selected applications, or of every application matching the filters, at once."""
+    new_status = request.form.get('new_status')
+    status_filter = request.form.get('status', 'all')
+    job_filter = request.form.get('job', 'all')
+    search_query = request.form.get('search', '').strip()
+    notify = 'notify' in request.form
+    back = url_for('applications', status=status_filter, job=job_filter, search=search_query)
+
+    if new_status not in APPLICATION_STATUSES:
+        flash('Invalid status!', 'error')
+        return redirect(back)
+
+    if notify and not BOT_TOKEN:
+        flash('Telegram BOT_TOKEN is not configured in .env!', 'error')
+        return redirect(back)
+
+    if request.form.get('scope') == 'filter':
+        where, params, _ = application_filters(status_filter, job_filter, search_query)
+    else:
+        app_ids = [int(app_id) for app_id in request.form.getlist('app_ids') if app_id.isdigit()]
+        if not app_ids:
+            flash('Select at least one application first.', 'warning')
+            return redirect(back)
+        where = f" WHERE a.id IN ({', '.join('?' * len(app_ids))})"
+        params = app_ids
+
+    # One transaction: a single executemany UPDATE plus the notifications queued for the outbox worker
+    result = db_pool.run(bulk_update_status, new_status, where, params, notify)
+    stats_cache.clear()
+
+    if wants_json():
+        return jsonify(result)
+    message = f"{result['updated']} of {result['matched']} application(s) set to {new_status.title()}"
+    if result['matched'] > result['updated']:
+        message += f" ({result['matched'] - result['updated']} already had that status)"
+    if result['notified']:
+        message += f"; {result['notified']} applicant(s) will be notified on Telegram"
+    flash(message + '.', 'success' if result['matched'] else 'warning')
+    return redirect(back)
+
 
 # (start of users function)
 @app.route('/users')
 @login_required
 def users():
-    """Displays a list of all registered users with their application counts and filtering options."""
-    conn = get_db_connection()
+    """Displays one page of registered users with their application counts and filtering options."""
     search_query = request.args.get('search', '').strip()  # New search query
 
-    query = '''
-        SELECT u.*, COUNT(a.id) as application_count
-        FROM users u
-        LEFT JOIN applications a ON u.user_id = a.user_id
-        WHERE 1=1
-    '''
+    where = ' WHERE 1=1'
     params = []
 
-    # New: Search by user full name, username, or email
-    if search_query:
-        query += ' AND (u.full_name LIKE ? OR u.username LIKE ? OR u.email LIKE ?)'
-        params.extend([f'%{search_query}%', f'%{search_query}%', f'%{search_query}%'])
+    # New: Search by name, username, email, skills or resume text (through the users_fts index), best match first
+    match = match_expression(search_query)
+    if match:
+        source = 'FROM users_fts JOIN users u ON u.user_id = users_fts.rowid'
+        where += ' AND users_fts MATCH ?'
+        params.append(match)
+        score, sort_key = f'-{USER_RANK}', 'search_score'
+    else:
+        source = 'FROM users u'
+        score, sort_key = 'NULL', 'created_at'
 
-    query += ' GROUP BY u.user_id ORDER BY u.created_at DESC'
+    # Counting per row through the (user_id, job_id) index only touches the users on this page
+    query = f'''
+        SELECT u.*, (SELECT COUNT(*) FROM applications a WHERE a.user_id = u.user_id) as application_count,
+               {score} as search_score
+        {source}
+    ''' + where
 
-    users_list = conn.execute(query, params).fetchall()
+    conn = get_db_connection()
+    page = paginate(conn, query, params, score if match else 'u.created_at', 'u.user_id', sort_key, 'user_id',
+                    **page_args())
     conn.close()
 
-    return render_template('users.html', users=users_list, search_query=search_query)  # Pass search_query
+    total = approximate_count(f'SELECT COUNT(*) {source}' + where, params, None if match else 'total_users')
+
+    if wants_json():
+        return jsonify(page.to_dict(approx_total=total))
+    return render_template('users.html', users=page.items, page=page, approx_total=total,
+                           search_query=search_query)  # Pass search_query
+
+@app.route('/users/export')
+@login_required
+def export_users():
+    """Downloads every user matching the users page search (best match first), or all users, newest first."""
+    match = match_expression(request.args.get('search', '').strip())
+    if match:
+        query = (USER_EXPORT_QUERY + ' FROM users_fts JOIN users u ON u.user_id = users_fts.rowid'
+                 ' WHERE users_fts MATCH ? ORDER BY ' + USER_RANK)
+        params = [match]
+    else:
+        query = USER_EXPORT_QUERY + ' FROM users u ORDER BY u.created_at DESC, u.user_id DESC'
+        params = []
+    return export_response('users', query, params)
 
 @app.route('/users/view/<int:user_id>')
 @login_required
@@ -375,6 +615,7 @@ def view_user(user_id):
     user = conn.execute('SELECT * FROM users WHERE user_id = ?', (user_id,)).fetchone()
     if not user:
         flash('User not found!', 'error')
+        conn.close()
         return redirect(url_for('users'))
     user_applications = conn.execute('''
         SELECT a.*, j.title, j.location
@@ -390,16 +631,13 @@ def view_user(user_id):
 @login_required
 def api_stats():
     """API endpoint to provide dashboard statistics in JSON format."""
-    conn = get_db_connection()
-    stats = {
-        'total_jobs': conn.execute('SELECT COUNT(*) FROM jobs').fetchone()[0],
-        'active_jobs': conn.execute('SELECT COUNT(*) FROM jobs WHERE is_active = 1').fetchone()[0],
-        'total_users': conn.execute('SELECT COUNT(*) FROM users').fetchone()[0],
-        'total_applications': conn.execute('SELECT COUNT(*) FROM applications').fetchone()[0],
-        'pending_applications': conn.execute('SELECT COUNT(*) FROM applications WHERE status = "pending"').fetchone()[0]
-    }
-    conn.close()
-    return jsonify(stats)
+    return jsonify(get_stats())
+
+@app.route('/api/db_stats')
+@login_required
+def api_db_stats():
+    """API endpoint exposing connection pool counters (checkouts, waits, lock retries) for sizing the pool."""
+    return jsonify(db_pool.stats())
 
 
 # Line 367 (new function)
@@ -418,15 +656,8 @@ def send_telegram_message():
         flash('Telegram BOT_TOKEN is not configured in .env!', 'error')
         return redirect(request.referrer or url_for('dashboard'))
 
-    telegram_api_url = f"https://api.telegram.org/bot{BOT_TOKEN}/sendMessage"
-    payload = {
-        'chat_id': user_id,
-        'text': message_text,
-        'parse_mode': 'Markdown'  # Allow markdown in messages
-    }
-
     try:
-        response = requests.post(telegram_api_url, json=payload)
+        response = telegram.send_message(user_id, message_text)  # Markdown is allowed in messages
         response.raise_for_status()  # Raise an exception for HTTP errors
         flash(f'Message sent to Telegram user {user_id} successfully!', 'success')
     except requests.exceptions.RequestException as e:
@@ -437,21 +668,159 @@ def send_telegram_message():
     return redirect(request.referrer or url_for('dashboard'))  # Redirect back to the page they came from
 
 
+# Bulk messages are queued in the outbox table and delivered by a background worker thread (see broadcast.py)
+OUTBOX_WORKER = os.getenv('OUTBOX_WORKER', 'True').lower() in ('true', '1', 't')  # default OUTBOX_WORKER = True
+outbox_worker = None
+outbox_worker_lock = threading.Lock()
+
+@app.before_request
+def start_outbox_worker():
+    """Starts the outbox worker with the first request (not at import, so the debug reloader's parent never runs one)."""
+    global outbox_worker
+    if outbox_worker is not None or not OUTBOX_WORKER or not BOT_TOKEN:
+        return
+    with outbox_worker_lock:
+        if outbox_worker is None:
+            outbox_worker = OutboxWorker(db_pool, telegram.send_message)
+            outbox_worker.start()
+
+@app.route('/broadcast', methods=['POST'])
+@login_required
+def broadcast():
+    """Queues a Telegram message to every applicant matching the applications page filters."""
+    message_text = request.form.get('message_text', '').strip()
+    status_filter = request.form.get('status', 'all')
+    job_filter = request.form.get('job', 'all')
+    search_query = request.form.get('search', '').strip()
+    back = url_for('applications', status=status_filter, job=job_filter, search=search_query)
+
+    if not message_text:
+        flash('Message text is required.', 'error')
+        return redirect(back)
+
+    if not BOT_TOKEN:
+        flash('Telegram BOT_TOKEN is not configured in .env!', 'error')
+        return redirect(back)
+
+    where, params, _ = application_filters(status_filter, job_filter, search_query)
+    audience = []
+    if status_filter != 'all':
+        audience.append(f'status: {status_filter}')
+    if job_filter != 'all':
+        audience.append(f'job #{job_filter}')
+    if search_query:
+        audience.append(f'search: "{search_query}"')
+
+    broadcast_id, total = db_pool.run(
+        enqueue_broadcast, message_text, 'SELECT a.user_id AS chat_id FROM applications a' + where, params,
+        ', '.join(audience) or 'all applicants', session.get('username'))
+    if total == 0:
+        flash('No applicants match the current filters; nothing was sent.', 'warning')
+        return redirect(back)
+    flash(f'Message queued for {total} applicants. Delivery runs in the background.', 'success')
+    return redirect(url_for('broadcasts', highlight=broadcast_id))
+
+@app.route('/broadcasts')
+@login_required
+def broadcasts():
+    """Lists recent broadcasts with their delivery progress."""
+    conn = get_db_connection()
+    rows = conn.execute('SELECT * FROM broadcasts ORDER BY id DESC LIMIT 50').fetchall()
+    conn.close()
+    items = [dict(row, **broadcast_progress(row)) for row in rows]
+    return render_template('broadcasts.html', broadcasts=items, highlight=request.args.get('highlight', type=int),
+                           worker_running=outbox_worker is not None and outbox_worker.is_alive())
+
+@app.route('/api/broadcasts/<int:broadcast_id>')
+@login_required
+def api_broadcast_progress(broadcast_id):
+    """API endpoint with one broadcast's progress (sent, failed, queued, throughput) for polling."""
+    conn = get_db_connection()
+    row = conn.execute('SELECT * FROM broadcasts WHERE id = ?', (broadcast_id,)).fetchone()
+    conn.close()
+    if not row:
+        return jsonify({'error': 'Broadcast not found'}), 404
+    return jsonify(broadcast_progress(row))
+
+@app.route('/api/telegram_stats')
+@login_required
+def api_telegram_stats():
+    """API endpoint with per-endpoint Telegram API latency histograms and error counts."""
+    return jsonify(telegram.stats())
+
+@app.route('/api/outbox_stats')
+@login_required
+def api_outbox_stats():
+    """API endpoint with outbox depth by status and the delivery worker's counters."""
+    conn = get_db_connection()
+    depth = dict(conn.execute('SELECT status, COUNT(*) FROM outbox GROUP BY status').fetchall())
+    conn.close()
+    return jsonify({'outbox': depth, 'worker': outbox_worker.stats() if outbox_worker else None})
+
+@app.route('/debug/perf', methods=['GET', 'POST'])
+@login_required
+def debug_perf():
+    """Hottest routes and SQL statements since startup (or the last reset); needs PORTAL_PROFILING."""
+    if not PORTAL_PROFILING:
+        abort(404)
+    if request.method == 'POST':
+        profiler.reset()
+        flash('Profiling data has been reset.', 'success')
+        return redirect(url_for('debug_perf'))
+    if wants_json():
+        return jsonify(profiler.snapshot())
+    return render_template('debug_perf.html', perf=profiler.snapshot(), pool_stats=db_pool.stats(),
+                           slow_query_ms=profiler.slow_query_seconds * 1000)
+
+@app.route('/debug/metrics')
+def debug_metrics():
+    """Profiling data in the Prometheus text format, for an admin session or a bearer PROFILING_METRICS_TOKEN."""
+    if not PORTAL_PROFILING:
+        abort(404)
+    authorized = 'logged_in' in session or (PROFILING_METRICS_TOKEN and hmac.compare_digest(
+        request.headers.get('Authorization', '').encode(), f'Bearer {PROFILING_METRICS_TOKEN}'.encode()))
+    if not authorized:
+        abort(401)
+    return Response(profiler.prometheus(), mimetype='text/plain; version=0.0.4')
+
+
 # Line 400 (new function)
+# Downloaded resumes are kept on local disk so repeat downloads never go back to Telegram
+resume_cache = ResumeCache()
+# getFile results (file_path etc.); Telegram keeps a file_path downloadable for at least an hour
+file_info_cache = TTLCache(ttl=50 * 60, maxsize=1024)
+
+def get_telegram_file_info(file_id):
+    """Returns Telegram's getFile result for a file_id, cached for repeat downloads."""
+    file_info = file_info_cache.get(file_id)
+    if file_info is None:
+        file_info = telegram.get_file(file_id)
+        if file_info:
+            file_info_cache.set(file_id, file_info)
+    return file_info
+
+def attachment_headers(filename):
+    """Content-Disposition header for a download, with an RFC 5987 fallback for non-ASCII names."""
+    ascii_name = filename.encode('ascii', 'ignore').decode() or 'resume'
+    return {'Content-Disposition': f"attachment; filename=\"{ascii_name}\"; filename*=UTF-8''{quote(filename)}"}
+
 @app.route('/download_resume/<file_id>')
 @login_required
 def download_resume(file_id):
-    """Downloads a resume file from Telegram using its file_id."""
+    """Streams a resume file from the local cache, or from Telegram (caching it on the way) using its file_id."""
+    cached = resume_cache.lookup(file_id)
+    if cached:
+        path, metadata = cached
+        return send_file(path, mimetype=metadata['mime_type'], as_attachment=True,
+                         download_name=metadata['filename'], conditional=False)
+
     if not BOT_TOKEN:
         flash('Telegram BOT_TOKEN is not configured in .env!', 'error')
         return redirect(request.referrer or url_for('dashboard'))
 
     # Get file path from Telegram
-    get_file_url = f"https://api.telegram.org/bot{BOT_TOKEN}/getFile?file_id={file_id}"
     try:
-        response = requests.get(get_file_url)
-        response.raise_for_status()
-        file_info = response.json().get('result')
+        file_info = get_telegram_file_info(file_id)
 
         if not file_info:
             flash('Could not get file information from Telegram.', 'error')
@@ -462,25 +831,30 @@ def download_resume(file_id):
             flash('File path not found in Telegram response.', 'error')
             return redirect(request.referrer or url_for('dashboard'))
 
-        download_url = f"https://api.telegram.org/file/bot{BOT_TOKEN}/{file_path}"
-
-        # Download the file content
-        file_content_response = requests.get(download_url, stream=True)
-        file_content_response.raise_for_status()
+        # Open the download as a stream; the body is relayed chunk by chunk, never held in memory
+        file_content_response = telegram.download_file(file_path)
 
         # Determine filename (Telegram often provides it in file_path or original upload)
         # We can try to extract it from file_path or use a generic name
         filename = os.path.basename(file_path)
         if not filename:
             filename = f"resume_{file_id}.bin"  # Fallback generic name
-
-        # Use io.BytesIO to create an in-memory file for send_file
-        return send_file(
-            io.BytesIO(file_content_response.content),
-            mimetype=file_info.get('mime_type', 'application/octet-stream'),
-            as_attachment=True,
-            download_name=filename
-        )
+        metadata = {
+            'filename': filename,
+            'mime_type': mimetypes.guess_type(filename)[0] or 'application/octet-stream',
+        }
+
+        def relay():
+            try:
+                yield from resume_cache.stream_and_store(
+                    file_id, file_content_response.iter_content(chunk_size=CHUNK_SIZE), metadata)
+            finally:
+                file_content_response.close()
+
+        headers = attachment_headers(filename)
+        if file_content_response.headers.get('Content-Length'):
+            headers['Content-Length'] = file_content_response.headers['Content-Length']
+        return Response(stream_with_context(relay()), mimetype=metadata['mime_type'], headers=headers)
 
     except requests.exceptions.RequestException as e:
         flash(f'Failed to download resume from Telegram: {e}', 'error')
@@ -0,0 +1,271 @@
+"""
+Bulk Telegram messaging from the portal.
+
+A broadcast queues one message per recipient in the SQLite `outbox` table
+(migration 6) inside a single transaction, so the request that creates it
+returns immediately. OutboxWorker, a background thread in the portal process,
+drains the outbox while staying inside Telegram's limits: a global messages
+per second budget, a minimum interval per chat, and the retry_after pause
+Telegram asks for with HTTP 429. Progress is kept on the broadcasts row.
+"""
+import collections
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Telegram allows roughly 30 messages/second overall and 1/second per chat; stay a little under
+GLOBAL_RATE = float(os.getenv('TELEGRAM_GLOBAL_RATE', '25'))  # messages per second
+PER_CHAT_INTERVAL = float(os.getenv('TELEGRAM_PER_CHAT_INTERVAL', '1'))  # seconds between messages to one chat
+MAX_ATTEMPTS = int(os.getenv('OUTBOX_MAX_ATTEMPTS', '5'))  # delivery attempts before a message is marked failed
+
+BATCH_SIZE = 25  # messages claimed (and their results written back) per transaction
+IDLE_POLL_SECONDS = 1.0  # how often an empty outbox is checked
+STALE_CLAIM_SECONDS = 300  # claimed-but-unfinished messages older than this are requeued (worker died)
+REQUEUE_INTERVAL_SECONDS = 60  # how often the running worker looks for stale claims
+
+
+def enqueue_broadcast(conn, message_text, recipients_query, params, audience, created_by=None):
+    """
+    Creates a broadcast and queues one message for every distinct chat_id
+    returned by recipients_query. Returns (broadcast_id, number of recipients).
+    """
+    broadcast_id = conn.execute(
+        'INSERT INTO broadcasts (message_text, audience, created_by) VALUES (?, ?, ?)',
+        (message_text, audience, created_by)).lastrowid
+    total = conn.execute(f'''
+        INSERT INTO outbox (broadcast_id, chat_id, message_text)
+        SELECT DISTINCT ?, r.chat_id, ? FROM ({recipients_query}) r
+    ''', [broadcast_id, message_text, *params]).rowcount
+    conn.execute('UPDATE broadcasts SET total = ? WHERE id = ?', (total, broadcast_id))
+    return broadcast_id, total
+
+
+def enqueue_messages(conn, messages):
+    """Queues one-off (chat_id, message_text) notifications for background delivery."""
+    conn.executemany('INSERT INTO outbox (chat_id, message_text) VALUES (?, ?)', messages)
+
+
+def broadcast_progress(row):
+    """Progress summary of a broadcasts row, including delivery throughput in messages/second."""
+    done = row['sent'] + row['failed']
+    progress = {
+        'id': row['id'],
+        'audience': row['audience'],
+        'total': row['total'],
+        'sent': row['sent'],
+        'failed': row['failed'],
+        'queued': max(row['total'] - done, 0),
+        'percent': round(100 * done / row['total'], 1) if row['total'] else 100.0,
+        'finished': row['finished_at'] is not None or row['total'] == 0,
+        'throughput': None,
+    }
+    if row['started_at']:
+        elapsed = (row['finished_at'] or time.time()) - row['started_at']
+        progress['throughput'] = round(done / elapsed, 2) if elapsed > 0 else None
+    return progress
+
+
+class RateLimiter:
+    """Token bucket for the global send rate plus a minimum interval between messages to the same chat."""
+
+    def __init__(self, rate=GLOBAL_RATE, per_chat_interval=PER_CHAT_INTERVAL):
+        self.rate = rate
+        self.per_chat_interval = per_chat_interval
+        self._tokens = rate
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._last_sent = {}  # chat_id -> monotonic time of the last message
+
+    def chat_ready_in(self, chat_id):
+        """Seconds until chat_id may receive another message (0 if it may now)."""
+        last = self._last_sent.get(chat_id)
+        return 0.0 if last is None else max(0.0, last + self.per_chat_interval - time.monotonic())
+
+    def acquire(self, stop_event):
+        """Blocks until the global budget allows one more message (or the worker is stopping)."""
+        while not stop_event.is_set():
+            now = time.monotonic()
+            if now < self._paused_until:
+                stop_event.wait(self._paused_until - now)
+                continue
+            self._tokens = min(self.rate, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return True
+            stop_event.wait((1 - self._tokens) / self.rate)
+        return False
+
+    def mark_sent(self, chat_id):
+        """Records a message to chat_id, dropping per-chat history that no longer matters."""
+        now = time.monotonic()
+        self._last_sent[chat_id] = now
+        if len(self._last_sent) > 10000:
+            cutoff = now - self.per_chat_interval
+            self._last_sent = {chat: t for chat, t in self._last_sent.items() if t > cutoff}
+
+    def pause(self, seconds):
+        """Stops all sending for `seconds` (Telegram answered 429 Too Many Requests)."""
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+
+class OutboxWorker(threading.Thread):
+    """
+    Background thread that delivers queued outbox messages.
+
+    `send_message(chat_id, text, parse_mode)` performs the sendMessage call
+    and returns the requests.Response (TelegramClient.send_message). Messages are claimed
+    with an atomic UPDATE ... RETURNING, so several portal processes can each
+    run a worker without sending anything twice.
+    """
+
+    def __init__(self, pool, send_message, limiter=None):
+        super().__init__(name='outbox-worker', daemon=True)
+        self.pool = pool
+        self.send_message = send_message
+        self.limiter = limiter or RateLimiter()
+        self._stop_event = threading.Event()
+        self._recent = collections.deque()  # monotonic times of recent deliveries, for throughput
+        self._lock = threading.Lock()
+        self._metrics = {'sent': 0, 'failed': 0, 'retried': 0, 'rate_limited': 0, 'batches': 0}
+
+    def stop(self):
+        """Asks the worker to finish its current message and exit."""
+        self._stop_event.set()
+
+    def run(self):
+        logger.info("Outbox worker started.")
+        next_requeue = 0
+        while not self._stop_event.is_set():
+            try:
+                # Also while running: a batch whose results failed to be written stays 'sending' otherwise
+                if time.monotonic() >= next_requeue:
+                    self.pool.run(self._requeue_stale)
+                    next_requeue = time.monotonic() + REQUEUE_INTERVAL_SECONDS
+                batch = self.pool.run(self._claim_batch)
+                if not batch:
+                    self._stop_event.wait(IDLE_POLL_SECONDS)
+                    continue
+                results = [self._deliver(row) for row in batch]
+                self.pool.run(self._record_results, results)
+                with self._lock:
+                    self._metrics['batches'] += 1
+            except Exception:
+                logger.exception("Outbox worker iteration failed; retrying shortly.")
+                self._stop_event.wait(IDLE_POLL_SECONDS)
+        logger.info("Outbox worker stopped.")
+
+    def _requeue_stale(self, conn):
+        """Puts back messages that were claimed but never finished (worker died or failed to record them)."""
+        conn.execute("UPDATE outbox SET status = 'queued', claimed_at = NULL WHERE status = 'sending' AND claimed_at < ?",
+                     (time.time() - STALE_CLAIM_SECONDS,))
+
+    def _claim_batch(self, conn):
+        """Atomically marks the next due messages as 'sending' and returns them."""
+        now = time.time()
+        rows = conn.execute('''
+            UPDATE outbox SET status = 'sending', claimed_at = ?
+            WHERE id IN (
+                SELECT id FROM outbox
+                WHERE status = 'queued' AND next_attempt_at <= ?
+                ORDER BY next_attempt_at, id
+                LIMIT ?
+            )
+            RETURNING id, broadcast_id, chat_id, message_text, attempts
+        ''', (now, now, BATCH_SIZE)).fetchall()
+        broadcast_ids = {row['broadcast_id'] for row in rows if row['broadcast_id'] is not None}
+        conn.executemany('UPDATE broadcasts SET started_at = COALESCE(started_at, ?) WHERE id = ?',
+                         [(now, broadcast_id) for broadcast_id in broadcast_ids])
+        return sorted(rows, key=lambda row: row['id'])
+
+    def _deliver(self, row):
+        """Sends one message; returns (row, outcome, error, retry_delay)."""
+        chat_id = row['chat_id']
+        wait = self.limiter.chat_ready_in(chat_id)
+        if wait > 0:
+            return row, 'retry', None, wait  # same chat messaged too recently; try again later, don't count an attempt
+        if not self.limiter.acquire(self._stop_event):
+            return row, 'retry', None, 0
+
+        try:
+            response = self.send_message(chat_id, row['message_text'], 'Markdown')
+            if response.status_code == 400 and "can't parse entities" in response.text:
+                # The text is not valid Markdown; deliver it as plain text rather than failing it
+                response = self.send_message(chat_id, row['message_text'], None)
+        except Exception as e:
+            return self._retry_or_fail(row, f'{type(e).__name__}: {e}')
+        self.limiter.mark_sent(chat_id)
+
+        if response.ok:
+            with self._lock:
+                self._metrics['sent'] += 1
+                self._recent.append(time.monotonic())
+            return row, 'sent', None, 0
+        if response.status_code == 429:
+            retry_after = _retry_after(response)
+            self.limiter.pause(retry_after)
+            with self._lock:
+                self._metrics['rate_limited'] += 1
+            return row, 'retry', 'HTTP 429 Too Many Requests', retry_after
+        if response.status_code >= 500:
+            return self._retry_or_fail(row, f'HTTP {response.status_code}')
+        # 400/403 etc.: chat not found, bot blocked by the user... retrying won't help
+        with self._lock:
+            self._metrics['failed'] += 1
+        return row, 'failed', f'HTTP {response.status_code}: {response.text[:200]}', 0
+
+    def _retry_or_fail(self, row, error):
+        """Schedules a retry with exponential backoff, or gives up after MAX_ATTEMPTS."""
+        with self._lock:
+            if row['attempts'] + 1 >= MAX_ATTEMPTS:
+                self._metrics['failed'] += 1
+                return row, 'failed', error, 0
+            self._metrics['retried'] += 1
+        return row, 'retry', error, min(2 ** row['attempts'] * 5, 300)
+
+    def _record_results(self, conn, results):
+        """Writes a batch of delivery outcomes and the broadcasts' progress counters in one transaction."""
+        now = time.time()
+        progress = collections.defaultdict(lambda: [0, 0])
+        for row, outcome, error, delay in results:
+            if outcome == 'sent':
+                conn.execute("UPDATE outbox SET status = 'sent', attempts = attempts + 1, sent_at = CURRENT_TIMESTAMP, "
+                             "last_error = NULL WHERE id = ?", (row['id'],))
+            elif outcome == 'failed':
+                conn.execute("UPDATE outbox SET status = 'failed', attempts = attempts + 1, last_error = ? WHERE id = ?",
+                             (error, row['id']))
+            else:
+                counted = 1 if error else 0  # deferrals for the per-chat interval are not delivery attempts
+                conn.execute("UPDATE outbox SET status = 'queued', attempts = attempts + ?, next_attempt_at = ?, "
+                             "claimed_at = NULL, last_error = COALESCE(?, last_error) WHERE id = ?",
+                             (counted, now + delay, error, row['id']))
+            if row['broadcast_id'] is not None and outcome != 'retry':
+                progress[row['broadcast_id']][0 if outcome == 'sent' else 1] += 1
+        for broadcast_id, (sent, failed) in progress.items():
+            conn.execute('''
+                UPDATE broadcasts SET sent = sent + ?, failed = failed + ?,
+                    finished_at = CASE WHEN sent + ? + failed + ? >= total THEN ? END
+                WHERE id = ?
+            ''', (sent, failed, sent, failed, now, broadcast_id))
+
+    def stats(self):
+        """Worker counters plus messages/second delivered over the last minute."""
+        with self._lock:
+            cutoff = time.monotonic() - 60
+            while self._recent and self._recent[0] < cutoff:
+                self._recent.popleft()
+            stats = dict(self._metrics)
+            stats['throughput_last_minute'] = round(len(self._recent) / 60, 2)
+        stats['alive'] = self.is_alive()
+        return stats
+
+
+def _retry_after(response):
+    """Seconds Telegram asked us to wait in a 429 response (defaults to 5)."""
+    try:
+        return float(response.json().get('parameters', {}).get('retry_after', 5))
+    except ValueError:
+        return 5.0
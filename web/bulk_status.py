@@ -0,0 +1,46 @@
+"""
+Bulk application status changes from the portal.
+
+The applications to change (explicit ids, or everything matching the
+applications page filters) are read and updated in one write transaction:
+a single executemany UPDATE of the rows whose status actually changes and,
+optionally, one outbox notification per applicant for the background worker
+(see broadcast.py). The request only waits for that one commit.
+"""
+from shared.statuses import status_label
+from broadcast import enqueue_messages
+
+SELECTION_QUERY = '''
+    SELECT a.id, a.user_id, a.status, j.title
+    FROM applications a
+    JOIN jobs j ON a.job_id = j.id
+'''
+
+
+def notification_text(titles, status):
+    """The message telling an applicant the new status of their applications for the given job titles."""
+    lines = '\n'.join(f"• {title}" for title in titles)
+    noun = 'application' if len(titles) == 1 else 'applications'
+    return f"📋 Update on your job {noun}:\n\n{lines}\n\nNew status: {status_label(status)}"
+
+
+def bulk_update_status(conn, new_status, where, params, notify=False):
+    """
+    Sets new_status on the applications selected by `where` (over applications a
+    and jobs j) and optionally queues one notification per affected applicant.
+    Returns the counts: matched, updated (status actually changed) and notified.
+    """
+    conn.execute('BEGIN IMMEDIATE')  # read and write under one lock, so no change slips in between
+    rows = conn.execute(SELECTION_QUERY + where, params).fetchall()
+    changed = [row for row in rows if row['status'] != new_status]
+    conn.executemany('UPDATE applications SET status = ? WHERE id = ?', [(new_status, row['id']) for row in changed])
+
+    notified = 0
+    if notify and changed:
+        titles = {}  # user_id -> job titles, so an applicant gets one message however many applications changed
+        for row in changed:
+            titles.setdefault(row['user_id'], []).append(row['title'])
+        enqueue_messages(conn, [(user_id, notification_text(job_titles, new_status))
+                                for user_id, job_titles in titles.items()])
+        notified = len(titles)
+    return {'matched': len(rows), 'updated': len(changed), 'notified': notified}
@@ -0,0 +1,79 @@
+"""
+Streaming CSV/JSONL exports of the applications and users lists.
+
+Rows are read with fetchmany() from a single cursor and written out batch by
+batch while the response is being sent, so an export of any size needs
+memory for one batch only.
+"""
+import csv
+import io
+import json
+import os
+
+EXPORT_BATCH_SIZE = int(os.getenv('EXPORT_BATCH_SIZE', '1000'))  # rows fetched and written per chunk
+EXPORT_FORMATS = {
+    'csv': 'text/csv; charset=utf-8',
+    'jsonl': 'application/x-ndjson; charset=utf-8',
+}
+
+APPLICATION_EXPORT_QUERY = '''
+    SELECT a.id, a.public_application_id, a.status, a.applied_at,
+           a.job_id, j.title as job_title, j.location as job_location,
+           a.user_id, u.full_name, u.username, u.email, u.phone, u.experience, u.skills
+    FROM applications a
+    JOIN users u ON a.user_id = u.user_id
+    JOIN jobs j ON a.job_id = j.id
+'''
+
+USER_EXPORT_QUERY = '''
+    SELECT u.user_id, u.username, u.full_name, u.email, u.phone, u.experience, u.skills, u.resume_text,
+           u.created_at, u.updated_at,
+           (SELECT COUNT(*) FROM applications a WHERE a.user_id = u.user_id) as application_count
+'''
+
+
+def fetch_batches(pool, query, params, batch_size=EXPORT_BATCH_SIZE):
+    """Yields lists of rows from one cursor; the connection is held until the generator finishes or is closed."""
+    conn = pool.acquire()
+    try:
+        cursor = conn.execute(query, params)
+        yield [column[0] for column in cursor.description]
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            yield rows
+    finally:
+        conn.close()
+
+
+def csv_lines(batches):
+    """CSV text for a header followed by row batches, one chunk per batch."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    columns = next(batches)
+    # The byte order mark makes Excel open the file as UTF-8 (names are often not ASCII)
+    buffer.write('\ufeff')
+    writer.writerow(columns)
+    for rows in batches:
+        writer.writerows(rows)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue()
+
+
+def jsonl_lines(batches):
+    """One JSON object per row, one chunk per batch."""
+    columns = next(batches)
+    for rows in batches:
+        yield ''.join(json.dumps(dict(zip(columns, row)), ensure_ascii=False, default=str) + '\n' for row in rows)
+
+
+def export_stream(pool, query, params, export_format):
+    """The response body of an export in the given format ('csv' or 'jsonl')."""
+    batches = fetch_batches(pool, query, params)
+    try:
+        yield from jsonl_lines(batches) if export_format == 'jsonl' else csv_lines(batches)
+    finally:
+        batches.close()  # hands the connection back at once if the client disconnects mid-download
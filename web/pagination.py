@@ -0,0 +1,105 @@
+"""
+Keyset (cursor) pagination for the portal's list pages.
+
+Instead of OFFSET, each page remembers the sort key of its first and last
+rows in an opaque cursor and the next query starts right after it, so every
+page costs one index range scan no matter how deep into the table it is.
+"""
+import base64
+import json
+
+DEFAULT_PAGE_SIZE = 25
+MAX_PAGE_SIZE = 200
+
+
+def page_size_arg(value):
+    """Parses the per_page query argument, clamped to 1..MAX_PAGE_SIZE."""
+    try:
+        return max(1, min(int(value), MAX_PAGE_SIZE))
+    except (TypeError, ValueError):
+        return DEFAULT_PAGE_SIZE
+
+
+def encode_cursor(values):
+    """Encodes the sort key of a row as a URL-safe token."""
+    return base64.urlsafe_b64encode(json.dumps(values, separators=(',', ':')).encode()).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    """Decodes a cursor token; returns None for a missing, malformed or tampered token."""
+    if not token:
+        return None
+    try:
+        values = json.loads(base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)))
+    except ValueError:
+        return None
+    if not isinstance(values, list) or len(values) != 2:
+        return None
+    # Both values end up as SQL parameters: only plain scalars, never bool, null or nested JSON
+    if not all(isinstance(value, (str, int, float)) and not isinstance(value, bool) for value in values):
+        return None
+    return values
+
+
+class Page:
+    """One page of rows plus the cursors to reach its neighbours."""
+
+    def __init__(self, items, next_cursor, prev_cursor, page_size):
+        self.items = items
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+        self.page_size = page_size
+
+    def to_dict(self, **extra):
+        """JSON-serialisable form of the page, for ?format=json responses."""
+        data = {
+            'items': [dict(row) for row in self.items],
+            'next_cursor': self.next_cursor,
+            'prev_cursor': self.prev_cursor,
+            'page_size': self.page_size,
+        }
+        data.update(extra)
+        return data
+
+
+def paginate(conn, query, params, sort_column, id_column, sort_key, id_key,
+             cursor=None, direction='next', page_size=DEFAULT_PAGE_SIZE):
+    """
+    Runs `query` (a SELECT ending in a WHERE clause) for one page ordered by
+    (sort_column, id_column) descending, newest first.
+
+    sort_column/id_column are the SQL expressions to order by; sort_key/id_key
+    are the names of the same values in the result rows, used to build cursors.
+    direction='prev' walks backwards from the cursor.
+    """
+    position = decode_cursor(cursor)
+    base_query, base_params = query, list(params)
+    params = list(params)
+    backwards = direction == 'prev' and position is not None
+    if position is not None:
+        query += f' AND ({sort_column}, {id_column}) {">" if backwards else "<"} (?, ?)'
+        params.extend(position)
+    order = 'ASC' if backwards else 'DESC'
+    query += f' ORDER BY {sort_column} {order}, {id_column} {order} LIMIT ?'
+    params.append(page_size + 1)  # one extra row tells us whether another page exists
+
+    rows = conn.execute(query, params).fetchall()
+    has_more = len(rows) > page_size
+    rows = rows[:page_size]
+    if backwards:
+        rows.reverse()
+        if not rows:
+            # Nothing before the cursor any more (rows were deleted); start over from the top
+            return paginate(conn, base_query, base_params, sort_column, id_column, sort_key, id_key,
+                            page_size=page_size)
+
+    def key(row):
+        return encode_cursor([row[sort_key], row[id_key]])
+
+    if backwards:
+        next_cursor = key(rows[-1])
+        prev_cursor = key(rows[0]) if has_more else None
+    else:
+        next_cursor = key(rows[-1]) if rows and has_more else None
+        prev_cursor = key(rows[0]) if rows and position is not None else None
+    return Page(rows, next_cursor, prev_cursor, page_size)
@@ -0,0 +1,299 @@
+"""
+Opt-in request and SQL profiling for the portal (PORTAL_PROFILING=True).
+
+When enabled, app.py times every request and swaps the pool's connection
+class for ProfiledConnection, which records each statement a request runs:
+its text, the time spent executing it and fetching its rows, and the row
+count. Per route and per statement the numbers are kept in fixed-bucket
+histograms; the first time a statement is slower than PROFILING_SLOW_QUERY_MS
+its EXPLAIN QUERY PLAN is captured. /debug/perf shows the hottest routes and
+statements, /debug/metrics exposes the same in the Prometheus text format.
+
+Only statements run on a request's thread are recorded, so background work
+(the outbox worker) is never slowed down. Streamed responses are timed up to
+the moment streaming starts.
+"""
+import hashlib
+import os
+import re
+import threading
+import time
+
+from shared.database import PooledConnection
+from shared.metrics import LatencyHistogram, metric_header, metric_line, histogram_lines
+
+SLOW_QUERY_MS = float(os.getenv('PROFILING_SLOW_QUERY_MS', '50'))  # statements slower than this get their plan captured
+MAX_TRACKED_QUERIES = 1000  # distinct statements; the rest are counted together as "(other)"
+
+# Statements EXPLAIN QUERY PLAN can describe
+_EXPLAINABLE = ('SELECT', 'WITH', 'INSERT', 'UPDATE', 'DELETE', 'REPLACE')
+# "?, ?, ?" placeholder lists of any length count as one statement
+_PLACEHOLDER_LIST = re.compile(r'\?(?:\s*,\s*\?)+')
+
+
+def normalize_sql(sql):
+    """Statement text with whitespace collapsed, used to group executions of the same query."""
+    return _PLACEHOLDER_LIST.sub('?, ...', ' '.join(sql.split()))
+
+
+class QueryStats:
+    """Accumulated executions of one distinct statement."""
+
+    def __init__(self, sql):
+        self.sql = sql
+        self.query_id = hashlib.sha1(sql.encode()).hexdigest()[:10]
+        self.histogram = LatencyHistogram()
+        self.rows = 0
+        self.plan = None  # EXPLAIN QUERY PLAN of a slow execution
+
+    def snapshot(self):
+        return {
+            'query_id': self.query_id,
+            'sql': self.sql,
+            'count': self.histogram.count,
+            'total_ms': round(self.histogram.total * 1000, 2),
+            'avg_ms': round(self.histogram.total * 1000 / self.histogram.count, 3) if self.histogram.count else 0,
+            'p95_ms': round(self.histogram.percentile(0.95) * 1000, 2) if self.histogram.count else None,
+            'max_ms': round(self.histogram.max * 1000, 2),
+            'rows': self.rows,
+            'plan': self.plan,
+        }
+
+
+class RouteStats:
+    """Accumulated requests of one route (method and URL rule)."""
+
+    def __init__(self, method, rule):
+        self.method = method
+        self.rule = rule
+        self.histogram = LatencyHistogram()
+        self.db_seconds = 0.0
+        self.queries = 0
+
+    def snapshot(self):
+        count = self.histogram.count
+        return {
+            'method': self.method,
+            'route': self.rule,
+            'count': count,
+            'errors': self.histogram.errors,
+            'total_ms': round(self.histogram.total * 1000, 2),
+            'avg_ms': round(self.histogram.total * 1000 / count, 2) if count else 0,
+            'p95_ms': round(self.histogram.percentile(0.95) * 1000, 2) if count else None,
+            'max_ms': round(self.histogram.max * 1000, 2),
+            'avg_db_ms': round(self.db_seconds * 1000 / count, 2) if count else 0,
+            'avg_queries': round(self.queries / count, 1) if count else 0,
+        }
+
+
+class Profiler:
+    """Collects per-request statement records and aggregates them by route and by statement."""
+
+    def __init__(self, slow_query_seconds=SLOW_QUERY_MS / 1000):
+        self.slow_query_seconds = slow_query_seconds
+        self.pool = None  # set by app.py; used to run EXPLAIN QUERY PLAN
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._routes = {}
+        self._queries = {}
+        self.started_at = time.time()
+
+    def current_queries(self):
+        """The statement records of the request running on this thread, or None outside a request."""
+        return getattr(self._local, 'queries', None)
+
+    def start_request(self):
+        self._local.queries = []
+
+    def finish_request(self, method, rule, seconds, status):
+        """Adds a finished request to the totals; returns (seconds spent in SQL, number of statements)."""
+        queries = self.current_queries() or []
+        self._local.queries = None
+        db_seconds = sum(record[2] for record in queries)
+        slow = []
+        with self._lock:
+            route = self._routes.get((method, rule))
+            if route is None:
+                route = self._routes[(method, rule)] = RouteStats(method, rule)
+            route.histogram.observe(seconds, error=status >= 500)
+            route.db_seconds += db_seconds
+            route.queries += len(queries)
+            for sql, params, query_seconds, rows in queries:
+                stats = self._query_stats(sql)
+                stats.histogram.observe(query_seconds)
+                stats.rows += rows
+                if query_seconds >= self.slow_query_seconds and stats.plan is None and params is not None:
+                    slow.append((stats, sql, params))
+        for stats, sql, params in slow:
+            stats.plan = self.explain(sql, params)
+        return db_seconds, len(queries)
+
+    def discard_request(self):
+        """Drops the records of a request that never finished (e.g. the client went away)."""
+        self._local.queries = None
+
+    def _query_stats(self, sql):
+        """QueryStats for a statement; call with the lock held."""
+        key = normalize_sql(sql)
+        stats = self._queries.get(key)
+        if stats is None:
+            if len(self._queries) >= MAX_TRACKED_QUERIES:
+                key = '(other)'
+                stats = self._queries.get(key)
+            if stats is None:
+                stats = self._queries[key] = QueryStats(key)
+        return stats
+
+    def explain(self, sql, params):
+        """EXPLAIN QUERY PLAN of a statement as indented lines, or None if it can't be explained."""
+        if self.pool is None or not sql.lstrip().upper().startswith(_EXPLAINABLE):
+            return None
+        try:
+            with self.pool.connection() as conn:
+                rows = conn.raw.execute(f'EXPLAIN QUERY PLAN {sql}', params).fetchall()
+        except Exception as e:
+            return [f'(could not explain: {e})']
+        depth = {0: -1}
+        lines = []
+        for node_id, parent, _, detail in rows:
+            depth[node_id] = depth.get(parent, -1) + 1
+            lines.append('  ' * depth[node_id] + detail)
+        return lines
+
+    def snapshot(self, limit=25):
+        """Hottest routes and statements by total time."""
+        with self._lock:
+            routes = [route.snapshot() for route in self._routes.values()]
+            queries = [stats.snapshot() for stats in self._queries.values()]
+        routes.sort(key=lambda r: r['total_ms'], reverse=True)
+        queries.sort(key=lambda q: q['total_ms'], reverse=True)
+        return {
+            'since': self.started_at,
+            'routes': routes[:limit],
+            'queries': queries[:limit],
+            'tracked_queries': len(queries),
+        }
+
+    def reset(self):
+        with self._lock:
+            self._routes.clear()
+            self._queries.clear()
+            self.started_at = time.time()
+
+    def prometheus(self):
+        """All route and statement metrics in the Prometheus text exposition format."""
+        with self._lock:
+            routes = list(self._routes.values())
+            queries = list(self._queries.values())
+            lines = metric_header('portal_request_duration_seconds', 'histogram', 'Portal request latency by route.')
+            for route in routes:
+                lines += histogram_lines('portal_request_duration_seconds', route.histogram,
+                                         {'method': route.method, 'route': route.rule})
+            lines += metric_header('portal_request_errors_total', 'counter', 'Portal requests answered with a 5xx.')
+            lines += [metric_line('portal_request_errors_total', route.histogram.errors,
+                                  {'method': route.method, 'route': route.rule}) for route in routes]
+            lines += metric_header('portal_request_db_seconds_total', 'counter', 'Time spent in SQL by route.')
+            lines += [metric_line('portal_request_db_seconds_total', round(route.db_seconds, 6),
+                                  {'method': route.method, 'route': route.rule}) for route in routes]
+            lines += metric_header('portal_request_queries_total', 'counter', 'SQL statements run by route.')
+            lines += [metric_line('portal_request_queries_total', route.queries,
+                                  {'method': route.method, 'route': route.rule}) for route in routes]
+            lines += metric_header('portal_sql_duration_seconds', 'histogram',
+                                   'SQL statement latency (execute and fetch) by statement; see /debug/perf for the text.')
+            for stats in queries:
+                lines += histogram_lines('portal_sql_duration_seconds', stats.histogram, {'query_id': stats.query_id})
+            lines += metric_header('portal_sql_rows_total', 'counter', 'Rows returned or changed by statement.')
+            lines += [metric_line('portal_sql_rows_total', stats.rows, {'query_id': stats.query_id})
+                      for stats in queries]
+        if self.pool is not None:
+            pool_stats = self.pool.stats()
+            for key in ('in_use', 'idle', 'open'):
+                lines += metric_header(f'portal_db_pool_{key}', 'gauge', f'Pooled database connections ({key}).')
+                lines.append(metric_line(f'portal_db_pool_{key}', pool_stats[key]))
+            for key in ('checkouts', 'waits', 'timeouts', 'lock_retries'):
+                lines += metric_header(f'portal_db_pool_{key}_total', 'counter', f'Connection pool {key}.')
+                lines.append(metric_line(f'portal_db_pool_{key}_total', pool_stats[key]))
+        return '\n'.join(lines) + '\n'
+
+
+profiler = Profiler()
+
+
+class ProfiledCursor:
+    """sqlite3 cursor wrapper that times execute and fetch calls into the current request's records."""
+
+    def __init__(self, cursor, queries):
+        self._cursor = cursor
+        self._queries = queries
+        self._record = None  # [sql, params, seconds, rows] of the last statement
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def _run(self, sql, params, call):
+        self._record = record = [sql, params, 0.0, 0]
+        self._queries.append(record)
+        started = time.perf_counter()
+        call()
+        record[2] += time.perf_counter() - started
+        if self._cursor.rowcount > 0:
+            record[3] = self._cursor.rowcount  # rows changed by INSERT/UPDATE/DELETE
+        return self
+
+    def execute(self, sql, params=()):
+        return self._run(sql, params, lambda: self._cursor.execute(sql, params))
+
+    def executemany(self, sql, seq_of_params):
+        # No single parameter set to EXPLAIN with
+        return self._run(sql, None, lambda: self._cursor.executemany(sql, seq_of_params))
+
+    def _fetched(self, started, rows):
+        if self._record is not None:
+            self._record[2] += time.perf_counter() - started
+            self._record[3] += rows
+
+    def fetchone(self):
+        started = time.perf_counter()
+        row = self._cursor.fetchone()
+        self._fetched(started, row is not None)
+        return row
+
+    def fetchmany(self, size=None):
+        started = time.perf_counter()
+        rows = self._cursor.fetchmany(size) if size is not None else self._cursor.fetchmany()
+        self._fetched(started, len(rows))
+        return rows
+
+    def fetchall(self):
+        started = time.perf_counter()
+        rows = self._cursor.fetchall()
+        self._fetched(started, len(rows))
+        return rows
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        started = time.perf_counter()
+        try:
+            row = next(self._cursor)
+        except StopIteration:
+            self._fetched(started, 0)
+            raise
+        self._fetched(started, 1)
+        return row
+
+
+class ProfiledConnection(PooledConnection):
+    """Pooled connection whose statements are recorded when run on a request's thread."""
+
+    def cursor(self, *args, **kwargs):
+        cursor = self._conn.cursor(*args, **kwargs)
+        queries = profiler.current_queries()
+        return ProfiledCursor(cursor, queries) if queries is not None else cursor
+
+    def execute(self, sql, params=()):
+        return self.cursor().execute(sql, params)
+
+    def executemany(self, sql, seq_of_params):
+        return self.cursor().executemany(sql, seq_of_params)
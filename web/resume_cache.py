@@ -0,0 +1,122 @@
+"""
+On-disk cache for resume files downloaded from Telegram.
+
+Files are stored under a name derived from the SHA-256 of their Telegram
+file_id, next to a small JSON sidecar with the filename and MIME type, so a
+repeat download is served straight from local disk. The cache is bounded in
+total size; when it grows past the limit the least recently served files are
+deleted first (last access is tracked through the file's mtime). The total
+is kept as a running count, so the directory is only scanned when a newly
+stored file pushes it past the limit, and each scan frees some headroom.
+"""
+import hashlib
+import json
+import os
+import tempfile
+import threading
+
+# Cache location and size limit, overridable from env/.env
+RESUME_CACHE_DIR = os.getenv('RESUME_CACHE_DIR', os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), '..', 'cache', 'resumes'))
+RESUME_CACHE_MAX_BYTES = int(os.getenv('RESUME_CACHE_MAX_BYTES', str(512 * 1024 * 1024)))
+
+CHUNK_SIZE = 64 * 1024
+EVICT_TO = 0.9  # eviction frees space down to this share of the limit, so the next scan is a while off
+
+
+class ResumeCache:
+    """Size-bounded LRU cache of resume files on local disk, keyed by Telegram file_id."""
+
+    def __init__(self, directory=RESUME_CACHE_DIR, max_bytes=RESUME_CACHE_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._evict_lock = threading.Lock()
+        self._total = None  # bytes of cached files, counted on first use
+        os.makedirs(self.directory, exist_ok=True)
+
+    def _paths(self, file_id):
+        """Returns (data path, metadata path) for a file_id."""
+        key = hashlib.sha256(file_id.encode()).hexdigest()
+        base = os.path.join(self.directory, key[:2], key)
+        return base, base + '.json'
+
+    def lookup(self, file_id):
+        """Returns (path, metadata) for a cached file and marks it as recently used, or None on a miss."""
+        data_path, meta_path = self._paths(file_id)
+        try:
+            with open(meta_path, encoding='utf-8') as f:
+                metadata = json.load(f)
+            os.utime(data_path)  # bump last-access time for LRU eviction
+        except (OSError, ValueError):
+            return None
+        return data_path, metadata
+
+    def stream_and_store(self, file_id, chunks, metadata):
+        """
+        Generator that yields each chunk to the caller while writing it to the cache.
+        The file only becomes visible in the cache once the whole download succeeded.
+        """
+        data_path, meta_path = self._paths(file_id)
+        os.makedirs(os.path.dirname(data_path), exist_ok=True)
+        size = 0
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(data_path), suffix='.part')
+        completed = False
+        try:
+            with os.fdopen(fd, 'wb') as tmp:
+                for chunk in chunks:
+                    if chunk:
+                        tmp.write(chunk)
+                        size += len(chunk)
+                        yield chunk
+            with open(meta_path, 'w', encoding='utf-8') as f:
+                json.dump(metadata, f)
+            try:
+                replaced = os.path.getsize(data_path)  # a concurrent download of the same file got there first
+            except OSError:
+                replaced = 0
+            os.replace(tmp_path, data_path)
+            completed = True
+        finally:
+            if not completed:
+                try:
+                    os.remove(tmp_path)
+                except OSError:
+                    pass
+        self._stored(size - replaced)
+
+    def _stored(self, added_bytes):
+        """Counts a newly stored file and evicts only once the cache has grown past its limit."""
+        with self._evict_lock:
+            if self._total is None:
+                self._total = self._evict(self.max_bytes)  # first insert since startup: count what is on disk
+                return
+            self._total += added_bytes
+            if self._total > self.max_bytes:
+                self._total = self._evict(self.max_bytes * EVICT_TO)
+
+    def _evict(self, target_bytes):
+        """Scans the cache, deletes least recently used files until it fits in target_bytes; returns the size left."""
+        entries = []
+        total = 0
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if name.endswith(('.json', '.part')):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+                total += stat.st_size
+        entries.sort()  # oldest access first
+        for _, size, path in entries:
+            if total <= target_bytes:
+                break
+            for victim in (path, path + '.json'):
+                try:
+                    os.remove(victim)
+                except OSError:
+                    pass
+            total -= size
+        return total
@@ -0,0 +1,106 @@
+"""
+Telegram Bot API client used by every portal route that talks to Telegram.
+
+All calls go through one keep-alive requests.Session, so repeated calls reuse
+pooled TLS connections to the API instead of opening a new one each time.
+Every call has (connect, read) timeouts. Connection failures are retried, and
+so are 5xx responses to idempotent GETs; a POST such as sendMessage is never
+re-sent once Telegram may have received it. Latency is recorded per endpoint
+in fixed-bucket histograms.
+
+The API base URL comes from TELEGRAM_API_URL, so the portal can be pointed at
+a local stub server.
+"""
+import os
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from shared.metrics import LatencyHistogram
+
+TELEGRAM_API_URL = os.getenv('TELEGRAM_API_URL', 'https://api.telegram.org').rstrip('/')
+# (connect, read) timeouts in seconds, so a slow response can't hold a portal worker forever
+TELEGRAM_TIMEOUT = (float(os.getenv('TELEGRAM_CONNECT_TIMEOUT', '5')), float(os.getenv('TELEGRAM_READ_TIMEOUT', '30')))
+TELEGRAM_RETRIES = int(os.getenv('TELEGRAM_RETRIES', '3'))  # retries of failed connections and 5xx GETs
+TELEGRAM_POOL_SIZE = int(os.getenv('TELEGRAM_POOL_SIZE', '10'))  # keep-alive connections kept open per host
+
+# Upper bounds (seconds) of the latency histogram buckets; the last bucket catches everything slower
+LATENCY_BUCKETS = (0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, float('inf'))
+
+
+class TelegramClient:
+    """Pooled, timed and instrumented access to the Bot API for one bot token."""
+
+    def __init__(self, token, base_url=TELEGRAM_API_URL, timeout=TELEGRAM_TIMEOUT,
+                 retries=TELEGRAM_RETRIES, pool_size=TELEGRAM_POOL_SIZE):
+        self.token = token
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        retry = Retry(total=retries, connect=retries, read=retries, status=retries,
+                      allowed_methods=frozenset({'GET'}),  # retrying a POST could deliver a message twice
+                      status_forcelist=(500, 502, 503, 504),
+                      backoff_factor=0.5, raise_on_status=False)
+        adapter = HTTPAdapter(pool_connections=2, pool_maxsize=pool_size, max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self._histograms = {}
+        self._lock = threading.Lock()
+
+    def _timed(self, endpoint, send):
+        """Runs send() and records its latency (time to response headers) under endpoint."""
+        started = time.perf_counter()
+        try:
+            response = send()
+        except requests.exceptions.RequestException:
+            self._observe(endpoint, time.perf_counter() - started, error=True)
+            raise
+        self._observe(endpoint, time.perf_counter() - started, error=not response.ok)
+        return response
+
+    def _observe(self, endpoint, seconds, error):
+        """Adds one call to endpoint's histogram."""
+        with self._lock:
+            histogram = self._histograms.get(endpoint)
+            if histogram is None:
+                histogram = self._histograms[endpoint] = LatencyHistogram(LATENCY_BUCKETS)
+            histogram.observe(seconds, error)
+
+    def call(self, method, params=None, http_method='POST'):
+        """Calls Bot API `method` and returns the raw response (HTTP errors are not raised)."""
+        url = f"{self.base_url}/bot{self.token}/{method}"
+        if http_method == 'GET':
+            return self._timed(method, lambda: self.session.get(url, params=params, timeout=self.timeout))
+        return self._timed(method, lambda: self.session.post(url, json=params, timeout=self.timeout))
+
+    def send_message(self, chat_id, text, parse_mode='Markdown'):
+        """sendMessage; returns the raw response so callers can inspect 429 retry_after etc."""
+        payload = {'chat_id': chat_id, 'text': text}
+        if parse_mode:
+            payload['parse_mode'] = parse_mode
+        return self.call('sendMessage', payload)
+
+    def get_file(self, file_id):
+        """getFile; returns the File object (with file_path), or None. Raises for HTTP errors."""
+        response = self.call('getFile', {'file_id': file_id}, http_method='GET')
+        response.raise_for_status()
+        return response.json().get('result')
+
+    def download_file(self, file_path):
+        """Opens a streamed download of a file returned by getFile. Raises for HTTP errors; close() the response."""
+        url = f"{self.base_url}/file/bot{self.token}/{file_path}"
+        response = self._timed('file_download', lambda: self.session.get(url, stream=True, timeout=self.timeout))
+        response.raise_for_status()
+        return response
+
+    def stats(self):
+        """Latency histogram and error count per endpoint."""
+        with self._lock:
+            return {endpoint: histogram.snapshot() for endpoint, histogram in self._histograms.items()}
+
+    def close(self):
+        """Closes the pooled connections."""
+        self.session.close()